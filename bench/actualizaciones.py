@@ -0,0 +1,129 @@
+"""Bytes y controles que la app envía a la interfaz en cada acción habitual.
+
+Cada corrida ejecuta main.main en un proceso nuevo sobre una página Flet sin ventana
+(ver bench.primer_pintado) y recorre las mismas acciones: entrar a una empresa, vender
+desde el Resumen, ir y volver entre pestañas, cambiar el periodo de Contabilidad y
+cambiar de empresa. Por acción informa los page.update() enviados, los bytes del JSON
+de sus comandos y los controles agregados o modificados. Con --antes REV mide también
+el main.py de esa revisión de git sobre la misma base, para comparar.
+Uso: python -m bench.actualizaciones [--antes HEAD~1] [--movimientos 20000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.generador import generar_base
+
+PREFIJO = "ACTUALIZACIONES "  # Línea del proceso hijo con el resultado en JSON
+
+
+def esperar_quietud(conexion, limite=60):
+    """Espera a que terminen las cargas en segundo plano y no haya envíos nuevos"""
+    fin = time.perf_counter() + limite
+    while time.perf_counter() < fin:
+        enviados = len(conexion.envios)
+        if threading.active_count() == 1:
+            time.sleep(0.05)
+            if threading.active_count() == 1 and len(conexion.envios) == enviados:
+                return
+        time.sleep(0.005)
+    raise TimeoutError("La interfaz no terminó de actualizarse")
+
+
+def hijo(ruta, carpeta_main):
+    """Recorre las acciones en este proceso e imprime lo enviado por cada una"""
+    os.environ["JEMPRESSA_DB"] = ruta
+    if carpeta_main:
+        sys.path.insert(0, carpeta_main)
+    import main
+    import flet as ft
+    from bench.primer_pintado import ConexionRegistro, Page, click, controles
+
+    conexion = ConexionRegistro(contar=True)
+    page = Page(conexion, "bench", asyncio.new_event_loop())
+    main.main(page)
+    empresas = [c.text for c in controles(page) if isinstance(c, ft.ElevatedButton)][:2]
+
+    def cambiar_periodo():
+        dropdown = next(c for c in controles(page) if isinstance(c, ft.Dropdown) and c.label == "Periodo")
+        dropdown.value = dropdown.options[1].key  # Mes anterior
+        dropdown.on_change(ft.ControlEvent(dropdown.uid, "change", dropdown.value, dropdown, page))
+
+    acciones = [
+        ("entrar a una empresa", lambda: click(page, empresas[0])),
+        (None, lambda: click(page, "Nueva Venta")),
+        ("confirmar una venta", lambda: click(page, "Confirmar Venta")),
+        ("ir a Inventario (1ª vez)", lambda: click(page, "📦 Inventario")),
+        ("volver al Resumen", lambda: click(page, "📊 Resumen")),
+        ("volver a Inventario", lambda: click(page, "📦 Inventario")),
+        (None, lambda: click(page, "🧮 Contabilidad")),
+        ("cambiar el periodo del SII", cambiar_periodo),
+        (None, lambda: click(page, "🔙 Cambiar")),
+        ("cambiar de empresa", lambda: click(page, empresas[1])),
+    ]
+    resultados = {}
+    for nombre, accion in acciones:
+        envios, enviados, controles_enviados = len(conexion.envios), conexion.bytes, conexion.controles
+        accion()
+        esperar_quietud(conexion)
+        if nombre:
+            resultados[nombre] = {"envios": len(conexion.envios) - envios, "bytes": conexion.bytes - enviados,
+                                  "controles": conexion.controles - controles_enviados}
+    print(PREFIJO + json.dumps(resultados), flush=True)
+
+
+def correr(ruta, carpeta_main=None):
+    comando = [sys.executable, "-m", "bench.actualizaciones", "--hijo", ruta]
+    if carpeta_main:
+        comando += ["--main", carpeta_main]
+    salida = subprocess.run(comando, capture_output=True, text=True, check=True).stdout
+    linea = next(l for l in salida.splitlines() if l.startswith(PREFIJO))
+    return json.loads(linea[len(PREFIJO):])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--antes", help="Revisión de git cuyo main.py se mide también (p. ej. HEAD~1)")
+    parser.add_argument("--movimientos", type=int, default=20000)
+    parser.add_argument("--productos", type=int, default=1000)
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    parser.add_argument("--main", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.hijo:
+        hijo(args.hijo, args.main)
+        return 0
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "actualizaciones.db")
+    generar_base(ruta, empresas=3, productos=args.productos, movimientos=args.movimientos).close()
+    corridas = {}
+    if args.antes:
+        carpeta_antes = os.path.join(carpeta, "antes")
+        os.mkdir(carpeta_antes)
+        with open(os.path.join(carpeta_antes, "main.py"), "wb") as f:
+            f.write(subprocess.run(["git", "show", f"{args.antes}:main.py"], capture_output=True, check=True).stdout)
+        shutil.copy(ruta, ruta + ".antes")
+        corridas[args.antes] = correr(ruta + ".antes", carpeta_antes)
+    corridas["actual"] = correr(ruta)
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"{'acción':<28}" + "".join(f"{nombre:>36}" for nombre in corridas))
+    print(f"{'':<28}" + f"{'envíos':>10}{'bytes':>14}{'controles':>12}" * len(corridas))
+    for accion in corridas["actual"]:
+        fila = ""
+        for resultados in corridas.values():
+            r = resultados.get(accion)
+            fila += f"{r['envios']:>10}{r['bytes']:>14,}{r['controles']:>12,}" if r else f"{'-':>36}"
+        print(f"{accion:<28}{fila}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
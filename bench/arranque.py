@@ -0,0 +1,98 @@
+"""Arranque en frío de la app: importación, apertura de la base y primer pintado.
+
+Cada medición corre en un proceso nuevo (importaciones en frío) que ejecuta main.main
+sobre una página Flet sin ventana, como bench.primer_pintado, y luego entra a la
+primera empresa. Se mide con una base nueva y con una ya creada al día, y se informa
+la mediana de cada etapa.
+Uso: python -m bench.arranque [--repeticiones 10] [--movimientos 100000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.generador import generar_base
+
+ETAPAS = ["importar", "abrir_base", "primer_pintado", "main_total", "interfaz_principal"]
+PREFIJO = "ARRANQUE "  # Línea del proceso hijo con el resultado en JSON
+
+
+def hijo(ruta):
+    """Un arranque completo en este proceso; imprime sus etapas en segundos"""
+    os.environ["JEMPRESSA_DB"] = ruta
+    t0 = time.perf_counter()
+    import main
+    importar = time.perf_counter() - t0
+
+    from bench.primer_pintado import ConexionRegistro, Page, click, controles
+    import flet as ft
+    conexion = ConexionRegistro()
+    page = Page(conexion, "bench", asyncio.new_event_loop())
+    t0 = time.perf_counter()
+    main.main(page)
+    main_total = time.perf_counter() - t0
+
+    empresa = next(c.text for c in controles(page) if isinstance(c, ft.ElevatedButton))
+    t0 = time.perf_counter()
+    click(page, empresa)
+    interfaz = time.perf_counter() - t0
+
+    etapas = dict(getattr(main, "ARRANQUE", {}))
+    etapas.update(importar=importar, main_total=main_total, interfaz_principal=interfaz)
+    print(PREFIJO + json.dumps(etapas), flush=True)
+
+
+def medir(ruta, repeticiones, preparar=None):
+    resultados = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        salida = subprocess.run([sys.executable, "-m", "bench.arranque", "--hijo", ruta],
+                                capture_output=True, text=True, check=True).stdout
+        linea = next(l for l in salida.splitlines() if l.startswith(PREFIJO))
+        resultados.append(json.loads(linea[len(PREFIJO):]))
+    return {etapa: statistics.median(r[etapa] for r in resultados) for etapa in ETAPAS if etapa in resultados[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--movimientos", type=int, default=100000)
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.hijo:
+        hijo(args.hijo)
+        return 0
+
+    carpeta = tempfile.mkdtemp()
+    nueva = os.path.join(carpeta, "nueva.db")
+    existente = os.path.join(carpeta, "existente.db")
+    generar_base(existente, empresas=3, productos=max(100, args.movimientos // 100), movimientos=args.movimientos).close()
+
+    def borrar_nueva():
+        for sufijo in ("", "-wal", "-shm"):
+            if os.path.exists(nueva + sufijo):
+                os.remove(nueva + sufijo)
+
+    casos = {
+        "base nueva": medir(nueva, args.repeticiones, borrar_nueva),
+        f"base al día ({args.movimientos:,} mov.)": medir(existente, args.repeticiones),
+    }
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"Mediana de {args.repeticiones} arranques en frío (ms):")
+    print(f"{'etapa':<22}" + "".join(f"{caso:>28}" for caso in casos))
+    for etapa in ETAPAS:
+        print(f"{etapa:<22}" + "".join(f"{casos[caso][etapa] * 1000:>28.1f}" if etapa in casos[caso] else f"{'-':>28}"
+                                       for caso in casos))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
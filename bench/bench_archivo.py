@@ -0,0 +1,132 @@
+"""Archivo de años cerrados: tamaño de la base y latencias antes y después de archivar.
+
+Genera una base con varios años de historia, mide el tamaño del archivo, las consultas del
+Resumen y las que recorren movimientos, archiva todos los años cerrados (con VACUUM al final)
+y vuelve a medir. Verifica que resumen, reportes, stock, saldos e historial den lo mismo
+que antes, leyendo los años archivados de sus archivos.
+Uso: python -m bench.bench_archivo [--movimientos 1000000] [--anios 4]
+"""
+import argparse
+import datetime
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from database import Database
+from bench.generador import generar_base
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def tamano_mb(ruta):
+    return sum(os.path.getsize(r) for r in (ruta, ruta + "-wal") if os.path.exists(r)) / 1e6
+
+
+def recorrer(db, empresa_id, limite=50):
+    """Claves (fecha, id) de todas las páginas del historial"""
+    claves, antes_de = [], None
+    while True:
+        filas = db.pagina_movimientos(empresa_id, antes_de, limite)
+        claves += [(m[2], m[0]) for m in filas]
+        if len(filas) < limite:
+            return claves
+        antes_de = claves[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=1000000)
+    parser.add_argument("--anios", type=int, default=4, help="Años de historia hasta hoy")
+    parser.add_argument("--empresas", type=int, default=3)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    hoy = datetime.date.today()
+    mes = hoy.strftime("%Y-%m")
+    cerrado = str(hoy.year - 1)
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "archivo.db")
+    try:
+        print(f"Generando {args.movimientos:,} movimientos en {args.anios} años ...")
+        generar_base(ruta, empresas=args.empresas, movimientos=args.movimientos, dias=365 * args.anios).close()
+        db = Database(ruta)
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        empresas = [e[0] for e in db.obtener_empresas()][:args.empresas]
+        empresa = empresas[0]
+
+        rapidas = {
+            "obtener_resumen": lambda: db.obtener_resumen(empresa),
+            "ultimos_meses": lambda: db.ultimos_meses(empresa),
+            "valuacion": lambda: db.valuacion(empresa),
+            f"reporte_sii {mes}": lambda: db.reporte_sii(empresa, mes),
+            "historial (página más nueva)": lambda: db.pagina_movimientos(empresa),
+        }
+        lentas = {
+            f"reporte_sii {cerrado}": lambda: db.reporte_sii(empresa, cerrado),
+            "reporte_sii (todo)": lambda: db.reporte_sii(empresa),
+            "verificar_saldos": db.verificar_saldos,
+            "conciliar_stock": db.conciliar_stock,
+        }
+
+        def foto():
+            return {
+                "resumen": [db.obtener_resumen(e) for e in empresas],
+                "meses": [db.ultimos_meses(e, 12 * args.anios + 1) for e in empresas],
+                "valuacion": [db.valuacion(e) for e in empresas],
+                "sii": [db.reporte_sii(e, p) for e in empresas for p in (None, cerrado, f"{cerrado}-06", mes)],
+                "consolidado": db.reporte_consolidado(),
+                "saldos": db.verificar_saldos(),
+                "stock": db.conciliar_stock(),
+                "historial": recorrer(db, empresa),
+                "libro": sorted(m[0] for m in db.iterar_movimientos(empresa, f"{cerrado}-12-01", f"{hoy.year}-01-31")),
+            }
+
+        def medir_todo():
+            return {nombre: medir(f, args.repeticiones) for nombre, f in rapidas.items()} | \
+                   {nombre: medir(f, max(args.repeticiones // 10, 1)) for nombre, f in lentas.items()}
+
+        antes = foto()
+        mb_antes = tamano_mb(ruta)
+        t_antes = medir_todo()
+
+        print("Archivando:")
+        anios = range(hoy.year - args.anios, hoy.year)
+        for anio in anios:
+            t0 = time.perf_counter()
+            movidos = db.archivar_anio(anio, compactar=anio == anios[-1])
+            print(f"  {anio}: {movidos:>10,} movimientos en {time.perf_counter() - t0:.2f} s")
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        mb_despues = tamano_mb(ruta)
+        mb_archivos = sum(os.path.getsize(r) for _, r, _ in db.anios_archivados()) / 1e6
+        t_despues = medir_todo()
+        despues = foto()
+
+        print(f"Base activa: {mb_antes:.1f} MB -> {mb_despues:.1f} MB (archivos de años cerrados: {mb_archivos:.1f} MB)")
+        print(f"{'mediana ms':<32}{'antes':>10}{'después':>10}")
+        for nombre in t_antes:
+            print(f"  {nombre:<30}{t_antes[nombre]:>10.3f}{t_despues[nombre]:>10.3f}")
+
+        distintos = [k for k in antes if antes[k] != despues[k]]
+        db.reconstruir_saldos()
+        if db.verificar_saldos() or db.conciliar_stock() or [db.obtener_resumen(e) for e in empresas] != antes["resumen"]:
+            distintos.append("reconstruir_saldos")
+        db.close()
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    print("✅ Todo coincide con la base antes de archivar" if not distintos else
+          f"⚠️ Difieren: {', '.join(distintos)}")
+    return 0 if not distintos else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Conciliación de stock contra movimientos sobre un libro grande, y costo de rechazar stock negativo.
+
+Genera la base, descuadra a propósito el stock de algunos productos (como una edición
+directa o una caída a mitad de escritura) y mide conciliar_stock: que encuentre
+exactamente esos productos, cuánto tarda y que tras reparar no quede diferencia.
+Luego compara una venta con y sin stock_negativo=False y verifica que la venta
+rechazada no deja rastro.
+Uso: python -m bench.bench_conciliacion [--movimientos 10000000]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from database import BLOQUE_CONCILIACION, Database, StockInsuficiente
+from bench.generador import generar_base
+
+
+def ventas(db, empresa_id, prod_ids, n, semilla):
+    """Latencia mediana (ms) de n compras y ventas alternadas que nunca dejan stock negativo"""
+    rnd = random.Random(semilla)
+    tiempos = []
+    for i in range(n):
+        prod_id = rnd.choice(prod_ids)
+        tipo = "compra" if i % 2 == 0 else "venta"
+        t0 = time.perf_counter()
+        db.registrar_transaccion(empresa_id, tipo, True, prod_id, 1, 1000, "Bench conciliación")
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=10000000)
+    parser.add_argument("--productos", type=int, default=50000)
+    parser.add_argument("--empresas", type=int, default=5)
+    parser.add_argument("--descuadres", type=int, default=100, help="Productos con stock alterado a propósito")
+    parser.add_argument("--bloque", type=int, default=BLOQUE_CONCILIACION)
+    parser.add_argument("--ventas", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "bench_conciliacion.db")
+    print(f"Generando {args.movimientos:,} movimientos ...")
+    generar_base(ruta, args.empresas, args.productos, args.movimientos, costear=False).close()
+    db = Database(ruta)
+    rnd = random.Random(5)
+
+    with db._lectura() as cursor:
+        cursor.execute("SELECT id FROM productos")
+        prod_ids = [fila[0] for fila in cursor.fetchall()]
+    descuadrados = set(rnd.sample(prod_ids, args.descuadres))
+    db.conn.executemany("UPDATE productos SET stock = stock + ? WHERE id = ?",
+                        [(rnd.choice((-1, 1)) * rnd.randint(1, 50), prod_id) for prod_id in descuadrados])
+    db.conn.commit()
+
+    t0 = time.perf_counter()
+    diferencias = db.conciliar_stock(bloque=args.bloque)
+    t_reporte = time.perf_counter() - t0
+    encontrados = {d[1] for d in diferencias} == descuadrados
+
+    t0 = time.perf_counter()
+    db.conciliar_stock(reparar=True, bloque=args.bloque)
+    t_reparar = time.perf_counter() - t0
+    restantes = db.conciliar_stock(bloque=args.bloque)
+
+    print(f"Conciliar {args.movimientos:,} movimientos / {args.productos:,} productos: {t_reporte:.1f}s "
+          f"({args.movimientos / t_reporte:,.0f} movimientos/s); reparar: {t_reparar:.1f}s")
+    print(f"  {len(diferencias)} diferencias de {args.descuadres} descuadres · después de reparar: {len(restantes)}")
+
+    # Rechazo de stock negativo: costo por venta y que la venta rechazada no deje rastro
+    empresa_id = db.obtener_empresas()[0][0]
+    propios = [p[0] for p in db.obtener_productos(empresa_id)][:1000]
+    for prod_id in propios:
+        db.conn.execute("UPDATE productos SET stock = 1000 WHERE id = ?", (prod_id,))
+    db.conn.commit()
+    permitido = ventas(db, empresa_id, propios, args.ventas, 1)
+    db.stock_negativo = False
+    validado = ventas(db, empresa_id, propios, args.ventas, 1)
+    with db._lectura() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM movimientos")
+        antes = cursor.fetchone()[0]
+    stock_antes = db.obtener_producto(empresa_id, propios[0])[3]
+    try:
+        db.registrar_transaccion(empresa_id, "venta", True, propios[0], stock_antes + 1, 1000, "Sin stock")
+        rechazada = False
+    except StockInsuficiente:
+        rechazada = True
+    with db._lectura() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM movimientos")
+        sin_rastro = cursor.fetchone()[0] == antes and db.obtener_producto(empresa_id, propios[0])[3] == stock_antes
+    print(f"Venta/compra p50: {permitido:.3f} ms permitiendo stock negativo · {validado:.3f} ms validándolo")
+
+    db.close()
+    shutil.rmtree(carpeta, ignore_errors=True)
+    ok = encontrados and not restantes and rechazada and sin_rastro
+    print("✅ Descuadres encontrados y reparados; venta sin stock rechazada sin rastro" if ok else
+          f"⚠️ encontrados={encontrados} restantes={len(restantes)} rechazada={rechazada} sin_rastro={sin_rastro}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Reporte consolidado de todas las empresas vs. una empresa y vs. empresa por empresa.
+
+Sobre la misma base compara, para todo el historial, un mes y un año, el reporte de una
+sola empresa (obtener_resumen + reporte_sii + valuacion), el mismo recorrido para cada
+empresa y reporte_consolidado, y verifica que el consolidado coincida con los reportes
+por empresa.
+Uso: python -m bench.bench_consolidado [--empresas 10] [--movimientos 1000000]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from database import Database
+from bench.generador import generar_base
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def por_empresa(db, empresa_id, periodo):
+    """Lo que piden las pestañas Resumen y Contabilidad de una empresa"""
+    ventas, compras = db.obtener_resumen(empresa_id)
+    valuacion = db.valuacion(empresa_id)
+    return ventas, compras, db.reporte_sii(empresa_id, periodo), valuacion[0] if valuacion else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--empresas", type=int, default=10)
+    parser.add_argument("--movimientos", type=int, default=1000000)
+    parser.add_argument("--productos", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "bench_consolidado.db")
+    print(f"Generando {args.empresas} empresas con {args.movimientos:,} movimientos ...")
+    generar_base(ruta, empresas=args.empresas, productos=args.productos, movimientos=args.movimientos).close()
+    db = Database(ruta)
+    empresas = [e[0] for e in db.obtener_empresas()]
+    with db._lectura() as cursor:
+        cursor.execute("SELECT substr(MAX(fecha), 1, 7) FROM movimientos")
+        mes = cursor.fetchone()[0]
+
+    ok = True
+    columnas = ["una empresa", f"{len(empresas)} por separado", "consolidado"]
+    print(f"{'periodo (mediana ms)':<22}" + "".join(f"{c:>18}" for c in columnas))
+    for periodo in (None, mes, mes[:4]):
+        filas, total = db.reporte_consolidado(periodo)
+        for fila in filas:
+            ventas, compras, (v_formal, c_formal, debito, credito), valor = por_empresa(db, fila[0], periodo)
+            ok &= fila[4:] == (v_formal, c_formal, debito, credito, valor)
+            ok &= periodo is not None or fila[2:4] == (ventas, compras)
+
+        tiempos = [
+            medir(lambda: por_empresa(db, empresas[0], periodo), args.repeticiones),
+            medir(lambda: [por_empresa(db, e, periodo) for e in empresas], args.repeticiones),
+            medir(lambda: db.reporte_consolidado(periodo), args.repeticiones),
+        ]
+        print(f"{periodo or 'todo':<22}" + "".join(f"{t:>18.3f}" for t in tiempos))
+
+    db.close()
+    shutil.rmtree(carpeta, ignore_errors=True)
+    print("✅ El consolidado coincide con los reportes por empresa" if ok else
+          "⚠️ El consolidado no coincide con los reportes por empresa")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Costeo FIFO y promedio ponderado sobre 10k productos y 1M movimientos.
+
+Mide cuánto tarda valorizar la historia completa, cuánto agrega el costeo incremental
+a cada venta y a un lote, y la latencia de las consultas que usan el tablero y el
+inventario. Verifica que el estado incremental coincide con rehacer la historia.
+Uso: python -m bench.bench_costeo [--movimientos 1000000] [--productos 10000]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from bench.generador import generar_base
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def foto(db):
+    with db._lectura() as cursor:
+        cursor.execute("SELECT * FROM costos ORDER BY producto_id")
+        costos = cursor.fetchall()
+        cursor.execute("SELECT producto_id, cantidad, monto FROM capas_costo ORDER BY producto_id, id")
+        return costos, cursor.fetchall()
+
+
+def transacciones(db, empresa_id, prod_ids, rnd, n):
+    """Latencias (ms) de n registrar_transaccion al azar"""
+    tiempos = []
+    for _ in range(n):
+        tipo = rnd.choice(("venta", "compra"))
+        t0 = time.perf_counter()
+        db.registrar_transaccion(empresa_id, tipo, True, rnd.choice(prod_ids), rnd.randint(1, 10),
+                                 rnd.randint(500, 5000), "Bench costeo")
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99)]
+
+
+def lote(db, empresa_id, prod_ids, rnd, n):
+    items = [(empresa_id, rnd.choice(("venta", "compra")), True, rnd.choice(prod_ids), rnd.randint(1, 10),
+              rnd.randint(500, 5000), "Bench costeo") for _ in range(n)]
+    t0 = time.perf_counter()
+    exito, _ = db.registrar_transacciones_lote(items)
+    assert exito
+    return (time.perf_counter() - t0) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=1000000)
+    parser.add_argument("--productos", type=int, default=10000)
+    parser.add_argument("--transacciones", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    print(f"Generando {args.productos:,} productos y {args.movimientos:,} movimientos ...")
+    db = generar_base(os.path.join(carpeta, "bench_costeo.db"), empresas=1, productos=args.productos,
+                      movimientos=args.movimientos, proporcion_ventas=0.45)
+    empresa_id = db.obtener_empresas()[0][0]
+    prod_ids = [p[0] for p in db.obtener_productos(empresa_id)]
+    rnd = random.Random(3)
+
+    t0 = time.perf_counter()
+    db.reconstruir_costos()
+    t_historia = time.perf_counter() - t0
+    print(f"Valorizar la historia completa: {t_historia:.1f}s ({args.movimientos / t_historia:,.0f} movimientos/s)")
+
+    con_costeo = transacciones(db, empresa_id, prod_ids, rnd, args.transacciones)
+    lote_con = statistics.median(lote(db, empresa_id, prod_ids, rnd, 500) for _ in range(5))
+
+    consultas = {
+        "valuacion FIFO (tablero)": lambda: db.valuacion(empresa_id, "fifo"),
+        "valuacion promedio": lambda: db.valuacion(empresa_id, "promedio"),
+        "valor de una página (50)": lambda: db.valor_productos(empresa_id, rnd.sample(prod_ids, 50)),
+    }
+    for nombre, consulta in consultas.items():
+        print(f"  {nombre:<28}{medir(consulta, args.repeticiones):>8.2f} ms")
+
+    # El estado incremental debe ser idéntico a rehacer toda la historia
+    incremental = foto(db)
+    db.reconstruir_costos()
+    iguales = incremental == foto(db)
+
+    # Mismas escrituras sin costeo, para ver cuánto agrega
+    db.costos_listos = False
+    sin_costeo = transacciones(db, empresa_id, prod_ids, rnd, args.transacciones)
+    lote_sin = statistics.median(lote(db, empresa_id, prod_ids, rnd, 500) for _ in range(5))
+    db.close()
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"{'escritura':<28}{'sin costeo':>12}{'con costeo':>12}")
+    print(f"{'venta/compra p50 (ms)':<28}{sin_costeo[0]:>12.2f}{con_costeo[0]:>12.2f}")
+    print(f"{'venta/compra p99 (ms)':<28}{sin_costeo[1]:>12.2f}{con_costeo[1]:>12.2f}")
+    print(f"{'lote de 500 (ms)':<28}{lote_sin:>12.1f}{lote_con:>12.1f}")
+    print("✅ Incremental = rehacer la historia" if iguales else "⚠️ El costeo incremental difiere de la historia")
+    return 0 if iguales else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
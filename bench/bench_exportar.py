@@ -0,0 +1,64 @@
+"""Exportación del libro completo bajo un techo fijo de memoria.
+
+La exportación corre en un proceso hijo con RLIMIT_AS = --techo-mb: si el
+historial se materializara en memoria, el proceso fallaría con MemoryError.
+Uso: python -m bench.bench_exportar [--movimientos 5000000] [--techo-mb 256]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bench.generador import generar_base
+
+
+def _exportar_con_techo(ruta_db, salida, techo_mb, cola):
+    resource.setrlimit(resource.RLIMIT_AS, (techo_mb * 1024 * 1024, techo_mb * 1024 * 1024))
+    try:
+        from database import Database
+        import exportador
+        db = Database(ruta_db)
+        r = exportador.exportar_movimientos(db, salida)
+        pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        cola.put(("ok", r.filas, r.segundos, r.bytes, pico_mb))
+    except MemoryError:
+        cola.put(("memoria", 0, 0, 0, 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=5000000)
+    parser.add_argument("--techo-mb", type=int, default=256, help="Límite de memoria virtual del proceso exportador")
+    parser.add_argument("--db", help="Base existente a reutilizar (se genera si no existe)")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = args.db or os.path.join(carpeta, "bench_exportar.db")
+    if not os.path.exists(ruta):
+        print(f"Generando {args.movimientos:,} movimientos en {ruta} ...")
+        t0 = time.perf_counter()
+        generar_base(ruta, empresas=5, productos=20000, movimientos=args.movimientos).close()
+        print(f"  generada en {time.perf_counter() - t0:.0f}s")
+
+    ctx = multiprocessing.get_context("spawn")  # proceso limpio: no hereda la memoria del generador
+    fallo = False
+    for salida in ("libro.csv", "libro.jsonl.gz"):
+        cola = ctx.Queue()
+        proceso = ctx.Process(target=_exportar_con_techo, args=(ruta, os.path.join(carpeta, salida), args.techo_mb, cola))
+        proceso.start()
+        proceso.join()
+        estado, filas, segundos, tamano, pico_mb = cola.get() if not cola.empty() else ("error", 0, 0, 0, 0)
+        if estado != "ok":
+            fallo = True
+            print(f"{salida:<16} ❌ {estado} (código {proceso.exitcode}) con techo de {args.techo_mb} MB")
+            continue
+        print(f"{salida:<16} {filas:>10,} filas en {segundos:6.1f}s · {filas / segundos:>9,.0f} filas/s · "
+              f"{tamano / 1e6:8.1f} MB · memoria pico {pico_mb:.0f} MB (techo {args.techo_mb} MB)")
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
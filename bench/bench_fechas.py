@@ -0,0 +1,163 @@
+"""Tamaño de la base y consultas por rango de fechas, con fecha en texto y con fecha_ts entera.
+
+Genera una base, la lleva al esquema previo a la migración 7 (sin fecha_ts, índice
+por fecha en texto) y mide tamaño y reportes. Luego abre la base con la versión actual,
+rellena fecha_ts por bloques mientras otra conexión sigue vendiendo, y vuelve a medir.
+Uso: python -m bench.bench_fechas [--movimientos 3000000]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from database import BLOQUE_FECHA_TS, INDICES, Database
+from bench.generador import generar_base
+
+
+def mb(ruta):
+    return os.path.getsize(ruta) / 1e6
+
+
+def compactar(ruta):
+    db = Database(ruta)
+    db.conn.execute("VACUUM")
+    db.close()
+
+
+def a_esquema_previo(ruta):
+    """Deja la base como la dejaba la migración 6: fecha solo en texto"""
+    db = Database(ruta)
+    db.conn.execute("DROP INDEX IF EXISTS idx_movimientos_empresa_ts")
+    db.conn.execute(INDICES[0])
+    db.conn.execute("ALTER TABLE movimientos DROP COLUMN fecha_ts")
+    db.conn.execute("DROP TABLE tareas")
+    db.conn.execute("PRAGMA user_version = 6")
+    db.conn.commit()
+    db.conn.execute("VACUUM")
+    db.close()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def medir_consultas(db, empresas, mes, semana, repeticiones):
+    def contar_semana():
+        desde_sql, desde = db._condicion_fecha(">=", semana[0])
+        hasta_sql, hasta = db._condicion_fecha("<", semana[1])
+        with db._lectura() as cursor:
+            cursor.execute(f"SELECT COUNT(*), SUM(monto_total) FROM movimientos WHERE {desde_sql} AND {hasta_sql}",
+                           (desde, hasta))
+            return cursor.fetchone()
+
+    consultas = {
+        f"reporte_sii {mes}": lambda e: db.reporte_sii(e, mes),
+        f"reporte_sii {mes[:4]}": lambda e: db.reporte_sii(e, mes[:4]),
+        "historial de una semana": lambda e: sum(1 for _ in db.iterar_movimientos(e, semana[0], semana[1])),
+    }
+    tiempos = {nombre: statistics.mean(medir(lambda: f(e), repeticiones) for e in empresas)
+               for nombre, f in consultas.items()}
+    tiempos["semana, todas las empresas"] = medir(contar_semana, repeticiones)
+    resultados = [db.reporte_sii(e, mes) for e in empresas] + [contar_semana()]
+    return tiempos, resultados
+
+
+class Vendedor(threading.Thread):
+    """Registra una venta cada pocos milisegundos y anota la peor espera"""
+
+    def __init__(self, db, empresa_id, prod_id):
+        super().__init__(daemon=True)
+        self.db, self.empresa_id, self.prod_id = db, empresa_id, prod_id
+        self.detener = threading.Event()
+        self.ventas = 0
+        self.peor = 0.0
+
+    def run(self):
+        while not self.detener.is_set():
+            t0 = time.perf_counter()
+            self.db.registrar_transaccion(self.empresa_id, "venta", True, self.prod_id, 1, 1000, "Venta durante migración")
+            self.peor = max(self.peor, time.perf_counter() - t0)
+            self.ventas += 1
+            time.sleep(0.005)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=3000000)
+    parser.add_argument("--productos", type=int, default=20000)
+    parser.add_argument("--empresas", type=int, default=5)
+    parser.add_argument("--bloque", type=int, default=BLOQUE_FECHA_TS, help="Filas por transacción del relleno")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "bench_fechas.db")
+    print(f"Generando {args.movimientos:,} movimientos ...")
+    generar_base(ruta, args.empresas, args.productos, args.movimientos, costear=False).close()
+    a_esquema_previo(ruta)
+    mb_antes = mb(ruta)
+
+    # Al abrir se aplica la migración 7 (columna vacía); hasta completarla, los reportes usan el texto
+    t0 = time.perf_counter()
+    db = Database(ruta)
+    t_apertura = time.perf_counter() - t0
+    empresas = [e[0] for e in db.obtener_empresas()][:args.empresas]
+    with db._lectura() as cursor:
+        cursor.execute("SELECT MAX(fecha) FROM movimientos")
+        ultima = cursor.fetchone()[0][:10]
+        cursor.execute("SELECT id FROM productos WHERE empresa_id = ? LIMIT 1", (empresas[0],))
+        prod_id = cursor.fetchone()[0]
+    anio, m = int(ultima[:4]), int(ultima[5:7])
+    mes = f"{anio:04d}-{(m - 2) % 12 + 1:02d}" if m != 1 else f"{anio - 1:04d}-12"  # Mes anterior, completo
+    semana = (f"{mes}-08", f"{mes}-14")
+    antes, resultados_antes = medir_consultas(db, empresas, mes, semana, args.repeticiones)
+
+    bloques = []
+    vendedor = Vendedor(db, empresas[0], prod_id)
+    vendedor.start()
+    t0 = time.perf_counter()
+    ultimo = [t0]
+
+    def progreso(avance, hasta):
+        ahora = time.perf_counter()
+        bloques.append(ahora - ultimo[0])
+        ultimo[0] = ahora
+        print(f"\r  fecha_ts: {avance:,} de {hasta:,}", end="", flush=True)
+
+    db.completar_fecha_ts(bloque=args.bloque, progreso=progreso)
+    t_relleno = time.perf_counter() - t0
+    vendedor.detener.set()
+    vendedor.join()
+    print()
+
+    # Las ventas del vendedor son posteriores a 'mes': los resultados deben coincidir
+    despues, resultados_despues = medir_consultas(db, empresas, mes, semana, args.repeticiones)
+    db.close()
+    compactar(ruta)
+    mb_despues = mb(ruta)
+
+    print(f"Migración 7 al abrir (columna e índice vacío): {t_apertura:.2f}s")
+    print(f"Relleno de fecha_ts: {t_relleno:.1f}s en {len(bloques)} transacciones (peor bloque {max(bloques) * 1000:.0f} ms)")
+    print(f"  {vendedor.ventas:,} ventas en paralelo, peor espera {vendedor.peor * 1000:.0f} ms")
+    print(f"Tamaño del archivo: {mb_antes:,.1f} MB → {mb_despues:,.1f} MB")
+    print(f"{'consulta':<28}{'texto (ms)':>12}{'fecha_ts (ms)':>15}{'mejora':>9}")
+    for nombre in antes:
+        mejora = antes[nombre] / despues[nombre] if despues[nombre] else float("inf")
+        print(f"{nombre:<28}{antes[nombre]:>12.2f}{despues[nombre]:>15.2f}{mejora:>8.1f}x")
+    iguales = resultados_antes == resultados_despues
+    print("✅ Mismos resultados con ambas fechas" if iguales else "⚠️ Los resultados difieren")
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return 0 if iguales else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Historial de movimientos paginado por clave (fecha, id) sobre bases de distintos tamaños.
+
+Por tamaño mide la página más nueva (sin filtros, por tipo, por producto y por rango de
+fechas), una página profunda alcanzada por clave frente a la misma con OFFSET, y la carga
+ingenua del historial completo de la empresa. Verifica que recorrer todas las páginas
+entregue cada movimiento una vez y en orden.
+Uso: python -m bench.bench_historial [--tamanos 100,100000,1000000]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from database import Database
+from bench.generador import generar_base
+
+LIMITE = 50
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def pagina_offset(db, empresa_id, offset):
+    """La misma página con LIMIT/OFFSET: SQLite recorre y descarta las filas anteriores"""
+    with db._lectura() as cursor:
+        cursor.execute("SELECT id FROM movimientos WHERE empresa_id = ? ORDER BY fecha DESC, id DESC LIMIT ? OFFSET ?",
+                       (empresa_id, LIMITE, offset))
+        return cursor.fetchall()
+
+
+def recorrer(db, empresa_id, **filtros):
+    """Todas las páginas; devuelve las claves (fecha, id) en el orden entregado"""
+    claves, antes_de = [], None
+    while True:
+        filas = db.pagina_movimientos(empresa_id, antes_de, LIMITE, **filtros)
+        claves += [(m[2], m[0]) for m in filas]
+        if len(filas) < LIMITE:
+            return claves
+        antes_de = claves[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanos", default="100,100000,1000000", help="Movimientos de cada base, separados por coma")
+    parser.add_argument("--productos", type=int, default=1000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--profundidad", type=int, default=1000, help="Página profunda (número de página)")
+    parser.add_argument("--max-lista", type=int, default=1000000,
+                        help="Tamaño máximo en que se mide cargar el historial completo en memoria")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ok = True
+    try:
+        for tamano in (int(t) for t in args.tamanos.split(",")):
+            ruta = os.path.join(carpeta, f"historial_{tamano}.db")
+            print(f"Generando {tamano:,} movimientos ...")
+            generar_base(ruta, empresas=1, productos=args.productos, movimientos=tamano).close()
+            db = Database(ruta)
+            empresa_id = db.obtener_empresas()[0][0]
+            ultima = db.pagina_movimientos(empresa_id, limite=1)[0]
+            mes = ultima[2][:7]
+            producto_id = ultima[5]
+
+            nuevas = {
+                "página más nueva": {},
+                "  solo ventas formales": {"tipo": "venta", "es_formal": True},
+                "  un producto": {"producto_id": producto_id},
+                "  último mes": {"desde": f"{mes}-01", "hasta": f"{mes}-28"},
+            }
+            print(f"{tamano:,} movimientos (mediana ms):")
+            for nombre, filtros in nuevas.items():
+                t = medir(lambda: db.pagina_movimientos(empresa_id, limite=LIMITE, **filtros), args.repeticiones)
+                print(f"  {nombre:<28}{t:>10.3f}")
+
+            # Página profunda: la clave sale de recorrer hasta ahí; OFFSET recorre todo lo anterior
+            profundidad = min(args.profundidad, max(tamano // LIMITE - 1, 0))
+            claves = recorrer(db, empresa_id)
+            antes_de = claves[profundidad * LIMITE - 1] if profundidad else None
+            t_clave = medir(lambda: db.pagina_movimientos(empresa_id, antes_de, LIMITE), args.repeticiones)
+            t_offset = medir(lambda: pagina_offset(db, empresa_id, profundidad * LIMITE), max(args.repeticiones // 5, 1))
+            print(f"  {f'página {profundidad:,} por clave':<28}{t_clave:>10.3f}")
+            print(f"  {f'página {profundidad:,} por OFFSET':<28}{t_offset:>10.3f}")
+            if tamano <= args.max_lista:
+                t_todo = medir(lambda: list(db.iterar_movimientos(empresa_id)), 1)
+                print(f"  {'historial completo (lista)':<28}{t_todo:>10.3f}")
+
+            # Cada movimiento una vez, del más nuevo al más antiguo, y los filtros respetados
+            ok &= len(claves) == tamano == len(set(claves)) and claves == sorted(claves, reverse=True)
+            ventas = recorrer(db, empresa_id, tipo="venta", es_formal=True)
+            with db._lectura() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM movimientos WHERE empresa_id = ? AND tipo = 'venta' AND es_formal = 1",
+                               (empresa_id,))
+                ok &= len(ventas) == cursor.fetchone()[0]
+            db.close()
+            os.remove(ruta)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    print("✅ Las páginas cubren cada movimiento una vez y en orden" if ok else
+          "⚠️ Las páginas no coinciden con el historial")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
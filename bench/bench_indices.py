@@ -0,0 +1,72 @@
+"""Latencia de consultas por empresa antes y después de la migración de índices.
+
+Uso: python -m bench.bench_indices [--movimientos 1000000]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from database import INDICE_FECHA_TS, INDICES, Database
+from bench.generador import generar_base
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def medir_consultas(db, empresas, repeticiones):
+    consultas = {
+        "obtener_productos": db.obtener_productos,
+        "obtener_resumen": db.obtener_resumen,
+        "reporte_sii": db.reporte_sii,
+    }
+    return {nombre: statistics.mean(medir(lambda: f(e), repeticiones) for e in empresas)
+            for nombre, f in consultas.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=1000000)
+    parser.add_argument("--productos", type=int, default=20000)
+    parser.add_argument("--empresas", type=int, default=5)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--db", help="Base existente a reutilizar (se genera si no existe)")
+    args = parser.parse_args(argv)
+
+    ruta = args.db or os.path.join(tempfile.mkdtemp(), "bench_indices.db")
+    if not os.path.exists(ruta):
+        print(f"Generando {args.movimientos:,} movimientos en {ruta} ...")
+        generar_base(ruta, args.empresas, args.productos, args.movimientos)
+    db = Database(ruta)
+    empresas = [e[0] for e in db.obtener_empresas()]
+
+    # Simular una base previa a la migración: sin índices y en versión 1
+    for sql in INDICES + [INDICE_FECHA_TS]:
+        nombre = sql.split(" ON ")[0].split()[-1]
+        db.conn.execute(f"DROP INDEX IF EXISTS {nombre}")
+    db.conn.execute("PRAGMA user_version = 1")
+    db.conn.commit()
+    antes = medir_consultas(db, empresas, args.repeticiones)
+
+    t0 = time.perf_counter()
+    aplicadas = db.aplicar_migraciones()
+    db.completar_fecha_ts()
+    t_migracion = time.perf_counter() - t0
+    despues = medir_consultas(db, empresas, args.repeticiones)
+
+    print(f"Migraciones aplicadas en {t_migracion:.2f}s: {[n for n, _ in aplicadas]}")
+    print(f"{'consulta':<20}{'antes (ms)':>12}{'después (ms)':>14}{'mejora':>9}")
+    for nombre in antes:
+        mejora = antes[nombre] / despues[nombre] if despues[nombre] else float("inf")
+        print(f"{nombre:<20}{antes[nombre]:>12.2f}{despues[nombre]:>14.2f}{mejora:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
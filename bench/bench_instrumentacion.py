@@ -0,0 +1,106 @@
+"""Costo de la instrumentación en las operaciones calientes, desactivada y activada.
+
+Mide la mediana de cada operación sobre la misma base con una Database sin instrumentar
+(el código de siempre) y con una instrumentada, y verifica lo registrado: llamadas,
+filas de SQLite, sentencias lentas con su plan y las exportaciones JSON y Prometheus.
+Uso: python -m bench.bench_instrumentacion [--movimientos 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from database import Database
+from instrumentacion import Instrumentacion
+from bench.generador import generar_base
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def operaciones(db, empresa_id, prod_ids, mes):
+    rnd = random.Random(7)
+    return {
+        "obtener_producto (caché)": lambda: db.obtener_producto(empresa_id, prod_ids[0]),
+        "buscar_productos": lambda: db.buscar_productos(empresa_id, "producto 1", 8),
+        "registrar_transaccion": lambda: db.registrar_transaccion(empresa_id, "venta", True, rnd.choice(prod_ids),
+                                                                  1, 1000, "Bench instrumentación"),
+        "obtener_resumen": lambda: db.obtener_resumen(empresa_id),
+        f"reporte_sii {mes}": lambda: db.reporte_sii(empresa_id, mes),
+        "iterar_movimientos (1 mes)": lambda: sum(1 for _ in db.iterar_movimientos(empresa_id, f"{mes}-01", f"{mes}-28")),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=1000000)
+    parser.add_argument("--productos", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--umbral-lenta", type=float, default=5, help="ms; bajo para que haya sentencias lentas")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "bench_instrumentacion.db")
+    print(f"Generando {args.movimientos:,} movimientos ...")
+    generar_base(ruta, empresas=2, productos=args.productos, movimientos=args.movimientos).close()
+
+    normal = Database(ruta)
+    empresa_id = normal.obtener_empresas()[0][0]
+    prod_ids = [p[0] for p in normal.obtener_productos(empresa_id)]
+    with normal._lectura() as cursor:
+        cursor.execute("SELECT substr(MAX(fecha), 1, 7) FROM movimientos")
+        mes = cursor.fetchone()[0]
+    instrumentacion = Instrumentacion(umbral_lenta_ms=args.umbral_lenta)
+    medida = instrumentacion.instrumentar_db(Database(ruta))
+
+    # Alternadas por operación para que ambas vean la misma caché y el mismo tamaño de tabla
+    resultados = {}
+    for (nombre, sin), con in zip(operaciones(normal, empresa_id, prod_ids, mes).items(),
+                                  operaciones(medida, empresa_id, prod_ids, mes).values()):
+        sin(), con()
+        resultados[nombre] = (medir(sin, args.repeticiones), medir(con, args.repeticiones))
+
+    print(f"{'operación (mediana)':<30}{'desactivada':>13}{'activada':>12}{'costo':>10}")
+    for nombre, (sin, con) in resultados.items():
+        print(f"{nombre:<30}{sin:>10.3f} ms{con:>9.3f} ms{(con - sin) * 1000:>7.1f} µs")
+
+    # Lo registrado debe cuadrar con lo ejecutado
+    datos = instrumentacion.instantanea()
+    ops = datos["operaciones"]
+    esperadas = args.repeticiones + 1
+    llamadas_ok = all(ops[f"db.{n}"]["llamadas"] == esperadas
+                      for n in ("obtener_producto", "registrar_transaccion", "obtener_resumen", "reporte_sii"))
+    filas_mes = sum(1 for _ in normal.iterar_movimientos(empresa_id, f"{mes}-01", f"{mes}-28"))
+    filas_ok = ops["db.iterar_movimientos"]["filas"] == esperadas * filas_mes
+    lentas = [l for l in datos["lentas"] if l["plan"]]
+    json_ok = json.loads(json.dumps(datos)) == datos
+    texto = instrumentacion.prometheus()
+    prom_ok = f'jempressa_operacion_segundos_count{{operacion="db.reporte_sii"}} {esperadas}' in texto
+    normal.close()
+    medida.close()
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"Sentencias lentas (> {args.umbral_lenta:g} ms) retenidas: {len(datos['lentas'])}")
+    if lentas:
+        print(f"  {lentas[-1]['ms']:.1f} ms · {lentas[-1]['sql'][:80]}")
+        for paso in lentas[-1]["plan"]:
+            print(f"    {paso}")
+    ok = llamadas_ok and filas_ok and json_ok and prom_ok
+    print("✅ Llamadas, filas y exportaciones coinciden con lo ejecutado" if ok else
+          f"⚠️ llamadas={llamadas_ok} filas={filas_ok} json={json_ok} prometheus={prom_ok}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Compara N llamadas a registrar_transaccion contra una sola llamada a registrar_transacciones_lote.
+
+Uso: python -m bench.bench_lote [--items 10000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import Database
+
+
+def preparar(ruta, productos):
+    db = Database(ruta)
+    emp_id = db.obtener_empresas()[0][0]
+    for i in range(productos):
+        db.agregar_producto(emp_id, f"Producto {i + 1}", 1000 + i, 600 + i)
+    return db, emp_id, [p[0] for p in db.obtener_productos(emp_id)]
+
+
+def generar_items(emp_id, prod_ids, n, semilla=1):
+    rnd = random.Random(semilla)
+    return [(emp_id, rnd.choice(('venta', 'compra')), rnd.random() < 0.7, rnd.choice(prod_ids),
+             rnd.randint(1, 5), 1000, "Importación POS") for _ in range(n)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--productos", type=int, default=200)
+    args = parser.parse_args(argv)
+    carpeta = tempfile.mkdtemp()
+
+    db, emp_id, prod_ids = preparar(os.path.join(carpeta, "individual.db"), args.productos)
+    items = generar_items(emp_id, prod_ids, args.items)
+    t0 = time.perf_counter()
+    for item in items:
+        db.registrar_transaccion(*item)
+    t_individual = time.perf_counter() - t0
+    stock_individual = db.obtener_productos(emp_id)
+    resumen_individual = db.obtener_resumen(emp_id)
+
+    db, emp_id, prod_ids = preparar(os.path.join(carpeta, "lote.db"), args.productos)
+    t0 = time.perf_counter()
+    exito, resultados = db.registrar_transacciones_lote(items)
+    t_lote = time.perf_counter() - t0
+    assert exito and all(ok for ok, _ in resultados)
+
+    # Ambos caminos deben dejar el mismo stock y los mismos totales
+    iguales = stock_individual == db.obtener_productos(emp_id) and resumen_individual == db.obtener_resumen(emp_id)
+
+    print(f"{args.items:,} llamadas individuales: {t_individual:8.2f}s ({args.items / t_individual:,.0f} items/s)")
+    print(f"1 llamada en lote:           {t_lote:8.2f}s ({args.items / t_lote:,.0f} items/s)")
+    print(f"Mejora: {t_individual / t_lote:.0f}x · resultados equivalentes: {'sí' if iguales else 'NO'}")
+
+    # Una fecha mal escrita falla solo en su item, sin revertir la llamada con una excepción
+    malas = ("2024-13-45", "ayer", "2024-1-5")
+    items = [item + (fecha,) for item, fecha in zip(generar_items(emp_id, prod_ids, 4, semilla=2),
+                                                    ("2024-03-01 10:00", *malas))]
+    exito, resultados = db.registrar_transacciones_lote(items)
+    solo_malas = not exito and [ok for ok, _ in resultados] == [True, False, False, False]
+    print(f"Fechas inválidas rechazadas por item: {'sí' if solo_malas else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
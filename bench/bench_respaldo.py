@@ -0,0 +1,144 @@
+"""Respaldo en caliente: MB/s de la copia y peor espera de registrar_transaccion mientras corre.
+
+Un hilo registra una compra cada `--intervalo` ms durante todo el benchmark. Se mide la
+latencia de esas escrituras sin respaldo, durante Database.copiar_a con cada tamaño de paso,
+durante dos alternativas de referencia (pasos desde la conexión escritora, y todo en un paso
+desde otra conexión) y durante un respaldo completo (copia, quick_check, gzip y rotación).
+La copia completa se restaura y se verifica que saldos y stock cuadren con sus movimientos.
+Uso: python -m bench.bench_respaldo [--movimientos 10000000] [--base ruta.db]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import respaldo
+from database import BLOQUE_RESPALDO, Database
+from bench.generador import generar_base
+
+
+class Escritor:
+    """Hilo que registra compras a ritmo fijo y anota cuánto tarda cada una"""
+
+    def __init__(self, db, intervalo):
+        self.db = db
+        self.intervalo = intervalo
+        self.latencias = []  # (inicio, ms)
+        self._parar = threading.Event()
+        with db._lectura() as cursor:
+            cursor.execute("SELECT empresa_id, id FROM productos ORDER BY id LIMIT 50")
+            self.productos = cursor.fetchall()
+        self.hilo = threading.Thread(target=self._escribir, daemon=True)
+        self.hilo.start()
+
+    def _escribir(self):
+        i = 0
+        while not self._parar.is_set():
+            empresa_id, prod_id = self.productos[i % len(self.productos)]
+            t0 = time.perf_counter()
+            self.db.registrar_transaccion(empresa_id, "compra", 1, prod_id, 1, 100, "Compra durante el respaldo")
+            self.latencias.append((t0, (time.perf_counter() - t0) * 1000))
+            i += 1
+            time.sleep(self.intervalo)
+
+    def entre(self, desde, hasta):
+        return [ms for t, ms in self.latencias if desde <= t < hasta]
+
+    def parar(self):
+        self._parar.set()
+        self.hilo.join()
+
+
+def resumen(latencias):
+    if not latencias:
+        return "sin escrituras"
+    ordenadas = sorted(latencias)
+    p99 = ordenadas[min(int(len(ordenadas) * 0.99), len(ordenadas) - 1)]
+    return (f"{len(latencias):>6} escrituras  p50 {statistics.median(latencias):6.2f}  "
+            f"p99 {p99:7.2f}  peor {ordenadas[-1]:7.1f} ms")
+
+
+def copia_en_un_paso(ruta, destino):
+    """Referencia: otra conexión copia todo en un paso (en WAL no bloquea, pero fija una foto larga)"""
+    origen = sqlite3.connect(ruta)
+    try:
+        origen.backup(destino)
+    finally:
+        origen.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=10000000)
+    parser.add_argument("--base", help="Usar (o generar y conservar) esta base en vez de una temporal")
+    parser.add_argument("--pasos", default="256,1024,4096", help="Páginas por paso a comparar, separadas por coma")
+    parser.add_argument("--intervalo", type=float, default=5, help="ms entre escrituras del hilo escritor")
+    parser.add_argument("--base-segundos", type=float, default=5, help="Segundos de escrituras sin respaldo")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    ruta = args.base or os.path.join(carpeta, "respaldo.db")
+    ok = True
+    try:
+        if not os.path.exists(ruta):
+            print(f"Generando {args.movimientos:,} movimientos ...")
+            generar_base(ruta, movimientos=args.movimientos).close()
+        db = Database(ruta)
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        mb = os.path.getsize(ruta) / 1e6
+        print(f"Base de {mb:,.1f} MB; una escritura cada {args.intervalo:g} ms")
+
+        escritor = Escritor(db, args.intervalo / 1000)
+        t0 = time.perf_counter()
+        time.sleep(args.base_segundos)
+        print(f"  {'sin respaldo':<28}{'':>22}{resumen(escritor.entre(t0, time.perf_counter()))}")
+
+        temporal = os.path.join(carpeta, "copia.db")
+        variantes = [(f"copiar_a de a {p} páginas", lambda p=p: db.copiar_a(copia, int(p)))
+                     for p in args.pasos.split(",")]
+        variantes.append((f"escritora de a {BLOQUE_RESPALDO}",
+                          lambda: db.conn.backup(copia, pages=BLOQUE_RESPALDO, progress=lambda *_: time.sleep(0.001))))
+        variantes.append(("un solo paso", lambda: copia_en_un_paso(ruta, copia)))
+        for nombre, copiar in variantes:
+            copia = respaldo._abrir_copia(temporal)
+            t0 = time.perf_counter()
+            copiar()
+            t1 = time.perf_counter()
+            copia.close()
+            mb_s = os.path.getsize(temporal) / 1e6 / (t1 - t0)
+            print(f"  {nombre:<28}{t1 - t0:>8.1f} s {mb_s:>7.1f} MB/s  {resumen(escritor.entre(t0, t1))}")
+            os.remove(temporal)
+
+        # Respaldo completo: copia, quick_check, gzip, rotación
+        copias = os.path.join(carpeta, "copias")
+        t0 = time.perf_counter()
+        r = respaldo.respaldar(db, copias)
+        t1 = time.perf_counter()
+        escritor.parar()
+        print(f"  {'respaldar (completo)':<28}{r.segundos:>8.1f} s {r.bytes_base / 1e6 / r.segundos:>7.1f} MB/s  "
+              f"{resumen(escritor.entre(t0, t1))}")
+        print(f"    copia {r.segundos_copia:.1f} s ({r.mb_por_segundo:,.1f} MB/s), "
+              f"{r.bytes_base / 1e6:,.1f} MB -> {r.bytes / 1e6:,.1f} MB comprimido")
+        db.close()
+
+        # La copia restaurada cuadra consigo misma: saldos y stock contra sus movimientos
+        restaurada = os.path.join(carpeta, "restaurada.db")
+        t0 = time.perf_counter()
+        respaldo.restaurar(r.ruta, restaurada)
+        print(f"  restaurar: {time.perf_counter() - t0:.1f} s")
+        copia_db = Database(restaurada)
+        ok = not copia_db.verificar_saldos() and not copia_db.conciliar_stock() and not copia_db.verificar_integridad()
+        copia_db.close()
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    print("✅ La copia restaurada es consistente" if ok else "⚠️ La copia restaurada no cuadra")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Prueba de carga del servidor REST: N terminales simuladas vendiendo y consultando a la vez.
+
+Levanta servidor.py en un proceso aparte sobre una base sintética y mide latencia
+p50/p99 por operación y ventas confirmadas por segundo, con y sin agrupar las ventas
+en la tarea escritora. Al final verifica que la última venta encabece /movimientos y
+recorre sus páginas, y después saldos, stock y cantidad de movimientos.
+Uso: python -m bench.carga_servidor [--terminales 50] [--segundos 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from bench.generador import generar_base
+from database import Database
+
+MODOS = {
+    "sin agrupar (1 venta = 1 commit)": ["--sin-agrupar"],
+    "agrupado (ventas en cola = 1 commit)": [],
+}
+# Mezcla de operaciones de una caja: mayormente ventas, algo de búsqueda y consultas
+OPERACIONES = (("venta", 0.70), ("buscar", 0.20), ("resumen", 0.10))
+PALABRAS = ("producto", "1", "2", "3", "4", "5")
+
+
+class Terminal:
+    """Cliente HTTP/1.1 mínimo con una conexión keep-alive"""
+
+    def __init__(self, host, puerto):
+        self.host, self.puerto = host, puerto
+        self.lector = self.escritor = None
+
+    async def conectar(self):
+        self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+
+    async def pedir(self, metodo, ruta, datos=None):
+        cuerpo = json.dumps(datos).encode() if datos is not None else b""
+        self.escritor.write(f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\n"
+                            f"Content-Length: {len(cuerpo)}\r\n\r\n".encode() + cuerpo)
+        await self.escritor.drain()
+        estado = int((await self.lector.readline()).split()[1])
+        largo = 0
+        while (linea := await self.lector.readline()) not in (b"\r\n", b""):
+            if linea.lower().startswith(b"content-length:"):
+                largo = int(linea.split(b":")[1])
+        respuesta = await self.lector.readexactly(largo) if largo else b""
+        return estado, json.loads(respuesta) if respuesta else None
+
+    def cerrar(self):
+        self.escritor.close()
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def esperar_servidor(host, puerto, proceso, limite=30):
+    fin = time.perf_counter() + limite
+    while time.perf_counter() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó al iniciar")
+        try:
+            terminal = Terminal(host, puerto)
+            await terminal.conectar()
+            await terminal.pedir("GET", "/salud")
+            terminal.cerrar()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+async def simular(host, puerto, productos, terminales, segundos, semilla):
+    latencias = {nombre: [] for nombre, _ in OPERACIONES}
+    ventas = [0]
+    errores = []
+    nombres, pesos = zip(*OPERACIONES)
+    empresas = sorted(productos)
+
+    async def terminal(i):
+        rnd = random.Random(semilla + i)
+        empresa_id = empresas[i % len(empresas)]
+        conexion = Terminal(host, puerto)
+        await conexion.conectar()
+        try:
+            while time.perf_counter() < fin:
+                operacion = rnd.choices(nombres, pesos)[0]
+                t0 = time.perf_counter()
+                if operacion == "venta":
+                    estado, respuesta = await conexion.pedir("POST", f"/empresas/{empresa_id}/transacciones", {
+                        "tipo": "venta", "producto_id": rnd.choice(productos[empresa_id]),
+                        "cantidad": rnd.randint(1, 3), "es_formal": rnd.random() < 0.7})
+                elif operacion == "buscar":
+                    estado, respuesta = await conexion.pedir(
+                        "GET", f"/empresas/{empresa_id}/productos?q={rnd.choice(PALABRAS)}&limite=8")
+                else:
+                    estado, respuesta = await conexion.pedir("GET", f"/empresas/{empresa_id}/resumen")
+                latencias[operacion].append(time.perf_counter() - t0)
+                if estado >= 300:
+                    errores.append(f"{operacion}: {estado} {respuesta}")
+                elif operacion == "venta":
+                    ventas[0] += 1
+        finally:
+            conexion.cerrar()
+
+    fin = time.perf_counter() + segundos
+    await asyncio.gather(*(terminal(i) for i in range(terminales)))
+    return ventas[0], latencias, errores
+
+
+async def verificar_historial(host, puerto, empresa_id, producto_id):
+    """La venta recién confirmada encabeza /movimientos y el cursor recorre sin saltos ni repetidos"""
+    conexion = Terminal(host, puerto)
+    await conexion.conectar()
+    problemas = []
+    try:
+        detalle = f"Última venta {time.time()}"
+        await conexion.pedir("POST", f"/empresas/{empresa_id}/transacciones",
+                             {"tipo": "venta", "producto_id": producto_id, "cantidad": 1, "detalle": detalle})
+        _, pagina = await conexion.pedir("GET", f"/empresas/{empresa_id}/movimientos?limite=1")
+        if not pagina["movimientos"] or pagina["movimientos"][0]["detalle"] != detalle:
+            problemas.append("la última venta no es la primera de /movimientos")
+        claves, siguiente = [], ""
+        for _ in range(3):
+            _, pagina = await conexion.pedir(
+                "GET", f"/empresas/{empresa_id}/movimientos?limite=50&antes_de={quote(siguiente)}")
+            claves += [(m["fecha"], m["id"]) for m in pagina["movimientos"]]
+            siguiente = pagina["siguiente"]
+            if not siguiente:
+                break
+        if claves != sorted(set(claves), reverse=True):
+            problemas.append("las páginas de /movimientos se repiten o salen de orden")
+    finally:
+        conexion.cerrar()
+    return problemas
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p), len(valores) - 1)] if valores else 0.0
+
+
+def verificar(ruta, movimientos_esperados):
+    db = Database(ruta)
+    problemas = []
+    try:
+        with db._lectura() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM movimientos")
+            if cursor.fetchone()[0] != movimientos_esperados:
+                problemas.append("cantidad de movimientos distinta a las ventas confirmadas")
+            cursor.execute("""
+                SELECT COUNT(*) FROM productos p
+                WHERE p.stock != (
+                    SELECT COALESCE(SUM(CASE WHEN m.tipo = 'compra' THEN m.cantidad ELSE -m.cantidad END), 0)
+                    FROM movimientos m WHERE m.producto_id = p.id)
+            """)
+            descuadrados = cursor.fetchone()[0]
+            if descuadrados:
+                problemas.append(f"{descuadrados} productos con stock distinto a sus movimientos")
+        if db.verificar_saldos():
+            problemas.append("saldos distintos a movimientos")
+    finally:
+        db.close()
+    return problemas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terminales", type=int, default=50)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--productos", type=int, default=1000)
+    parser.add_argument("--movimientos", type=int, default=100000, help="Movimientos previos en la base")
+    parser.add_argument("--lectores", type=int, default=4)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    base = os.path.join(carpeta, "base.db")
+    db = generar_base(base, empresas=3, productos=args.productos, movimientos=args.movimientos, semilla=args.semilla)
+    productos = {}
+    for emp_id, prod_id in db.conn.execute("SELECT empresa_id, id FROM productos"):
+        productos.setdefault(emp_id, []).append(prod_id)
+    db.close()
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fallo = False
+    print(f"{args.terminales} terminales · {args.segundos:g}s · {args.movimientos:,} movimientos previos")
+    for i, (nombre, opciones) in enumerate(MODOS.items()):
+        ruta = os.path.join(carpeta, f"carga_{i}.db")
+        shutil.copy(base, ruta)
+        puerto = puerto_libre()
+        proceso = subprocess.Popen([sys.executable, os.path.join(raiz, "servidor.py"), "--db", ruta,
+                                    "--puerto", str(puerto), "--lectores", str(args.lectores)] + opciones,
+                                   stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(esperar_servidor("127.0.0.1", puerto, proceso))
+            ventas, latencias, errores = asyncio.run(
+                simular("127.0.0.1", puerto, productos, args.terminales, args.segundos, args.semilla))
+            empresa_id = min(productos)
+            errores += asyncio.run(verificar_historial("127.0.0.1", puerto, empresa_id, productos[empresa_id][0]))
+            ventas_historial = 1
+        finally:
+            proceso.terminate()
+            proceso.wait()
+
+        problemas = errores[:5] + verificar(ruta, args.movimientos + ventas + ventas_historial)
+        fallo = fallo or bool(problemas)
+        print(f"{nombre}: {ventas / args.segundos:,.0f} ventas/s · {'OK' if not problemas else problemas}")
+        for operacion, valores in latencias.items():
+            print(f"  {operacion:8} {len(valores):>7,} · p50 {percentil(valores, 0.5) * 1000:6.1f} ms · "
+                  f"p99 {percentil(valores, 0.99) * 1000:6.1f} ms")
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Dos equipos offline y un central en archivos locales: sincronización incremental de punta a punta.
+
+Cada equipo vende sin conexión, crea productos y cambia precios; luego se sincronizan
+contra el central (sustituto en archivo) y se verifica que los tres terminan con los
+mismos movimientos, stock, precios y saldos, y que una segunda pasada no envía nada.
+Uso: python -m bench.demo_sincronizacion [--movimientos 20000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from database import Database
+from sincronizacion import Central, sincronizar
+
+
+def vender(db, empresa_id, rnd, cantidad):
+    prod_ids = [p[0] for p in db.obtener_productos(empresa_id)]
+    exito, _ = db.registrar_transacciones_lote([
+        (empresa_id, rnd.choice(("venta", "compra")), rnd.random() < 0.7, rnd.choice(prod_ids),
+         rnd.randint(1, 5), rnd.randint(1, 50) * 100, "Venta en terreno")
+        for _ in range(cantidad)
+    ])
+    assert exito
+
+
+def foto(db):
+    """Estado comparable entre nodos: todo referenciado por uid global"""
+    uid = "COALESCE({t}.uid, :nodo || ':' || {t}.id)"
+    with db._lectura() as cursor:
+        cursor.execute(f"SELECT {uid.format(t='m')} FROM movimientos m", {"nodo": db.nodo})
+        movimientos = {fila[0] for fila in cursor.fetchall()}
+        cursor.execute(f"SELECT {uid.format(t='p')}, nombre, precio_venta, costo_unitario, stock FROM productos p",
+                       {"nodo": db.nodo})
+        productos = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+    return movimientos, productos, [db.obtener_resumen(e[0]) for e in db.obtener_empresas()]
+
+
+def mostrar(nombre, r):
+    print(f"  {nombre}: ↑{r.enviados:,} ↓{r.recibidos:,} filas en {r.paquetes} paquetes · "
+          f"{(r.bytes_enviados + r.bytes_recibidos) / 1e3:,.0f} KB comprimidos (x{r.compresion:.1f}) · "
+          f"stock corregido en {r.stock_corregido} productos · {r.segundos:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--productos", type=int, default=300)
+    parser.add_argument("--movimientos", type=int, default=20000, help="Movimientos offline por equipo")
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.semilla)
+    carpeta = tempfile.mkdtemp()
+    central = Central(os.path.join(carpeta, "central.db"))
+    equipo_a = Database(os.path.join(carpeta, "equipo_a.db"))
+    equipo_b = Database(os.path.join(carpeta, "equipo_b.db"))
+
+    print("1. El equipo A carga el catálogo y lo comparte")
+    equipo_a.upsert_productos_lote(1, [(f"Producto {i}", 1000 + i, 600 + i) for i in range(args.productos)])
+    mostrar("A", sincronizar(equipo_a, central))
+    mostrar("B", sincronizar(equipo_b, central))
+
+    print(f"2. Ambos venden offline ({args.movimientos:,} movimientos c/u), B crea productos y A cambia precios")
+    vender(equipo_a, 1, rnd, args.movimientos)
+    vender(equipo_b, 1, rnd, args.movimientos)
+    for i in range(10):
+        equipo_b.agregar_producto(2, f"Producto nuevo {i}", 5000, 3000)
+    vender(equipo_b, 2, rnd, args.movimientos // 10)
+    equipo_a.upsert_productos_lote(1, [(f"Producto {i}", 2000 + i, 600 + i) for i in range(0, args.productos, 3)])
+
+    print("3. Se reconectan")
+    mostrar("A", sincronizar(equipo_a, central))
+    mostrar("B", sincronizar(equipo_b, central))
+    mostrar("A", sincronizar(equipo_a, central))
+
+    print("4. Verificación")
+    problemas = []
+    fotos = {"central": foto(central.db), "A": foto(equipo_a), "B": foto(equipo_b)}
+    esperados = 2 * args.movimientos + args.movimientos // 10
+    for nombre, (movimientos, productos, resumen) in fotos.items():
+        if len(movimientos) != esperados:
+            problemas.append(f"{nombre}: {len(movimientos):,} movimientos (se esperaban {esperados:,})")
+        if (movimientos, productos, resumen) != fotos["central"]:
+            problemas.append(f"{nombre}: estado distinto al central")
+    for nombre, db in (("central", central.db), ("A", equipo_a), ("B", equipo_b)):
+        if db.verificar_saldos():
+            problemas.append(f"{nombre}: saldos distintos a movimientos")
+        if db.reconstruir_stock():
+            problemas.append(f"{nombre}: stock distinto a movimientos")
+    for nombre, db in (("A", equipo_a), ("B", equipo_b)):
+        r = sincronizar(db, central)
+        if r.enviados or r.recibidos:
+            problemas.append(f"{nombre}: la segunda pasada movió {r.enviados + r.recibidos} filas")
+
+    for db in (central.db, equipo_a, equipo_b):
+        db.close()
+    shutil.rmtree(carpeta, ignore_errors=True)
+    print("  ✅ Los tres nodos coinciden" if not problemas else "\n".join(f"  ⚠️ {p}" for p in problemas))
+    return 1 if problemas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Lectores y escritores en paralelo sobre un mismo archivo: rendimiento e integridad.
+
+Compara la configuración anterior (journal DELETE, una sola conexión compartida)
+contra WAL con pool de lectoras. Uso: python -m bench.estres_concurrencia [--segundos 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from database import Database
+
+CONFIGURACIONES = {
+    "antes (DELETE, 1 conexión)": dict(journal_mode="DELETE", synchronous="FULL", lectores=0),
+    "después (WAL + pool)": dict(journal_mode="WAL", synchronous="NORMAL", lectores=4),
+}
+
+
+def preparar(ruta, productos, movimientos_previos, **opciones):
+    db = Database(ruta, **opciones)
+    emp_id = db.obtener_empresas()[0][0]
+    for i in range(productos):
+        db.agregar_producto(emp_id, f"Producto {i + 1}", 1000, 700)
+    prod_ids = [p[0] for p in db.obtener_productos(emp_id)]
+    # Historial del último año para que el reporte del mes no recorra toda la tabla
+    rnd = random.Random(0)
+    ahora = time.time()
+    db.registrar_transacciones_lote([(emp_id, 'compra', rnd.random() < 0.7, rnd.choice(prod_ids), 5, 700, "Carga inicial",
+                                      time.strftime("%Y-%m-%d %H:%M", time.localtime(ahora - rnd.randrange(365 * 86400))))
+                                     for _ in range(movimientos_previos)])
+    return db, emp_id, prod_ids
+
+
+def ejecutar(db, emp_id, prod_ids, escritores, lectores, segundos):
+    fin = time.perf_counter() + segundos
+    escrituras = [0] * escritores
+    lecturas = [0] * lectores
+    latencias = [[] for _ in range(escritores)]
+    errores = []
+
+    def escritor(i):
+        rnd = random.Random(100 + i)
+        try:
+            while time.perf_counter() < fin:
+                t0 = time.perf_counter()
+                if db.registrar_transaccion(emp_id, rnd.choice(('venta', 'compra')), rnd.random() < 0.7,
+                                            rnd.choice(prod_ids), rnd.randint(1, 3), 1000, "Estrés"):
+                    escrituras[i] += 1
+                latencias[i].append(time.perf_counter() - t0)
+        except Exception as e:
+            errores.append(repr(e))
+
+    def lector(i):
+        periodo = time.strftime("%Y-%m")
+        try:
+            while time.perf_counter() < fin:
+                db.obtener_resumen(emp_id)
+                db.reporte_sii(emp_id, periodo)
+                db.obtener_productos(emp_id)
+                lecturas[i] += 1
+        except Exception as e:
+            errores.append(repr(e))
+
+    hilos = [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+    hilos += [threading.Thread(target=lector, args=(i,)) for i in range(lectores)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    todas = sorted(l for lista in latencias for l in lista) or [0.0]
+    return sum(escrituras), sum(lecturas), todas[int(len(todas) * 0.99)], todas[-1], errores
+
+
+def verificar_integridad(db, emp_id, movimientos_esperados):
+    problemas = []
+    with db._lectura() as cursor:
+        cursor.execute("PRAGMA integrity_check")
+        resultado = cursor.fetchone()[0]
+        if resultado != "ok":
+            problemas.append(f"integrity_check: {resultado}")
+        cursor.execute("SELECT COUNT(*) FROM movimientos WHERE empresa_id = ?", (emp_id,))
+        if cursor.fetchone()[0] != movimientos_esperados:
+            problemas.append("cantidad de movimientos distinta a las escrituras confirmadas")
+        cursor.execute("""
+            SELECT COUNT(*) FROM productos p
+            WHERE p.empresa_id = ? AND p.stock != (
+                SELECT COALESCE(SUM(CASE WHEN m.tipo = 'compra' THEN m.cantidad ELSE -m.cantidad END), 0)
+                FROM movimientos m WHERE m.producto_id = p.id)
+        """, (emp_id,))
+        descuadrados = cursor.fetchone()[0]
+        if descuadrados:
+            problemas.append(f"{descuadrados} productos con stock distinto a sus movimientos")
+    if db.verificar_saldos():
+        problemas.append("saldos distintos a movimientos")
+    return problemas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--escritores", type=int, default=2)
+    parser.add_argument("--lectores", type=int, default=4)
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--movimientos", type=int, default=50000, help="Movimientos previos en la base")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    fallo = False
+    for i, (nombre, opciones) in enumerate(CONFIGURACIONES.items()):
+        ruta = os.path.join(carpeta, f"estres_{i}.db")
+        db, emp_id, prod_ids = preparar(ruta, args.productos, args.movimientos, **opciones)
+        escrituras, lecturas, p99, peor, errores = ejecutar(db, emp_id, prod_ids, args.escritores,
+                                                            args.lectores, args.segundos)
+        problemas = errores + verificar_integridad(db, emp_id, args.movimientos + escrituras)
+        db.close()
+        fallo = fallo or bool(problemas)
+        print(f"{nombre}: {escrituras / args.segundos:,.0f} ventas/s · {lecturas / args.segundos:,.0f} lecturas/s · "
+              f"escritura p99 {p99 * 1000:.1f} ms / peor {peor * 1000:.1f} ms · "
+              f"{'OK' if not problemas else problemas}")
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
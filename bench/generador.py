@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+from database import Database, segundos_epoca
+
+BLOQUE = 50000
+
+
+def generar_base(ruta, empresas=3, productos=1000, movimientos=100000, proporcion_formal=0.7,
+                 proporcion_ventas=0.7, dias=730, semilla=42, costear=True, proporcion_formal_compras=None,
+                 hasta=None):
+    """Crea (o completa) una base sintética reproducible en la ruta indicada.
+
+    proporcion_formal se aplica a las ventas y, si no se indica otra, a las compras (que en
+    un comercio real casi siempre llevan factura). Los movimientos caen en los `dias` previos
+    a `hasta` (por defecto ahora): con la misma semilla y el mismo `hasta` se generan los mismos datos.
+    Con costear=False el costeo de la historia queda pendiente, como en una base recién migrada.
+    """
+    if proporcion_formal_compras is None:
+        proporcion_formal_compras = proporcion_formal
+    rnd = random.Random(semilla)
+    db = Database(ruta)
+    cursor = db.conn.cursor()
+
+    # Empresas (la base nueva ya trae 'Empresa A' y 'Empresa B')
+    empresas_ids = [e[0] for e in db.obtener_empresas()]
+    while len(empresas_ids) < empresas:
+        empresas_ids.append(db.agregar_empresa(f"Empresa {len(empresas_ids) + 1}"))
+    empresas_ids = empresas_ids[:empresas]
+
+    # Productos repartidos entre las empresas
+    filas = []
+    for i in range(productos):
+        precio = rnd.randrange(500, 50000, 10)
+        costo = int(precio * rnd.uniform(0.55, 0.9))
+        filas.append((empresas_ids[i % len(empresas_ids)], f"Producto {i + 1:06d}", precio, costo))
+    cursor.executemany("INSERT INTO productos (empresa_id, nombre, precio_venta, costo_unitario, stock) VALUES (?, ?, ?, ?, 0)", filas)
+    db.conn.commit()
+
+    catalogo = {}
+    cursor.execute("SELECT id, empresa_id, precio_venta, costo_unitario FROM productos")
+    for prod_id, emp_id, precio, costo in cursor.fetchall():
+        catalogo.setdefault(emp_id, []).append((prod_id, precio, costo))
+    empresas_con_productos = [e for e in empresas_ids if e in catalogo]
+
+    # Movimientos en bloques para no materializar todo en memoria
+    inicio = (hasta or datetime.datetime.now()) - datetime.timedelta(days=dias)
+    segundos = dias * 86400
+    stock = {}
+    restantes = movimientos
+    while restantes > 0:
+        lote = []
+        for _ in range(min(BLOQUE, restantes)):
+            emp_id = rnd.choice(empresas_con_productos)
+            prod_id, precio, costo = rnd.choice(catalogo[emp_id])
+            tipo = 'venta' if rnd.random() < proporcion_ventas else 'compra'
+            cantidad = rnd.randint(1, 10)
+            monto = cantidad * (precio if tipo == 'venta' else costo)
+            stock[prod_id] = stock.get(prod_id, 0) + (cantidad if tipo == 'compra' else -cantidad)
+            fecha = (inicio + datetime.timedelta(seconds=rnd.randrange(segundos))).strftime("%Y-%m-%d %H:%M")
+            formal = proporcion_formal if tipo == 'venta' else proporcion_formal_compras
+            lote.append((emp_id, tipo, 1 if rnd.random() < formal else 0, fecha, prod_id, cantidad,
+                         monto, f"{tipo.capitalize()} de mercadería", segundos_epoca(fecha)))
+        cursor.executemany("""
+            INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total, detalle, fecha_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, lote)
+        db.conn.commit()
+        restantes -= len(lote)
+
+    # Tablas derivadas coherentes con los movimientos insertados
+    cursor.executemany("UPDATE productos SET stock = ? WHERE id = ?", [(v, k) for k, v in stock.items()])
+    db.conn.commit()
+    db.reconstruir_saldos()
+    if costear:
+        db.reconstruir_costos()
+    else:
+        cursor.execute("DELETE FROM costos")
+        cursor.execute("DELETE FROM capas_costo")
+        cursor.execute("INSERT OR REPLACE INTO tareas (nombre, avance, hasta) SELECT 'costos', 0, MAX(id) FROM movimientos")
+        db.conn.commit()
+        db.costos_listos = False
+    return db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una base de datos sintética de JEmpressa")
+    parser.add_argument("ruta")
+    parser.add_argument("--empresas", type=int, default=3)
+    parser.add_argument("--productos", type=int, default=1000)
+    parser.add_argument("--movimientos", type=int, default=100000)
+    parser.add_argument("--formal", type=float, default=0.7, help="Proporción de ventas formales")
+    parser.add_argument("--formal-compras", type=float, help="Proporción de compras formales (por defecto --formal)")
+    parser.add_argument("--hasta", type=datetime.date.fromisoformat, help="Último día AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.ruta):
+        print(f"Ya existe {args.ruta}", file=sys.stderr)
+        return 1
+    t0 = time.perf_counter()
+    hasta = datetime.datetime.combine(args.hasta, datetime.time()) if args.hasta else None
+    generar_base(args.ruta, args.empresas, args.productos, args.movimientos, args.formal, semilla=args.semilla,
+                 proporcion_formal_compras=args.formal_compras, hasta=hasta)
+    print(f"Base generada en {time.perf_counter() - t0:.1f}s: {args.ruta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
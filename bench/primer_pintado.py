@@ -0,0 +1,182 @@
+"""Tiempo hasta el primer pintado de cada pestaña sobre bases de distintos tamaños.
+
+Ejecuta main.main sobre una página Flet sin ventana, con una conexión que registra
+cada envío a la interfaz, y mide por pestaña: cuánto queda bloqueado el manejador
+del click, el primer pintado (la vista ya montada o el esqueleto) y el pintado con
+los datos completos.
+También verifica que un cambio rápido de pestaña no deja pintado un resultado viejo.
+Uso: python -m bench.primer_pintado [--tamanos 10000,100000,1000000]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import flet as ft
+
+try:
+    from flet.core.connection import Connection
+    from flet.core.page import Page
+    from flet.core.protocol import CommandEncoder, PageCommandResponsePayload, PageCommandsBatchResponsePayload
+except ImportError:  # flet < 0.25
+    from flet_core.connection import Connection
+    from flet_core.page import Page
+    from flet_core.protocol import CommandEncoder, PageCommandResponsePayload, PageCommandsBatchResponsePayload
+
+from bench.generador import generar_base
+
+PESTANAS = ["📊 Resumen", "📦 Inventario", "🧮 Contabilidad", "🧾 Historial", "⚙️ Perfil"]
+TITULOS = ["Accesos Rápidos", "Productos", "Contabilidad (Norma Chilena)", "Historial de Movimientos", "⚙️ Configuración"]
+
+
+class ConexionRegistro(Connection):
+    """Conexión falsa: responde como el cliente Flet y anota (instante, contenido de la pestaña).
+
+    Con contar=True suma además los bytes del JSON de los comandos y los controles enviados
+    (cada control agregado o con propiedades cambiadas).
+    """
+
+    def __init__(self, contar=False):
+        super().__init__()
+        self._ids = itertools.count(1)
+        self.envios = []
+        self.pestana = None  # Contenedor de las pestañas montadas, una vez cargada la interfaz
+        self.contar = contar
+        self.bytes = 0
+        self.controles = 0
+
+    def _anotar(self, comandos):
+        contenido = visible(self.pestana) if self.pestana is not None else None
+        self.envios.append((time.perf_counter(), contenido))
+        if self.contar:
+            self.bytes += len(json.dumps(comandos, cls=CommandEncoder, separators=(",", ":")))
+            self.controles += sum(len(c.commands) if c.name == "add" else c.name == "set" for c in comandos)
+
+    def _resultado(self, comando):
+        return " ".join(f"_{next(self._ids)}" for _ in comando.commands) if comando.name == "add" else ""
+
+    def send_command(self, session_id, command):
+        self._anotar([command])
+        return PageCommandResponsePayload(result=self._resultado(command), error="")
+
+    def send_commands(self, session_id, commands):
+        self._anotar(commands)
+        return PageCommandsBatchResponsePayload(
+            results=[self._resultado(c) for c in commands if c.name == "add"], error="")
+
+
+def controles(raiz):
+    yield raiz
+    for hijo in raiz._get_children():
+        yield from controles(hijo)
+
+
+def visible(pestanas):
+    """Vista que se está mostrando entre las pestañas montadas (o el esqueleto)"""
+    return next((c for c in pestanas.controls if c.visible), None)
+
+
+def contenedor_pestanas(page):
+    import main
+    return next(c for c in controles(page) if c.data == main.PESTANAS_MONTADAS)
+
+
+def boton(page, texto):
+    return next(c for c in controles(page) if isinstance(c, ft.ElevatedButton) and c.text == texto)
+
+
+def titulo(contenido):
+    textos = {c.value for c in controles(contenido) if isinstance(c, ft.Text)}
+    return next((i for i, t in enumerate(TITULOS) if t in textos), None)
+
+
+def esperar_contenido(conexion, desde, limite=60):
+    """Último envío posterior a 'desde' una vez terminada la carga: la pestaña con sus datos (no el esqueleto)"""
+    import main
+    fin = time.perf_counter() + limite
+    while time.perf_counter() < fin:
+        cargando = any(h.name == main.HILO_PESTANA for h in threading.enumerate())
+        if not cargando and len(conexion.envios) > desde:
+            instante, contenido = conexion.envios[-1]
+            if contenido is not None and contenido.data != main.ESQUELETO:
+                return instante, contenido
+        time.sleep(0.001)
+    raise TimeoutError("La pestaña no terminó de cargar")
+
+
+def click(page, texto):
+    control = boton(page, texto)
+    control.on_click(ft.ControlEvent(control.uid, "click", "", control, page))
+
+
+def medir(conexion, page, indice):
+    desde = len(conexion.envios)
+    t0 = time.perf_counter()
+    click(page, PESTANAS[indice])
+    manejador = time.perf_counter() - t0
+    primer_pintado = conexion.envios[desde][0] - t0
+    completo, contenido = esperar_contenido(conexion, desde)
+    if titulo(contenido) != indice:
+        raise AssertionError(f"La pestaña {PESTANAS[indice]} pintó otro contenido")
+    return manejador, primer_pintado, completo - t0
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p), len(valores) - 1)]
+
+
+def ejecutar(ruta, repeticiones):
+    import main
+    os.environ["JEMPRESSA_DB"] = ruta
+    conexion = ConexionRegistro()
+    page = Page(conexion, "bench", asyncio.new_event_loop())
+    main.main(page)
+    click(page, next(c.text for c in controles(page) if isinstance(c, ft.ElevatedButton)))
+    conexion.pestana = contenedor_pestanas(page)
+    esperar_contenido(conexion, 0)
+
+    resultados = {}
+    for indice in range(len(PESTANAS)):
+        medidas = [medir(conexion, page, indice) for _ in range(repeticiones)]
+        resultados[PESTANAS[indice]] = [percentil([m[i] for m in medidas], 0.5) for i in range(3)]
+
+    # Cambio rápido: Contabilidad e inmediatamente Resumen; debe quedar el Resumen
+    for _ in range(repeticiones):
+        desde = len(conexion.envios)
+        click(page, PESTANAS[2])
+        click(page, PESTANAS[0])
+        esperar_contenido(conexion, desde)
+        time.sleep(0.05)  # Dar tiempo a que la carga descartada intente pintar
+        if titulo(visible(conexion.pestana)) != 0:
+            raise AssertionError("Un resultado viejo reemplazó a la pestaña actual")
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanos", default="10000,100000,1000000", help="Movimientos de cada base, separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp()
+    for tamano in (int(t) for t in args.tamanos.split(",")):
+        ruta = os.path.join(carpeta, f"pintado_{tamano}.db")
+        generar_base(ruta, empresas=3, productos=max(100, tamano // 100), movimientos=tamano).close()
+        print(f"{tamano:,} movimientos (mediana de {args.repeticiones} clicks):")
+        for pestana, (manejador, primer, completo) in ejecutar(ruta, args.repeticiones).items():
+            print(f"  {pestana:16} manejador {manejador * 1000:6.1f} ms · primer pintado {primer * 1000:6.1f} ms · "
+                  f"completo {completo * 1000:6.1f} ms")
+        print("  cambio rápido de pestaña: OK (no quedan resultados viejos)")
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
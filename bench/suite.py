@@ -0,0 +1,327 @@
+"""Suite de benchmarks del núcleo con resultados en JSON y comparación entre corridas.
+
+`correr` genera (o reutiliza) una base sintética con semilla y fecha fijas, la copia y
+mide las operaciones de la base que usan la app y el servidor, y cada pestaña de la
+interfaz sobre una página Flet sin ventana: el tiempo de construir su árbol de controles
+y el de la carga completa. `comparar` marca como regresión todo escenario cuya mejor mediana
+de ronda empeore más que la tolerancia o que su propia dispersión entre rondas, y más que
+un mínimo absoluto.
+Uso: python -m bench.suite correr --salida antes.json [--tamano mediano]
+     python -m bench.suite comparar antes.json despues.json [--tolerancia 0.15] [--normalizar]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from database import Database
+from bench.generador import generar_base
+
+FORMATO = 1  # Versión del JSON de resultados
+
+# Tamaños predefinidos: empresas, productos, movimientos
+TAMANOS = {
+    "chico": (3, 1000, 100000),
+    "mediano": (5, 10000, 1000000),
+    "grande": (10, 50000, 5000000),
+}
+# Mezcla formal/informal de un comercio típico: ventas con y sin boleta, compras casi siempre con factura
+FORMAL_VENTAS = 0.6
+FORMAL_COMPRAS = 0.9
+
+RONDAS = 5  # Los escenarios se alternan en rondas: una ráfaga de ruido no se lleva un escenario entero
+TOLERANCIA = 0.15  # Empeoramiento relativo de la mediana que cuenta como regresión
+MINIMO_MS = 0.02   # Diferencias absolutas menores se consideran ruido
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p), len(valores) - 1)]
+
+
+def resumir(rondas):
+    """rondas = listas de tiempos (ms).
+
+    estable_ms es la mejor mediana de ronda (el ruido solo suma tiempo) y es lo que se
+    compara; dispersion es cuánto supera la ronda mediana a la mejor.
+    """
+    tiempos = [t for ronda in rondas for t in ronda]
+    medianas = [percentil(ronda, 0.5) for ronda in rondas]
+    return {"n": len(tiempos), "p50_ms": round(percentil(tiempos, 0.5), 4),
+            "p95_ms": round(percentil(tiempos, 0.95), 4), "max_ms": round(max(tiempos), 4),
+            "estable_ms": round(min(medianas), 4),
+            "dispersion": round(percentil(medianas, 0.5) / min(medianas) - 1, 4) if min(medianas) else 0.0}
+
+
+def muestras(funcion, n):
+    tiempos = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return tiempos
+
+
+def en_rondas(escenarios, rondas, calentamiento=3):
+    """escenarios = {nombre: (función, muestras)}; cada ronda toma una parte de cada uno"""
+    tiempos = {nombre: [] for nombre in escenarios}
+    for funcion, _ in escenarios.values():
+        muestras(funcion, calentamiento)
+    for _ in range(rondas):
+        for nombre, (funcion, n) in escenarios.items():
+            tiempos[nombre].append(muestras(funcion, max(1, n // rondas)))
+    return {nombre: resumir(r) for nombre, r in tiempos.items()}
+
+
+def escenarios_base(db, repeticiones, escrituras, semilla, rondas):
+    """Operaciones de Database, repartidas entre las empresas"""
+    rnd = random.Random(semilla)
+    empresas = [e[0] for e in db.obtener_empresas()]
+    productos = {e: [p[0] for p in db.obtener_productos(e)] for e in empresas}
+    with db._lectura() as cursor:
+        cursor.execute("SELECT substr(MAX(fecha), 1, 7) FROM movimientos")
+        ultimo = cursor.fetchone()[0]
+    anio, mes = int(ultimo[:4]), int(ultimo[5:7])
+    mes_cerrado = f"{anio:04d}-{mes - 1:02d}" if mes > 1 else f"{anio - 1:04d}-12"
+
+    def empresa():
+        return rnd.choice(empresas)
+
+    def transaccion():
+        emp = empresa()
+        db.registrar_transaccion(emp, rnd.choice(("venta", "compra")), rnd.random() < FORMAL_VENTAS,
+                                 rnd.choice(productos[emp]), rnd.randint(1, 5), rnd.randint(500, 50000), "Bench suite")
+
+    def lote():
+        emp = empresa()
+        items = [(emp, rnd.choice(("venta", "compra")), True, rnd.choice(productos[emp]), rnd.randint(1, 5),
+                  rnd.randint(500, 50000), "Bench suite") for _ in range(100)]
+        if not db.registrar_transacciones_lote(items)[0]:
+            raise RuntimeError("registrar_transacciones_lote falló")
+
+    escenarios = {
+        "db.registrar_transaccion": (transaccion, escrituras),
+        "db.registrar_transacciones_lote (100)": (lote, max(10, repeticiones // 2)),
+        "db.obtener_resumen": (lambda: db.obtener_resumen(empresa()), repeticiones),
+        "db.reporte_sii mes": (lambda: db.reporte_sii(empresa(), mes_cerrado), repeticiones),
+        "db.reporte_sii año": (lambda: db.reporte_sii(empresa(), mes_cerrado[:4]), repeticiones),
+        "db.reporte_consolidado mes": (lambda: db.reporte_consolidado(mes_cerrado), repeticiones),
+        "db.ultimos_meses (12)": (lambda: db.ultimos_meses(empresa(), 12), repeticiones),
+        "db.obtener_productos": (lambda: db.obtener_productos(empresa()), max(10, repeticiones // 5)),
+        "db.obtener_productos_pagina": (lambda: db.obtener_productos_pagina(empresa(), 0, 50), repeticiones),
+        "db.buscar_productos": (lambda: db.buscar_productos(empresa(), f"producto {rnd.randint(1, 999)}", 8),
+                                repeticiones),
+    }
+    return en_rondas(escenarios, rondas)
+
+
+def escenarios_pestanas(ruta, repeticiones, rondas):
+    """Cada pestaña en la app real: construir o refrescar su árbol de controles y la carga completa"""
+    import flet as ft
+    import main
+    from instrumentacion import Instrumentacion
+
+    class Muestras(Instrumentacion):
+        """Guarda además cada duración, para resumir construir por rondas"""
+        def __init__(self):
+            super().__init__(umbral_lenta_ms=float("inf"))
+            self.tiempos = {}
+
+        def _registrar(self, nombre, segundos, filas, error):
+            super()._registrar(nombre, segundos, filas, error)
+            self.tiempos.setdefault(nombre, []).append(segundos * 1000)
+    from bench.primer_pintado import ConexionRegistro, Page, click, contenedor_pestanas, controles, esperar_contenido
+    from bench.primer_pintado import medir as medir_pestana
+
+    os.environ["JEMPRESSA_DB"] = ruta
+    main.INSTRUMENTACION = instrumentacion = Muestras()
+    conexion = ConexionRegistro()
+    page = Page(conexion, "bench", asyncio.new_event_loop())
+    main.main(page)
+    click(page, next(c.text for c in controles(page) if isinstance(c, ft.ElevatedButton)))
+    conexion.pestana = contenedor_pestanas(page)
+    esperar_contenido(conexion, 0)
+
+    # Las pestañas montadas se refrescan en su lugar; las que no (perfil) se construyen en cada visita
+    completas = {nombre: [] for nombre in main.NOMBRES_PESTANAS}
+    armados = {}
+    for _ in range(rondas):
+        for indice, nombre in enumerate(main.NOMBRES_PESTANAS):
+            tiempos = {clave: instrumentacion.tiempos.setdefault(f"pestana.{nombre}.{clave}", [])
+                       for clave in ("construir", "refrescar")}
+            desde = {clave: len(lista) for clave, lista in tiempos.items()}
+            completas[nombre].append([medir_pestana(conexion, page, indice)[2] * 1000
+                                      for _ in range(max(1, repeticiones // rondas))])
+            for clave, lista in tiempos.items():
+                if lista[desde[clave]:]:
+                    armados.setdefault(f"pestana.{nombre}.{clave}", []).append(lista[desde[clave]:])
+
+    resultados = {nombre: resumir(rondas_armado) for nombre, rondas_armado in armados.items()}
+    for nombre in main.NOMBRES_PESTANAS:
+        resultados[f"pestana.{nombre}.completa"] = resumir(completas[nombre])
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def correr(args):
+    empresas, productos, movimientos = TAMANOS[args.tamano]
+    empresas = args.empresas or empresas
+    productos = args.productos or productos
+    movimientos = args.movimientos or movimientos
+    hasta = datetime.datetime.combine(args.hasta, datetime.time())
+    parametros = {"tamano": args.tamano, "empresas": empresas, "productos": productos, "movimientos": movimientos,
+                  "formal_ventas": FORMAL_VENTAS, "formal_compras": FORMAL_COMPRAS, "semilla": args.semilla,
+                  "hasta": args.hasta.isoformat(), "repeticiones": args.repeticiones, "escrituras": args.escrituras,
+                  "rondas": args.rondas}
+
+    carpeta = tempfile.mkdtemp()
+    original = args.base or os.path.join(carpeta, "original.db")
+    if os.path.exists(original):
+        print(f"Usando la base existente {original}")
+    else:
+        print(f"Generando {empresas} empresas, {productos:,} productos y {movimientos:,} movimientos ...")
+        generar_base(original, empresas, productos, movimientos, FORMAL_VENTAS, semilla=args.semilla,
+                     proporcion_formal_compras=FORMAL_COMPRAS, hasta=hasta).close()
+
+    # Cada corrida trabaja sobre una copia: las escrituras no alteran la base original
+    ruta = os.path.join(carpeta, "suite.db")
+    shutil.copyfile(original, ruta)
+    db = Database(ruta)
+    escenarios = escenarios_base(db, args.repeticiones, args.escrituras, args.semilla, args.rondas)
+    db.close()
+    if not args.sin_pestanas:
+        escenarios.update(escenarios_pestanas(ruta, max(args.rondas, args.repeticiones // 10), args.rondas))
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+    resultado = {
+        "formato": FORMATO,
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "entorno": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                    "plataforma": platform.platform(), "procesador": platform.machine()},
+        "parametros": parametros,
+        "escenarios": escenarios,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    print(f"{'escenario':<40}{'estable':>10}{'p50 (ms)':>11}{'p95 (ms)':>11}")
+    for nombre, r in escenarios.items():
+        p95 = f"{r['p95_ms']:>11.3f}" if "p95_ms" in r else f"{'-':>11}"
+        print(f"{nombre:<40}{r['estable_ms']:>10.3f}{r['p50_ms']:>11.3f}{p95}")
+    print(f"Resultados en {args.salida}")
+    return 0
+
+
+def estable(escenario):
+    return escenario.get("estable_ms", escenario["p50_ms"])
+
+
+def comparar(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding="utf-8") as f:
+        nuevo = json.load(f)
+    if base["parametros"] != nuevo["parametros"]:
+        print("⚠️ Las corridas usaron parámetros distintos: la comparación puede no ser válida")
+        for clave in sorted(set(base["parametros"]) | set(nuevo["parametros"])):
+            if base["parametros"].get(clave) != nuevo["parametros"].get(clave):
+                print(f"  {clave}: {base['parametros'].get(clave)} → {nuevo['parametros'].get(clave)}")
+
+    comunes = [n for n in base["escenarios"] if n in nuevo["escenarios"]]
+    # Si todo cambió en la misma proporción lo más probable es que haya cambiado la máquina
+    razones = [estable(nuevo["escenarios"][n]) / estable(base["escenarios"][n])
+               for n in comunes if estable(base["escenarios"][n])]
+    global_ = statistics.median(razones) if razones else 1.0
+    factor = global_ if args.normalizar else 1.0
+
+    print(f"{base.get('commit') or 'base'} → {nuevo.get('commit') or 'nuevo'} "
+          f"(tolerancia {args.tolerancia:.0%}, mínimo {args.minimo_ms} ms"
+          f"{f', normalizado por {global_ - 1:+.0%}' if args.normalizar else ''})")
+    print(f"{'escenario':<40}{'base (ms)':>11}{'nuevo (ms)':>12}{'cambio':>9}{'umbral':>9}")
+    regresiones = []
+    ruidosos = 0
+    for nombre in list(base["escenarios"]) + [n for n in nuevo["escenarios"] if n not in base["escenarios"]]:
+        antes, despues = base["escenarios"].get(nombre), nuevo["escenarios"].get(nombre)
+        if antes is None or despues is None:
+            print(f"{nombre:<40}{'(solo en ' + ('nuevo' if antes is None else 'base') + ')':>32}")
+            continue
+        a, d = estable(antes), estable(despues) / factor
+        cambio = (d - a) / a if a else 0.0
+        # Un escenario que ya varía entre rondas más que la tolerancia necesita un cambio mayor
+        umbral = max(args.tolerancia, antes.get("dispersion", 0), despues.get("dispersion", 0))
+        regresion = cambio > umbral and d - a > args.minimo_ms
+        mejora = cambio < -umbral and a - d > args.minimo_ms
+        marca = "  ⚠️ regresión" if regresion else ("  mejora" if mejora else "")
+        if umbral > args.tolerancia and not regresion:
+            marca += "  (ruidoso)"
+            ruidosos += 1
+        print(f"{nombre:<40}{a:>11.3f}{d:>12.3f}{cambio:>+9.0%}{umbral:>9.0%}{marca}")
+        if regresion:
+            regresiones.append(nombre)
+
+    if not args.normalizar and abs(global_ - 1) > args.tolerancia:
+        print(f"ℹ️ La mediana de todos los escenarios cambió {global_ - 1:+.0%}: si el código no tocó "
+              "algo común a todos, repetir en una máquina quieta o comparar con --normalizar")
+    if ruidosos:
+        print(f"ℹ️ {ruidosos} escenario(s) variaron entre rondas más que la tolerancia: "
+              "solo se marcan cambios mayores que esa variación")
+    if regresiones:
+        print(f"⚠️ {len(regresiones)} regresión(es): {', '.join(regresiones)}")
+        return 1
+    print("✅ Sin regresiones")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("correr", help="Ejecuta los escenarios y guarda los resultados en JSON")
+    p.add_argument("--salida", required=True, help="Archivo JSON de resultados")
+    p.add_argument("--tamano", choices=TAMANOS, default="chico")
+    p.add_argument("--empresas", type=int, help="Reemplaza el valor del tamaño")
+    p.add_argument("--productos", type=int, help="Reemplaza el valor del tamaño")
+    p.add_argument("--movimientos", type=int, help="Reemplaza el valor del tamaño")
+    p.add_argument("--semilla", type=int, default=42)
+    p.add_argument("--hasta", type=datetime.date.fromisoformat, default=datetime.date(2025, 12, 31),
+                   help="Último día de los movimientos (fijo para que las corridas sean comparables)")
+    p.add_argument("--repeticiones", type=int, default=200, help="Muestras por escenario de lectura")
+    p.add_argument("--escrituras", type=int, default=2000, help="Muestras de registrar_transaccion")
+    p.add_argument("--rondas", type=int, default=RONDAS, help="Rondas en que se alternan los escenarios")
+    p.add_argument("--base", help="Base sintética a reutilizar (se genera ahí si no existe)")
+    p.add_argument("--sin-pestanas", action="store_true", help="Solo los escenarios de la base (sin Flet)")
+    p.set_defaults(funcion=correr)
+
+    p = sub.add_parser("comparar", help="Compara dos corridas y marca regresiones")
+    p.add_argument("base")
+    p.add_argument("nuevo")
+    p.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Empeoramiento relativo permitido")
+    p.add_argument("--minimo-ms", type=float, default=MINIMO_MS, help="Diferencia absoluta mínima para marcar")
+    p.add_argument("--normalizar", action="store_true",
+                   help="Descuenta el cambio mediano de todos los escenarios (máquina más lenta o más rápida)")
+    p.set_defaults(funcion=comparar)
+
+    args = parser.parse_args(argv)
+    return args.funcion(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
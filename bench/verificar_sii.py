@@ -0,0 +1,84 @@
+"""Compara reporte_sii (agregación en SQLite) con el cálculo original fila a fila.
+
+Uso: python -m bench.verificar_sii [--movimientos 20000] [--semillas 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from database import Database, rango_periodo, segundos_epoca
+
+
+def reporte_sii_referencia(db, empresa_id, periodo=None):
+    """Algoritmo original: recorre cada movimiento formal en Python"""
+    cursor = db.conn.cursor()
+    cursor.execute("SELECT tipo, monto_total, fecha FROM movimientos WHERE empresa_id = ? AND es_formal = 1", (empresa_id,))
+    desde, hasta = rango_periodo(periodo) if periodo else (None, None)
+    iva_debito = iva_credito = total_ventas_bruto = total_compras_bruto = 0
+    for tipo, monto, fecha in cursor.fetchall():
+        if periodo and not (desde <= fecha < hasta):
+            continue
+        neto = int(monto / 1.19)
+        iva = monto - neto
+        if tipo == 'venta':
+            iva_debito += iva
+            total_ventas_bruto += monto
+        else:
+            iva_credito += iva
+            total_compras_bruto += monto
+    return total_ventas_bruto, total_compras_bruto, iva_debito, iva_credito
+
+
+def poblar(db, rnd, movimientos):
+    empresas = [db.agregar_empresa(f"Empresa {i}") for i in range(3)]
+    filas = []
+    for _ in range(movimientos):
+        # Montos variados, incluidos múltiplos de 119 y vecinos (bordes de redondeo)
+        eleccion = rnd.random()
+        if eleccion < 0.3:
+            monto = 119 * rnd.randint(1, 10**7) + rnd.choice((-1, 0, 1))
+        elif eleccion < 0.35:
+            monto = -rnd.randint(1, 10**6)  # notas de crédito / ajustes
+        else:
+            monto = rnd.randint(0, 10**9)
+        fecha = f"{rnd.randint(2022, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+        filas.append((rnd.choice(empresas), rnd.choice(('venta', 'compra')), rnd.randint(0, 1), fecha, monto,
+                      segundos_epoca(fecha)))
+    db.conn.executemany("INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, monto_total, fecha_ts) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", filas)
+    db.conn.commit()
+    db.reconstruir_saldos()
+    return empresas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=20000)
+    parser.add_argument("--semillas", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    errores = 0
+    comparaciones = 0
+    for semilla in range(args.semillas):
+        rnd = random.Random(semilla)
+        db = Database(os.path.join(tempfile.mkdtemp(), "verificar_sii.db"))
+        empresas = poblar(db, rnd, args.movimientos)
+        periodos = [None, "2023", "2025"] + [f"{rnd.randint(2022, 2025)}-{rnd.randint(1, 12):02d}" for _ in range(6)]
+        for emp_id in empresas:
+            for periodo in periodos:
+                esperado = reporte_sii_referencia(db, emp_id, periodo)
+                obtenido = db.reporte_sii(emp_id, periodo)
+                comparaciones += 1
+                if esperado != obtenido:
+                    errores += 1
+                    print(f"❌ semilla={semilla} empresa={emp_id} periodo={periodo}: {esperado} != {obtenido}")
+        db.conn.close()
+
+    print(f"{comparaciones} comparaciones, {errores} diferencias")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
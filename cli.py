@@ -0,0 +1,282 @@
+import argparse
+import datetime
+import sys
+
+from database import BLOQUE_CONCILIACION, BLOQUE_RESPALDO, Database, rango_periodo, ruta_por_defecto
+import exportador
+import importador
+import respaldo
+import sincronizacion
+
+MAX_LISTADO = 50  # Diferencias que se muestran en pantalla (el resto solo se cuenta)
+
+
+# --- Comandos ---
+def cmd_saldos(db, args):
+    if args.reconstruir:
+        diferencias = db.reconstruir_saldos()
+    else:
+        diferencias = db.verificar_saldos()
+
+    if not diferencias:
+        print("✅ Saldos consistentes con movimientos")
+        return 0
+
+    print(f"⚠️ {len(diferencias)} diferencia(s) encontradas:")
+    for emp_id, tipo, es_formal, guardado, real, movs_guardados, movs_reales, iva_guardado, iva_real in diferencias:
+        formal = "formal" if es_formal else "informal"
+        print(f"  Empresa {emp_id} · {tipo} {formal}: guardado ${guardado:,.0f} ({movs_guardados} movs, "
+              f"IVA ${iva_guardado:,.0f}) vs real ${real:,.0f} ({movs_reales} movs, IVA ${iva_real:,.0f})")
+    if args.reconstruir:
+        print("🔧 Saldos reconstruidos desde movimientos")
+        return 0
+    return 1
+
+
+def cmd_conciliar(db, args):
+    codigo = 0
+    if args.integridad:
+        problemas = db.verificar_integridad()
+        if problemas:
+            print(f"⚠️ El archivo tiene {len(problemas)} problema(s) de integridad:")
+            for problema in problemas[:MAX_LISTADO]:
+                print(f"  {problema}")
+            codigo = 1
+        else:
+            print("✅ Archivo íntegro (quick_check)")
+
+    def progreso(avance, hasta):
+        print(f"\r  {avance:,} de {hasta:,} movimientos", end="", flush=True)
+
+    diferencias = db.conciliar_stock(args.empresa, reparar=args.reparar, bloque=args.bloque, progreso=progreso)
+    print()
+    if not diferencias:
+        print("✅ Stock consistente con movimientos")
+        return codigo
+
+    print(f"⚠️ {len(diferencias):,} producto(s) con stock distinto a sus movimientos:")
+    for emp_id, prod_id, nombre, guardado, real in diferencias[:MAX_LISTADO]:
+        print(f"  Empresa {emp_id} · {nombre} (#{prod_id}): guardado {guardado:,} vs real {real:,}")
+    if len(diferencias) > MAX_LISTADO:
+        print(f"  ... y {len(diferencias) - MAX_LISTADO:,} más")
+    if args.reparar:
+        print("🔧 Stock corregido desde movimientos")
+        return codigo
+    return 1
+
+
+def cmd_importar(db, args):
+    def progreso(r):
+        print(f"\r  {r.leidas:,} filas · {r.filas_por_segundo:,.0f} filas/s · {r.rechazadas:,} rechazadas",
+              end="", flush=True)
+
+    importar = importador.IMPORTADORES[args.tipo]
+    resultado = importar(db, args.empresa, args.archivo, bloque=args.bloque, progreso=progreso)
+    print()
+    print(f"✅ {resultado.importadas:,} de {resultado.leidas:,} filas importadas en {resultado.segundos:.1f}s "
+          f"({resultado.filas_por_segundo:,.0f} filas/s)")
+    if args.tipo == "productos":
+        print(f"  {resultado.insertados:,} productos nuevos · {resultado.actualizados:,} actualizados")
+    if resultado.rechazadas:
+        print(f"⚠️ {resultado.rechazadas:,} filas rechazadas:")
+        for linea, mensaje in resultado.errores:
+            print(f"  línea {linea}: {mensaje}")
+        if resultado.rechazadas > len(resultado.errores):
+            print(f"  ... y {resultado.rechazadas - len(resultado.errores):,} más")
+        return 1
+    return 0
+
+
+def cmd_exportar(db, args):
+    desde, hasta = args.desde, args.hasta
+    if args.periodo:
+        desde, fin = rango_periodo(args.periodo)
+        hasta = (datetime.date.fromisoformat(fin) - datetime.timedelta(days=1)).isoformat()
+    es_formal = True if args.formal else False if args.informal else None
+
+    def progreso(r):
+        print(f"\r  {r.filas:,} filas · {r.filas_por_segundo:,.0f} filas/s", end="", flush=True)
+
+    resultado = exportador.exportar_movimientos(
+        db, args.archivo, formato=args.formato, comprimir=True if args.gzip else None,
+        empresa_id=args.empresa, desde=desde, hasta=hasta, es_formal=es_formal, progreso=progreso
+    )
+    print()
+    print(f"✅ {resultado.filas:,} movimientos exportados a {resultado.ruta} en {resultado.segundos:.1f}s "
+          f"({resultado.filas_por_segundo:,.0f} filas/s, {resultado.bytes / 1e6:,.1f} MB)")
+    return 0
+
+
+def cmd_sincronizar(db, args):
+    central = sincronizacion.Central(args.central)
+
+    def progreso(r):
+        print(f"\r  ↑{r.enviados:,} ↓{r.recibidos:,} filas · {r.paquetes} paquetes", end="", flush=True)
+
+    resultado = sincronizacion.sincronizar(db, central, tamano=args.lote, progreso=progreso)
+    print()
+    total = resultado.bytes_enviados + resultado.bytes_recibidos
+    print(f"✅ {resultado.enviados:,} filas enviadas y {resultado.recibidos:,} recibidas en {resultado.segundos:.1f}s "
+          f"({total / 1e3:,.0f} KB comprimidos, x{resultado.compresion:.1f})")
+    if resultado.stock_corregido:
+        print(f"  Stock reconstruido en {resultado.stock_corregido:,} productos")
+    return 0
+
+
+def cmd_consolidado(db, args):
+    filas, total = db.reporte_consolidado(args.periodo)
+    print(f"Consolidado {args.periodo or 'de todo el historial'} ({len(filas)} empresas activas)")
+    print(f"{'empresa':<24}{'ventas':>16}{'compras':>16}{'IVA débito':>14}{'IVA crédito':>14}{'inventario':>16}")
+    for _, nombre, ventas, compras, _, _, debito, credito, valor in filas + [total]:
+        inventario = "calculando" if valor is None else f"{valor:,.0f}"
+        print(f"{nombre[:23]:<24}{ventas:>16,.0f}{compras:>16,.0f}{debito:>14,.0f}{credito:>14,.0f}{inventario:>16}")
+    return 0
+
+
+def cmd_migrar(db, args):
+    if db.fecha_ts_lista and db.costos_listos:
+        print("✅ Sin migraciones pendientes")
+        return 0
+
+    for nombre, completar in (("fecha_ts", db.completar_fecha_ts), ("costos", db.completar_costos)):
+        def progreso(avance, hasta):
+            print(f"\r  {nombre}: {avance:,} de {hasta:,} movimientos", end="", flush=True)
+
+        opciones = {"bloque": args.bloque} if args.bloque else {}
+        completar(progreso=progreso, **opciones)
+    print()
+    print("✅ Migraciones completadas")
+    return 0
+
+
+def cmd_archivar(db, args):
+    if args.anio is not None:
+        try:
+            movidos = db.archivar_anio(args.anio, compactar=args.compactar)
+        except (ValueError, FileNotFoundError) as e:
+            print(f"⚠️ {e}")
+            return 1
+        print(f"✅ {movidos:,} movimientos de {args.anio} archivados")
+    for anio, ruta, movimientos in db.anios_archivados():
+        print(f"  {anio}: {movimientos:,} movimientos en {ruta}")
+    return 0
+
+
+def cmd_respaldar(db, args):
+    def progreso(copiadas, total):
+        print(f"\r  {copiadas:,} de {total:,} páginas", end="", flush=True)
+
+    try:
+        r = respaldo.respaldar(db, args.carpeta, args.conservar, args.paginas, verificar=not args.sin_verificar,
+                               progreso=progreso)
+    except (OSError, ValueError) as e:
+        print(f"\n⚠️ {e}")
+        return 1
+    print()
+    print(f"✅ {r.ruta}: {r.bytes_base / 1e6:,.1f} MB copiados a {r.mb_por_segundo:,.1f} MB/s, "
+          f"{r.bytes / 1e6:,.1f} MB comprimido, {r.segundos:.1f} s en total")
+    for ruta in r.archivos:
+        print(f"  Año archivado respaldado: {ruta}")
+    for ruta in r.borrados:
+        print(f"  Copia antigua borrada: {ruta}")
+    for ruta in r.faltantes:
+        print(f"  ⚠️ Falta el archivo de un año archivado: {ruta}")
+    return 1 if r.faltantes else 0
+
+
+def cmd_restaurar(db, args):
+    destino = args.db or ruta_por_defecto()
+    try:
+        restaurados, faltantes = respaldo.restaurar(args.respaldo, destino, reemplazar=args.reemplazar)
+    except FileExistsError as e:
+        print(f"⚠️ {e}: agregue --reemplazar (con la app cerrada)")
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"⚠️ {e}")
+        return 1
+    print(f"✅ {args.respaldo} restaurado en {destino}")
+    for ruta in restaurados:
+        print(f"  Año archivado restaurado: {ruta}")
+    for ruta in faltantes:
+        print(f"  ⚠️ Falta el archivo de un año archivado: {ruta}")
+    return 1 if faltantes else 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Herramientas de mantenimiento de JEmpressa")
+    parser.add_argument("--db", help="Ruta de la base de datos (por defecto ~/erp_empresas.db)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_saldos = sub.add_parser("saldos", help="Verifica los saldos acumulados contra movimientos")
+    p_saldos.add_argument("--reconstruir", action="store_true", help="Recalcula los saldos y corrige diferencias")
+    p_saldos.set_defaults(func=cmd_saldos)
+
+    p_conciliar = sub.add_parser("conciliar", help="Verifica el stock de cada producto contra sus movimientos")
+    p_conciliar.add_argument("--empresa", type=int, help="ID de la empresa (por defecto todas)")
+    p_conciliar.add_argument("--reparar", action="store_true", help="Corrige el stock que no coincide")
+    p_conciliar.add_argument("--integridad", action="store_true", help="Revisa además el archivo (PRAGMA quick_check)")
+    p_conciliar.add_argument("--bloque", type=int, default=BLOQUE_CONCILIACION, help="Movimientos por consulta")
+    p_conciliar.set_defaults(func=cmd_conciliar)
+
+    p_importar = sub.add_parser("importar", help="Importa productos o movimientos desde CSV/JSONL (.gz opcional)")
+    p_importar.add_argument("tipo", choices=sorted(importador.IMPORTADORES))
+    p_importar.add_argument("archivo")
+    p_importar.add_argument("--empresa", type=int, required=True, help="ID de la empresa destino")
+    p_importar.add_argument("--bloque", type=int, default=importador.BLOQUE, help="Filas por transacción")
+    p_importar.set_defaults(func=cmd_importar)
+
+    p_exportar = sub.add_parser("exportar", help="Exporta el libro de movimientos a CSV/JSONL (.gz opcional)")
+    p_exportar.add_argument("archivo", help="Destino; el formato se deduce de la extensión (.csv, .jsonl, .gz)")
+    p_exportar.add_argument("--formato", choices=exportador.FORMATOS)
+    p_exportar.add_argument("--gzip", action="store_true", help="Comprimir aunque la ruta no termine en .gz")
+    p_exportar.add_argument("--empresa", type=int, help="ID de la empresa (por defecto todas)")
+    p_exportar.add_argument("--desde", help="Fecha inicial AAAA-MM-DD")
+    p_exportar.add_argument("--hasta", help="Fecha final AAAA-MM-DD (inclusiva)")
+    p_exportar.add_argument("--periodo", help="Periodo tributario AAAA-MM o AAAA (reemplaza --desde/--hasta)")
+    formalidad = p_exportar.add_mutually_exclusive_group()
+    formalidad.add_argument("--formal", action="store_true", help="Solo movimientos formales (libro SII)")
+    formalidad.add_argument("--informal", action="store_true", help="Solo movimientos informales")
+    p_exportar.set_defaults(func=cmd_exportar)
+
+    p_consolidado = sub.add_parser("consolidado", help="Ventas, compras, IVA e inventario de todas las empresas activas")
+    p_consolidado.add_argument("--periodo", help="Periodo AAAA-MM o AAAA (por defecto todo el historial)")
+    p_consolidado.set_defaults(func=cmd_consolidado)
+
+    p_migrar = sub.add_parser("migrar", help="Completa ahora las migraciones que se aplican por bloques")
+    p_migrar.add_argument("--bloque", type=int, help="Filas por transacción (por defecto, el de cada tarea)")
+    p_migrar.set_defaults(func=cmd_migrar)
+
+    p_sincronizar = sub.add_parser("sincronizar", help="Envía y recibe los cambios pendientes contra una base central")
+    p_sincronizar.add_argument("central", help="Ruta de la base central (p. ej. en una carpeta compartida)")
+    p_sincronizar.add_argument("--lote", type=int, default=sincronizacion.TAMANO_LOTE, help="Cambios por paquete")
+    p_sincronizar.set_defaults(func=cmd_sincronizar)
+
+    p_archivar = sub.add_parser("archivar", help="Mueve un año cerrado a su propio archivo (sin año, lista los archivados)")
+    p_archivar.add_argument("anio", type=int, nargs="?", help="Año a archivar (AAAA)")
+    p_archivar.add_argument("--compactar", action="store_true", help="VACUUM al final para liberar el espacio en disco")
+    p_archivar.set_defaults(func=cmd_archivar)
+
+    p_respaldar = sub.add_parser("respaldar", help="Copia comprimida de la base sin cerrar la app, con rotación")
+    p_respaldar.add_argument("carpeta", help="Carpeta de las copias (<base>_AAAAMMDD-HHMMSS.db.gz)")
+    p_respaldar.add_argument("--conservar", type=int, default=respaldo.CONSERVAR, help="Copias que se mantienen")
+    p_respaldar.add_argument("--paginas", type=int, default=BLOQUE_RESPALDO, help="Páginas por paso de la copia")
+    p_respaldar.add_argument("--sin-verificar", action="store_true", help="No pasar PRAGMA quick_check a la copia")
+    p_respaldar.set_defaults(func=cmd_respaldar)
+
+    p_restaurar = sub.add_parser("restaurar", help="Restaura una copia en --db (con la app cerrada)")
+    p_restaurar.add_argument("respaldo", help="Copia .db.gz (o .db)")
+    p_restaurar.add_argument("--reemplazar", action="store_true", help="Sobrescribir la base si ya existe")
+    p_restaurar.set_defaults(func=cmd_restaurar, sin_base=True)
+
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    # restaurar no abre la base: la crearía (y migraría) antes de sobrescribirla
+    db = None if getattr(args, "sin_base", False) else Database(args.db)
+    return args.func(db, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+from collections import deque
+
+# --- Costeo de Inventario (FIFO y Promedio Ponderado) ---
+# Cada producto lleva su estado de costo: unidades, valor del inventario y costo de lo
+# vendido (CMV) por ambos métodos a la vez, así que cambiar de método no recalcula nada.
+# FIFO guarda además las capas de compra aún no vendidas, de la más antigua a la más
+# nueva. Los montos son enteros (pesos brutos, como en movimientos) y todo redondeo es
+# determinista: aplicar los movimientos de a uno o rehacer la historia da lo mismo.
+# Lo vendido sin stock se costea al último costo de compra y se ajusta a su costo real
+# cuando llega la compra que lo cubre.
+
+METODOS = {
+    "fifo": ("valor_fifo", "cmv_fifo"),
+    "promedio": ("valor_promedio", "cmv_promedio"),
+}
+NOMBRES_METODO = {"fifo": "FIFO", "promedio": "Promedio ponderado"}
+
+
+def validar_metodo(metodo):
+    if metodo not in METODOS:
+        raise ValueError(f"Método de costeo inválido: {metodo!r} (use {', '.join(METODOS)})")
+    return metodo
+
+
+def _parte(monto, parte, total):
+    """Monto proporcional a parte/total redondeado; el monto exacto si parte == total"""
+    if parte == total:
+        return monto
+    return (2 * monto * parte + total) // (2 * total)
+
+
+class EstadoCosto:
+    """Estado de costo de un producto; capas = [id (None si aún no se guarda), cantidad, monto]"""
+
+    __slots__ = ("cantidad", "valor_fifo", "valor_promedio", "cmv_fifo", "cmv_promedio", "ultimo_costo",
+                 "capas", "borradas", "modificada")
+
+    def __init__(self, cantidad=0, valor_fifo=0, valor_promedio=0, cmv_fifo=0, cmv_promedio=0, ultimo_costo=0):
+        self.cantidad = cantidad
+        self.valor_fifo = valor_fifo
+        self.valor_promedio = valor_promedio
+        self.cmv_fifo = cmv_fifo
+        self.cmv_promedio = cmv_promedio
+        self.ultimo_costo = ultimo_costo
+        self.capas = deque()
+        self.borradas = []  # ids de capas guardadas que se vendieron completas
+        self.modificada = None  # Capa guardada vendida en parte (siempre la más antigua)
+
+    def fila(self):
+        return (self.cantidad, self.valor_fifo, self.valor_promedio, self.cmv_fifo, self.cmv_promedio,
+                self.ultimo_costo)
+
+    def comprar(self, cantidad, monto):
+        self.ultimo_costo = _parte(monto, 1, cantidad)
+        faltante = min(cantidad, max(-self.cantidad, 0))
+        real = 0
+        if faltante:
+            # Unidades ya vendidas sin stock: su costo estimado pasa a ser el real
+            real = _parte(monto, faltante, cantidad)
+            estimado_fifo = _parte(-self.valor_fifo, faltante, -self.cantidad)
+            estimado_promedio = _parte(-self.valor_promedio, faltante, -self.cantidad)
+            self.valor_fifo += estimado_fifo
+            self.valor_promedio += estimado_promedio
+            self.cmv_fifo += real - estimado_fifo
+            self.cmv_promedio += real - estimado_promedio
+        if cantidad > faltante:
+            self.capas.append([None, cantidad - faltante, monto - real])
+            self.valor_fifo += monto - real
+            self.valor_promedio += monto - real
+        self.cantidad += cantidad
+
+    def vender(self, cantidad):
+        """Saca unidades del inventario; requiere cargadas las capas guardadas que cubren lo vendido"""
+        disponible = max(self.cantidad, 0)
+        de_stock = min(cantidad, disponible)
+        estimado = (cantidad - de_stock) * self.ultimo_costo
+        costo_promedio = _parte(self.valor_promedio, de_stock, disponible) if de_stock else 0
+
+        costo_fifo = 0
+        resto = de_stock
+        while resto and self.capas:
+            capa = self.capas[0]
+            tomar = min(resto, capa[1])
+            monto = _parte(capa[2], tomar, capa[1])
+            costo_fifo += monto
+            capa[1] -= tomar
+            capa[2] -= monto
+            resto -= tomar
+            if capa[1] == 0:
+                self.capas.popleft()
+                if capa[0] is not None:
+                    self.borradas.append(capa[0])
+            elif capa[0] is not None:
+                self.modificada = capa
+        costo_fifo += resto * self.ultimo_costo  # Capas incompletas: no debería ocurrir
+
+        self.valor_fifo -= costo_fifo + estimado
+        self.valor_promedio -= costo_promedio + estimado
+        self.cmv_fifo += costo_fifo + estimado
+        self.cmv_promedio += costo_promedio + estimado
+        self.cantidad -= cantidad
@@ -0,0 +1,1970 @@
+import sqlite3
+import datetime
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from costeo import METODOS, EstadoCosto, validar_metodo
+
+# --- Migraciones de Esquema ---
+# Cada migración recibe un cursor dentro de una transacción abierta y deja el
+# esquema en la versión indicada. Deben poder re-ejecutarse sobre bases que ya
+# tengan parte de los cambios (IF NOT EXISTS).
+
+def _recalcular_saldos(cursor):
+    # Antes de la migración 9 los saldos no llevan IVA
+    con_iva = "iva" in _columnas(cursor, "saldos")
+    cursor.execute("DELETE FROM saldos")
+    cursor.execute(f"""
+        INSERT INTO saldos (empresa_id, tipo, es_formal, monto_total, movimientos{', iva' if con_iva else ''})
+        SELECT empresa_id, tipo, es_formal, COALESCE(SUM(monto_total), 0), COUNT(*){f', SUM({SQL_IVA})' if con_iva else ''}
+        FROM movimientos
+        GROUP BY empresa_id, tipo, es_formal
+    """)
+    # Los años archivados ya no están en movimientos: suman lo que dejaron en archivo_resumen
+    if _columnas(cursor, "archivo_resumen"):
+        cursor.execute("""
+            INSERT INTO saldos (empresa_id, tipo, es_formal, monto_total, movimientos, iva)
+            SELECT empresa_id, tipo, es_formal, SUM(monto_total), SUM(movimientos), SUM(iva)
+            FROM archivo_resumen WHERE 1 = 1
+            GROUP BY empresa_id, tipo, es_formal
+            ON CONFLICT (empresa_id, tipo, es_formal) DO UPDATE SET
+                monto_total = monto_total + excluded.monto_total,
+                movimientos = movimientos + excluded.movimientos, iva = iva + excluded.iva
+        """)
+
+
+def _migracion_saldos(cursor):
+    # Tabla Saldos (totales acumulados por empresa, tipo y formalidad)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saldos (
+            empresa_id INTEGER,
+            tipo TEXT,
+            es_formal INTEGER,
+            monto_total INTEGER DEFAULT 0,
+            movimientos INTEGER DEFAULT 0,
+            PRIMARY KEY (empresa_id, tipo, es_formal)
+        )
+    """)
+    # Base existente: calcular los saldos desde el historial
+    _recalcular_saldos(cursor)
+
+
+def _migracion_indices(cursor):
+    for sql in INDICES:
+        cursor.execute(sql)
+
+
+# Índices de consulta por empresa. El de movimientos incluye monto_total para
+# que los reportes se resuelvan solo con el índice.
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_empresa ON movimientos (empresa_id, es_formal, tipo, fecha, monto_total)",
+    "CREATE INDEX IF NOT EXISTS idx_productos_empresa ON productos (empresa_id)",
+]
+
+def _migracion_nombre_productos(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos (empresa_id, nombre)")
+
+
+def _migracion_busqueda_productos(cursor):
+    # Índice FTS5 sobre nombres, sincronizado por triggers. Si la compilación de
+    # SQLite no trae FTS5, la búsqueda usa LIKE (ver Database.buscar_productos).
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                nombre, content='productos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts (rowid, nombre) VALUES (new.id, new.nombre);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF nombre ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+            INSERT INTO productos_fts (rowid, nombre) VALUES (new.id, new.nombre);
+        END
+    """)
+    cursor.execute("INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')")
+
+
+def _columnas(cursor, tabla):
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    return {fila[1] for fila in cursor.fetchall()}
+
+
+def _migracion_sincronizacion(cursor):
+    # uid global de filas recibidas de otro equipo ("nodo:id" de origen). NULL = creada
+    # aquí: su uid es el nodo local + id. El stock no se sincroniza, se deriva de movimientos.
+    for tabla in ("productos", "movimientos"):
+        if "uid" not in _columnas(cursor, tabla):
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN uid TEXT")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{tabla}_uid ON {tabla} (uid) WHERE uid IS NOT NULL")
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS sync_nodo (id TEXT NOT NULL)")
+    cursor.execute("INSERT INTO sync_nodo (id) SELECT lower(hex(randomblob(8))) WHERE NOT EXISTS (SELECT 1 FROM sync_nodo)")
+    # Registro de cambios: origen = par del que llegó la fila (no se le devuelve)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cambios (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            fila_id INTEGER NOT NULL,
+            origen TEXT
+        )
+    """)
+    # Marcas de agua por par: último seq local enviado y último seq remoto recibido
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_estado (
+            par TEXT PRIMARY KEY,
+            enviado INTEGER,
+            recibido INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS cambios_movimientos_ai AFTER INSERT ON movimientos BEGIN
+            INSERT INTO cambios (tabla, fila_id) VALUES ('movimientos', new.id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS cambios_productos_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO cambios (tabla, fila_id) VALUES ('productos', new.id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS cambios_productos_au AFTER UPDATE OF nombre, precio_venta, costo_unitario ON productos
+        WHEN old.nombre IS NOT new.nombre OR old.precio_venta IS NOT new.precio_venta
+             OR old.costo_unitario IS NOT new.costo_unitario
+        BEGIN
+            INSERT INTO cambios (tabla, fila_id) VALUES ('productos', new.id);
+        END
+    """)
+    # Base existente: todo el historial queda pendiente para la primera sincronización
+    cursor.execute("SELECT 1 FROM cambios LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.execute("INSERT INTO cambios (tabla, fila_id) SELECT 'productos', id FROM productos ORDER BY id")
+        cursor.execute("INSERT INTO cambios (tabla, fila_id) SELECT 'movimientos', id FROM movimientos ORDER BY id")
+
+
+# Día como entero (días desde 1970-01-01): julianday de 'AAAA-MM-DD' cae en x.5 exacto
+SQL_DIA = "CAST(julianday(substr(fecha, 1, 10)) - 2440587.5 AS INTEGER)"
+
+
+def _recalcular_resumen_diario(cursor):
+    # Antes de la migración 7 (o con filas aún sin rellenar) el día sale del texto
+    dia = f"COALESCE(fecha_ts / 86400, {SQL_DIA})" if "fecha_ts" in _columnas(cursor, "movimientos") else SQL_DIA
+    con_iva = "iva" in _columnas(cursor, "resumen_diario")
+    cursor.execute("DELETE FROM resumen_diario")
+    cursor.execute(f"""
+        INSERT INTO resumen_diario (empresa_id, dia, tipo, es_formal, monto_total, movimientos{', iva' if con_iva else ''})
+        SELECT empresa_id, {dia}, tipo, es_formal, SUM(monto_total), COUNT(*){f', SUM({SQL_IVA})' if con_iva else ''}
+        FROM movimientos
+        GROUP BY 1, 2, 3, 4
+    """)
+    if _columnas(cursor, "archivo_resumen"):
+        cursor.execute("""
+            INSERT INTO resumen_diario (empresa_id, dia, tipo, es_formal, monto_total, movimientos, iva)
+            SELECT empresa_id, dia, tipo, es_formal, SUM(monto_total), SUM(movimientos), SUM(iva)
+            FROM archivo_resumen WHERE 1 = 1
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (empresa_id, dia, tipo, es_formal) DO UPDATE SET
+                monto_total = monto_total + excluded.monto_total,
+                movimientos = movimientos + excluded.movimientos, iva = iva + excluded.iva
+        """)
+
+
+def _migracion_resumen_diario(cursor):
+    # Totales por empresa, día, tipo y formalidad para gráficos de tendencia
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            empresa_id INTEGER,
+            dia INTEGER,
+            tipo TEXT,
+            es_formal INTEGER,
+            monto_total INTEGER DEFAULT 0,
+            movimientos INTEGER DEFAULT 0,
+            PRIMARY KEY (empresa_id, dia, tipo, es_formal)
+        ) WITHOUT ROWID
+    """)
+    _recalcular_resumen_diario(cursor)
+
+
+# Segundos desde 1970 de la fecha tal como se escribe (hora local, sin zona horaria)
+SQL_FECHA_TS = "CAST(strftime('%s', fecha) AS INTEGER)"
+# Reemplaza a idx_movimientos_empresa (texto) cuando fecha_ts está completa. Es parcial
+# para crearlo vacío al migrar: cada bloque del relleno agrega sus filas, y no hay un
+# CREATE INDEX final que ordene la tabla entera con la base bloqueada.
+INDICE_FECHA_TS = ("CREATE INDEX IF NOT EXISTS idx_movimientos_empresa_ts "
+                   "ON movimientos (empresa_id, es_formal, tipo, fecha_ts, monto_total) WHERE fecha_ts IS NOT NULL")
+
+
+def _migracion_fecha_ts(cursor):
+    # Solo agrega la columna y anota la tarea: las filas existentes se rellenan por
+    # bloques fuera de esta transacción (Database.completar_fecha_ts), sin bloquear la base.
+    if "fecha_ts" not in _columnas(cursor, "movimientos"):
+        cursor.execute("ALTER TABLE movimientos ADD COLUMN fecha_ts INTEGER")
+    cursor.execute(INDICE_FECHA_TS)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tareas (
+            nombre TEXT PRIMARY KEY,
+            avance INTEGER NOT NULL,
+            hasta INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos")
+    cursor.execute("INSERT OR IGNORE INTO tareas (nombre, avance, hasta) VALUES ('fecha_ts', 0, ?)",
+                   (cursor.fetchone()[0],))
+
+
+def _migracion_costeo(cursor):
+    # Estado de costo por producto (ambos métodos) y capas FIFO. Los movimientos
+    # existentes se valorizan por bloques fuera de esta transacción (Database.completar_costos).
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS costos (
+            producto_id INTEGER PRIMARY KEY,
+            empresa_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            valor_fifo INTEGER NOT NULL,
+            valor_promedio INTEGER NOT NULL,
+            cmv_fifo INTEGER NOT NULL,
+            cmv_promedio INTEGER NOT NULL,
+            ultimo_costo INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_costos_empresa ON costos (empresa_id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS capas_costo (
+            id INTEGER PRIMARY KEY,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            monto INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_capas_producto ON capas_costo (producto_id, id)")
+    if "metodo_costeo" not in _columnas(cursor, "empresas"):
+        cursor.execute("ALTER TABLE empresas ADD COLUMN metodo_costeo TEXT NOT NULL DEFAULT 'fifo'")
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos")
+    cursor.execute("INSERT OR IGNORE INTO tareas (nombre, avance, hasta) VALUES ('costos', 0, ?)",
+                   (cursor.fetchone()[0],))
+
+
+def _migracion_iva_acumulado(cursor):
+    # IVA (bruto - neto truncado por movimiento, como reporte_sii) junto a cada total, para
+    # reportar varias empresas o periodos sin recorrer movimientos
+    for tabla in ("saldos", "resumen_diario"):
+        if "iva" not in _columnas(cursor, tabla):
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN iva INTEGER NOT NULL DEFAULT 0")
+    _recalcular_saldos(cursor)
+    _recalcular_resumen_diario(cursor)
+
+
+def _migracion_historial(cursor):
+    # Historial por clave (fecha, id), del más nuevo al más antiguo: el id va implícito al
+    # final de cada índice, así que ORDER BY fecha DESC, id DESC no necesita ordenar
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos (empresa_id, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos (producto_id, fecha)")
+
+
+def _migracion_archivo(cursor):
+    # Años cerrados movidos a un archivo propio (ver Database.archivar_anio). Lo que dejan en
+    # la base: totales por día (para rehacer saldos y resumen diario) y por producto (stock)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archivos (
+            anio INTEGER PRIMARY KEY,
+            archivo TEXT NOT NULL,  -- Nombre del archivo, en la misma carpeta que la base
+            movimientos INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archivo_resumen (
+            anio INTEGER,
+            empresa_id INTEGER,
+            dia INTEGER,
+            tipo TEXT,
+            es_formal INTEGER,
+            monto_total INTEGER DEFAULT 0,
+            movimientos INTEGER DEFAULT 0,
+            iva INTEGER DEFAULT 0,
+            PRIMARY KEY (anio, empresa_id, dia, tipo, es_formal)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archivo_stock (
+            anio INTEGER,
+            producto_id INTEGER,
+            empresa_id INTEGER,
+            cantidad INTEGER DEFAULT 0,
+            PRIMARY KEY (anio, producto_id)
+        ) WITHOUT ROWID
+    """)
+
+
+MIGRACIONES = [
+    (1, "Tabla de saldos acumulados", _migracion_saldos),
+    (2, "Índices por empresa en movimientos y productos", _migracion_indices),
+    (3, "Índice de productos por nombre (importación)", _migracion_nombre_productos),
+    (4, "Búsqueda de productos (FTS5)", _migracion_busqueda_productos),
+    (5, "Registro de cambios para sincronización", _migracion_sincronizacion),
+    (6, "Resumen diario de ventas y compras", _migracion_resumen_diario),
+    (7, "Fecha entera (fecha_ts) en movimientos", _migracion_fecha_ts),
+    (8, "Costeo de inventario FIFO y promedio ponderado", _migracion_costeo),
+    (9, "IVA acumulado en saldos y resumen diario", _migracion_iva_acumulado),
+    (10, "Índices del historial de movimientos", _migracion_historial),
+    (11, "Archivo de años cerrados", _migracion_archivo),
+]
+ESQUEMA_VERSION = MIGRACIONES[-1][0]
+
+
+# --- Utilidades Contables ---
+# Neto de un monto bruto con IVA 19% incluido. Equivale exactamente a
+# int(monto_total / 1.19): la división entera de SQLite trunca hacia cero.
+SQL_NETO = "((monto_total * 100) / 119)"
+# IVA de un movimiento: solo los formales lo tienen
+SQL_IVA = f"CASE WHEN es_formal = 1 THEN monto_total - {SQL_NETO} ELSE 0 END"
+
+
+def iva_incluido(monto_total):
+    """IVA de un monto bruto, igual que monto_total - SQL_NETO (la división trunca hacia cero)"""
+    neto = abs(monto_total) * 100 // 119
+    return monto_total - (neto if monto_total >= 0 else -neto)
+
+
+def rango_periodo(periodo):
+    """Devuelve el rango [desde, hasta) de fechas de un periodo 'AAAA-MM' o 'AAAA'"""
+    try:
+        if len(periodo) == 7:
+            anio, mes = int(periodo[:4]), int(periodo[5:7])
+            desde = datetime.date(anio, mes, 1)
+            hasta = datetime.date(anio + (mes == 12), mes % 12 + 1, 1)
+        elif len(periodo) == 4:
+            anio = int(periodo)
+            desde, hasta = datetime.date(anio, 1, 1), datetime.date(anio + 1, 1, 1)
+        else:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"Periodo inválido: {periodo!r} (use 'AAAA-MM' o 'AAAA')") from None
+    return desde.strftime("%Y-%m-%d"), hasta.strftime("%Y-%m-%d")
+
+
+FORMATOS_FECHA = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+def validar_fecha(fecha):
+    """Devuelve la fecha si es 'AAAA-MM-DD[ HH:MM[:SS]]' válida (con ceros: '2024-1-5' no vale)"""
+    for formato in FORMATOS_FECHA:
+        try:
+            if datetime.datetime.strptime(fecha, formato).strftime(formato) == fecha:
+                return fecha
+        except (TypeError, ValueError):
+            pass
+    raise ValueError(f"fecha inválida: {fecha!r} (use AAAA-MM-DD HH:MM)")
+
+
+_ORDINAL_EPOCA = datetime.date(1970, 1, 1).toordinal()
+
+
+def numero_dia(fecha):
+    """Número de día (desde 1970-01-01) de una fecha 'AAAA-MM-DD[ HH:MM]' o date"""
+    if isinstance(fecha, str):
+        fecha = datetime.date(int(fecha[:4]), int(fecha[5:7]), int(fecha[8:10]))
+    return fecha.toordinal() - _ORDINAL_EPOCA
+
+
+def segundos_epoca(fecha):
+    """Valor de fecha_ts para una fecha 'AAAA-MM-DD[ HH:MM[:SS]]' (igual que SQL_FECHA_TS)"""
+    segundos = numero_dia(fecha) * 86400
+    if len(fecha) >= 16:
+        segundos += int(fecha[11:13]) * 3600 + int(fecha[14:16]) * 60
+        if len(fecha) >= 19:
+            segundos += int(fecha[17:19])
+    return segundos
+
+
+# Agrupaciones de resumen_diario: etiqueta del periodo calculada desde el número de día
+# (la semana empieza el lunes; el 1970-01-01 fue jueves)
+AGRUPACIONES = {
+    "dia": "date(dia * 86400, 'unixepoch')",
+    "semana": "date((dia - (dia + 3) % 7) * 86400, 'unixepoch')",
+    "mes": "strftime('%Y-%m', dia * 86400, 'unixepoch')",
+}
+
+
+# Columnas de iterar_movimientos y pagina_movimientos (m = movimientos, p = productos): con el
+# nombre del producto y, para movimientos formales, el neto e IVA como en reporte_sii
+_NETO_M = SQL_NETO.replace("monto_total", "m.monto_total")
+SQL_COLUMNAS_MOVIMIENTO = f"""m.id, m.empresa_id, m.fecha, m.tipo, m.es_formal, m.producto_id, p.nombre,
+                       m.cantidad, m.monto_total,
+                       CASE WHEN m.es_formal = 1 THEN {_NETO_M} END,
+                       CASE WHEN m.es_formal = 1 THEN m.monto_total - {_NETO_M} END,
+                       m.detalle"""
+
+# Columnas de movimientos en el orden que esperan _aplicar_efectos y _costear
+COLUMNAS_EFECTOS = "empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total"
+
+BLOQUE_FECHA_TS = 10000  # Filas por transacción al rellenar fecha_ts
+BLOQUE_COSTOS = 20000  # Movimientos por transacción al valorizar la historia
+BLOQUE_CONCILIACION = 1000000  # Movimientos por consulta agrupada al conciliar stock
+BLOQUE_RESPALDO = 1024  # Páginas por paso al respaldar (4 MiB con páginas de 4 KiB)
+
+# Variación de stock de un movimiento, igual que en _aplicar_efectos
+SQL_DELTA_STOCK = "CASE tipo WHEN 'compra' THEN cantidad WHEN 'venta' THEN -cantidad ELSE 0 END"
+
+
+# Columnas de las filas de Database.reporte_consolidado (y de su total)
+COLUMNAS_CONSOLIDADO = ("empresa_id", "nombre", "ventas", "compras", "ventas_formales", "compras_formales",
+                        "iva_debito", "iva_credito", "valor_inventario")
+_COLUMNA_TIPO = {"venta": 0, "compra": 1}  # Desplazamiento de compras respecto de ventas en cada fila
+
+
+@contextmanager
+def _adjuntar(cursor, anio, ruta):
+    """ATTACH del archivo de un año como archivo_AAAA mientras dura el bloque"""
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(f"Falta el archivo del año {anio}: {ruta}")
+    esquema = f"archivo_{int(anio)}"
+    cursor.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+    try:
+        yield esquema
+    finally:
+        cursor.execute(f"DETACH DATABASE {esquema}")
+
+
+def _por_bloques(cursor, tamano):
+    """Filas del último SELECT del cursor, leídas de a `tamano`"""
+    while True:
+        filas = cursor.fetchmany(tamano)
+        if not filas:
+            return
+        yield from filas
+
+
+def _consolidar(cursor, periodo, costos_listos):
+    """Filas de reporte_consolidado desde los totales acumulados, sin recorrer movimientos"""
+    cursor.execute("SELECT id, nombre, metodo_costeo FROM empresas WHERE activa = 1 ORDER BY id")
+    empresas = cursor.fetchall()
+    filas = {emp_id: [emp_id, nombre, 0, 0, 0, 0, 0, 0, 0 if costos_listos else None]
+             for emp_id, nombre, _ in empresas}
+
+    # Ventas, compras, formales e IVA: saldos o, con periodo, el resumen diario del rango
+    if periodo:
+        desde, hasta = rango_periodo(periodo)
+        fuente, filtro, params = "resumen_diario", " AND dia >= ? AND dia < ?", [numero_dia(desde), numero_dia(hasta)]
+    else:
+        fuente, filtro, params = "saldos", "", []
+    # CROSS JOIN fija a empresas como tabla externa: cada empresa busca su rango de días en la clave
+    cursor.execute(f"""
+        SELECT t.empresa_id, t.tipo, t.es_formal, SUM(t.monto_total), SUM(t.iva)
+        FROM empresas e CROSS JOIN {fuente} t ON t.empresa_id = e.id
+        WHERE e.activa = 1 AND t.tipo IN ('venta', 'compra'){filtro}
+        GROUP BY t.empresa_id, t.tipo, t.es_formal
+    """, params)
+    for emp_id, tipo, es_formal, monto, iva in cursor.fetchall():
+        desplazamiento = _COLUMNA_TIPO[tipo]
+        filas[emp_id][2 + desplazamiento] += monto
+        if es_formal:
+            filas[emp_id][4 + desplazamiento] += monto
+            filas[emp_id][6 + desplazamiento] += iva
+
+    # Valor actual del inventario según el método de cada empresa
+    if costos_listos:
+        cursor.execute(f"""
+            SELECT c.empresa_id, {', '.join(f'SUM(c.{valor})' for valor, _ in METODOS.values())}
+            FROM costos c JOIN empresas e ON e.id = c.empresa_id
+            WHERE e.activa = 1
+            GROUP BY c.empresa_id
+        """)
+        metodo_de = {emp_id: metodo for emp_id, _, metodo in empresas}
+        for emp_id, *valores in cursor.fetchall():
+            filas[emp_id][8] = dict(zip(METODOS, valores))[metodo_de[emp_id]]
+    return [tuple(fila) for fila in filas.values()]
+
+
+class StockInsuficiente(ValueError):
+    """Ventas que dejarían stock negativo con Database(stock_negativo=False)"""
+
+    def __init__(self, productos):
+        self.productos = productos  # {producto_id: stock en que quedaría}
+        super().__init__("stock insuficiente: " + ", ".join(
+            f"producto {prod_id} quedaría en {stock}" for prod_id, stock in sorted(productos.items())))
+
+
+# --- Lógica de Base de Datos y Negocio ---
+def ruta_por_defecto():
+    # Ruta compatible con Android y PC
+    return os.path.join(os.path.expanduser("~"), "erp_empresas.db")
+
+
+class Database:
+    def __init__(self, db_path=None, lectores=2, journal_mode="WAL", synchronous="NORMAL",
+                 cache_size=-16000, mmap_size=64 * 1024 * 1024, stock_negativo=True):
+        if db_path is None:
+            db_path = ruta_por_defecto()
+        self.db_path = db_path
+        # Con stock_negativo=False, una venta sin stock suficiente revierte su transacción
+        self.stock_negativo = stock_negativo
+        # cache_size negativo = KiB (SQLite); mmap_size en bytes (0 lo desactiva)
+        self.pragmas = {"synchronous": synchronous, "cache_size": int(cache_size), "mmap_size": int(mmap_size)}
+
+        # Una conexión escritora protegida por un lock, más un pool de lectoras.
+        # En WAL los lectores no bloquean al escritor ni el escritor a los lectores.
+        self._lock_escritura = threading.RLock()
+        self.conn = self._conectar()
+        if journal_mode:
+            self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        # user_version está en la cabecera del archivo: si ya es la actual, el arranque
+        # no ejecuta DDL ni consultas de siembra
+        self.version_inicial = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if self.version_inicial < ESQUEMA_VERSION:
+            self.create_tables()
+            self.aplicar_migraciones()
+
+        if db_path == ":memory:" or str(journal_mode).upper() != "WAL":
+            lectores = 0  # sin WAL las lectoras esperarían igual al escritor
+        # Las lectoras se abren a medida que hacen falta, hasta `lectores`
+        self._max_lectores = lectores
+        self._lectores = queue.Queue()
+        self._conexiones_lectoras = []
+        self._lock_lectoras = threading.Lock()
+
+        with self._escritura() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'")
+            self.busqueda_fts = cursor.fetchone() is not None
+            cursor.execute("SELECT id FROM sync_nodo")
+            self.nodo = cursor.fetchone()[0]  # Identidad de este equipo para sincronizar
+            cursor.execute("SELECT nombre, hasta - avance FROM tareas")
+            pendientes = dict(cursor.fetchall())
+
+        # Los reportes filtran por fecha_ts solo cuando todas las filas la tienen, y el
+        # costeo es incremental solo cuando la historia ya está valorizada. Una base chica
+        # se completa aquí mismo; una grande queda para completar_en_segundo_plano.
+        self.fecha_ts_lista = "fecha_ts" not in pendientes
+        self.costos_listos = "costos" not in pendientes
+        if pendientes.get("fecha_ts", BLOQUE_FECHA_TS + 1) <= BLOQUE_FECHA_TS:
+            self.completar_fecha_ts()
+        if pendientes.get("costos", BLOQUE_COSTOS + 1) <= BLOQUE_COSTOS:
+            self.completar_costos()
+
+        # Caché de productos por empresa: {empresa_id: {producto_id: fila}}. Se llena con
+        # las lecturas puntuales, páginas y búsquedas; cada escritura que cambia un
+        # producto lo saca del caché y sube la generación de la empresa para descartar
+        # lecturas que estaban en curso.
+        self._lock_cache = threading.Lock()
+        self._cache_productos = {}
+        self._generacion_cache = {}
+        self._hay_productos = {}
+
+    def _conectar(self, solo_lectura=False):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nombre} = {valor}")
+        if solo_lectura:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def _escritura(self):
+        with self._lock_escritura:
+            yield self.conn.cursor()
+
+    def _tomar_lectora(self):
+        try:
+            return self._lectores.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock_lectoras:
+            if len(self._conexiones_lectoras) < self._max_lectores:
+                conn = self._conectar(solo_lectura=True)
+                self._conexiones_lectoras.append(conn)
+                return conn
+        return self._lectores.get()  # Todas en uso: esperar a que se libere una
+
+    @contextmanager
+    def _lectura(self):
+        if not self._max_lectores:
+            with self._lock_escritura:
+                yield self.conn.cursor()
+            return
+        conn = self._tomar_lectora()
+        try:
+            yield conn.cursor()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._lectores.put(conn)
+
+    def close(self):
+        with self._lock_escritura:
+            with self._lock_lectoras:
+                for conn in self._conexiones_lectoras:
+                    conn.close()
+                self._conexiones_lectoras = []
+                self._max_lectores = 0
+            self.conn.close()
+
+    def create_tables(self):
+        with self._escritura() as cursor:
+        
+            # Tabla Empresas
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS empresas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    activa INTEGER DEFAULT 1
+                )
+            """)
+        
+            # Inicializar empresas por defecto si no existen
+            cursor.execute("SELECT COUNT(*) FROM empresas")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("INSERT INTO empresas (nombre) VALUES ('Empresa A')")
+                cursor.execute("INSERT INTO empresas (nombre) VALUES ('Empresa B')")
+        
+            # Tabla Productos (Inventario)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS productos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    empresa_id INTEGER,
+                    nombre TEXT,
+                    stock INTEGER DEFAULT 0,
+                    precio_venta INTEGER,
+                    costo_unitario INTEGER
+                )
+            """)
+        
+            # Tabla Movimientos (Compras/Ventas Formales e Informales)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS movimientos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    empresa_id INTEGER,
+                    tipo TEXT,          -- 'venta' o 'compra'
+                    es_formal INTEGER,  -- 1 = Si (SII), 0 = No (Informal)
+                    fecha TEXT,
+                    producto_id INTEGER,
+                    cantidad INTEGER,
+                    monto_total INTEGER, -- Bruto
+                    detalle TEXT
+                )
+            """)
+
+            self.conn.commit()
+
+    def aplicar_migraciones(self):
+        """Aplica en orden las migraciones pendientes según PRAGMA user_version"""
+        with self._escritura() as cursor:
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            aplicadas = []
+            for numero, descripcion, migracion in MIGRACIONES:
+                if numero <= version:
+                    continue
+                try:
+                    cursor.execute("BEGIN")
+                    migracion(cursor)
+                    cursor.execute(f"PRAGMA user_version = {int(numero)}")
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                aplicadas.append((numero, descripcion))
+            return aplicadas
+
+    def _completar_tarea(self, nombre, marca, bloque, pausa, progreso, procesar, cerrar):
+        """Avanza una tarea de la tabla tareas por rangos de ids de movimientos.
+
+        Cada bloque es una transacción corta que guarda su avance: se puede interrumpir y
+        retomar, y entre bloques la app sigue leyendo y escribiendo. procesar(cursor, desde,
+        hasta) trabaja el rango (desde, hasta]; cerrar(cursor, hasta) termina la tarea y,
+        en la misma transacción, el atributo `marca` pasa a True.
+        """
+        while True:
+            with self._escritura() as cursor:
+                cursor.execute("SELECT avance, hasta FROM tareas WHERE nombre = ?", (nombre,))
+                fila = cursor.fetchone()
+                if fila is None:
+                    setattr(self, marca, True)
+                    return
+                avance, hasta = fila
+                try:
+                    if avance < hasta:
+                        fin = min(avance + bloque, hasta)
+                        procesar(cursor, avance, fin)
+                        cursor.execute("UPDATE tareas SET avance = ? WHERE nombre = ?", (fin, nombre))
+                    else:
+                        cerrar(cursor, hasta)
+                        cursor.execute("DELETE FROM tareas WHERE nombre = ?", (nombre,))
+                        fin = hasta
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                if avance >= hasta:
+                    setattr(self, marca, True)
+            if progreso:
+                progreso(fin, hasta)
+            if pausa and fin < hasta:
+                time.sleep(pausa)  # Dejar pasar a otros escritores
+
+    def completar_fecha_ts(self, bloque=BLOQUE_FECHA_TS, pausa=0.01, progreso=None):
+        """Rellena fecha_ts de los movimientos previos a la migración 7; al final deja solo su índice"""
+        def procesar(cursor, desde, hasta):
+            cursor.execute(f"UPDATE movimientos SET fecha_ts = {SQL_FECHA_TS} "
+                           "WHERE id > ? AND id <= ? AND fecha_ts IS NULL", (desde, hasta))
+
+        def cerrar(cursor, hasta):
+            cursor.execute("DROP INDEX IF EXISTS idx_movimientos_empresa")
+
+        self._completar_tarea("fecha_ts", "fecha_ts_lista", bloque, pausa, progreso, procesar, cerrar)
+
+    def completar_costos(self, bloque=BLOQUE_COSTOS, pausa=0.01, progreso=None):
+        """Valoriza en orden los movimientos previos a la migración 8 (o a reconstruir_costos).
+
+        Mientras tanto las transacciones nuevas no se costean; el cierre las toma todas
+        en la misma transacción en que el costeo pasa a ser incremental.
+        """
+        def procesar(cursor, desde, hasta):
+            cursor.execute(f"SELECT {COLUMNAS_EFECTOS} FROM movimientos WHERE id > ? AND id <= ? ORDER BY id",
+                           (desde, hasta))
+            self._costear(cursor, cursor.fetchall())
+
+        self._completar_tarea("costos", "costos_listos", bloque, pausa, progreso, procesar,
+                              lambda cursor, hasta: procesar(cursor, hasta, 2 ** 63 - 1))
+
+    def completar_en_segundo_plano(self):
+        """Lanza en un hilo las tareas por bloques que hayan quedado pendientes"""
+        if self.fecha_ts_lista and self.costos_listos:
+            return None
+
+        def completar():
+            self.completar_fecha_ts()
+            self.completar_costos()
+
+        hilo = threading.Thread(target=completar, daemon=True)
+        hilo.start()
+        return hilo
+
+    def _condicion_fecha(self, operador, fecha, alias=""):
+        """Condición SQL sobre una fecha 'AAAA-MM-DD': por fecha_ts si ya está completa, si no por texto"""
+        if self.fecha_ts_lista:
+            return f"{alias}fecha_ts {operador} ?", segundos_epoca(fecha)
+        return f"{alias}fecha {operador} ?", fecha
+
+    # --- Gestión de Empresas ---
+    def obtener_empresas(self):
+        with self._lectura() as cursor:
+            cursor.execute("SELECT * FROM empresas WHERE activa = 1")
+            return cursor.fetchall()
+    
+    def agregar_empresa(self, nombre):
+        with self._escritura() as cursor:
+            cursor.execute("INSERT INTO empresas (nombre) VALUES (?)", (nombre,))
+            self.conn.commit()
+            return cursor.lastrowid
+    
+    def actualizar_nombre_empresa(self, empresa_id, nuevo_nombre):
+        with self._escritura() as cursor:
+            cursor.execute("UPDATE empresas SET nombre = ? WHERE id = ?", (nuevo_nombre, empresa_id))
+            self.conn.commit()
+    
+    def eliminar_empresa(self, empresa_id):
+        with self._escritura() as cursor:
+            cursor.execute("UPDATE empresas SET activa = 0 WHERE id = ?", (empresa_id,))
+            self.conn.commit()
+
+    # --- Caché de Productos ---
+    def _generacion(self, empresa_id):
+        with self._lock_cache:
+            return self._generacion_cache.get(empresa_id, 0)
+
+    def _cachear_productos(self, empresa_id, filas, generacion):
+        with self._lock_cache:
+            if self._generacion_cache.get(empresa_id, 0) != generacion:
+                return  # Hubo una escritura mientras se leía: la fila puede estar vieja
+            cache = self._cache_productos.setdefault(empresa_id, {})
+            for fila in filas:
+                cache[fila[0]] = fila
+            if filas:
+                self._hay_productos[empresa_id] = True
+
+    def _invalidar_productos(self, empresa_id, ids=None):
+        with self._lock_cache:
+            self._generacion_cache[empresa_id] = self._generacion_cache.get(empresa_id, 0) + 1
+            if ids is None:
+                self._cache_productos.pop(empresa_id, None)
+            else:
+                cache = self._cache_productos.get(empresa_id, {})
+                for prod_id in ids:
+                    cache.pop(prod_id, None)
+
+    def obtener_producto(self, empresa_id, prod_id):
+        """Fila de un producto de la empresa (desde el caché si está), o None"""
+        prod_id = int(prod_id)
+        with self._lock_cache:
+            fila = self._cache_productos.get(empresa_id, {}).get(prod_id)
+        if fila is not None:
+            return fila
+        generacion = self._generacion(empresa_id)
+        with self._lectura() as cursor:
+            cursor.execute("SELECT * FROM productos WHERE id = ? AND empresa_id = ?", (prod_id, empresa_id))
+            fila = cursor.fetchone()
+        if fila is not None:
+            self._cachear_productos(empresa_id, [fila], generacion)
+        return fila
+
+    def obtener_precio(self, empresa_id, prod_id, tipo):
+        """Precio unitario de un movimiento: precio de venta para ventas, costo para compras"""
+        fila = self.obtener_producto(empresa_id, prod_id)
+        if fila is None:
+            return None
+        return fila[4] if tipo == 'venta' else fila[5]
+
+    def hay_productos(self, empresa_id):
+        with self._lock_cache:
+            if empresa_id in self._hay_productos:
+                return self._hay_productos[empresa_id]
+        with self._lectura() as cursor:
+            cursor.execute("SELECT 1 FROM productos WHERE empresa_id = ? LIMIT 1", (empresa_id,))
+            hay = cursor.fetchone() is not None
+        with self._lock_cache:
+            self._hay_productos[empresa_id] = hay
+        return hay
+
+    # --- Gestión de Inventario ---
+    def obtener_productos(self, empresa_id):
+        with self._lectura() as cursor:
+            cursor.execute("SELECT * FROM productos WHERE empresa_id = ?", (empresa_id,))
+            return cursor.fetchall()
+
+    def obtener_productos_pagina(self, empresa_id, despues_de_id=0, limite=50):
+        """Página de productos ordenada por id (paginación por clave: id > despues_de_id)"""
+        generacion = self._generacion(empresa_id)
+        with self._lectura() as cursor:
+            cursor.execute("SELECT * FROM productos WHERE empresa_id = ? AND id > ? ORDER BY id LIMIT ?",
+                           (empresa_id, despues_de_id, limite))
+            filas = cursor.fetchall()
+        self._cachear_productos(empresa_id, filas, generacion)
+        return filas
+
+    def buscar_productos(self, empresa_id, texto, limite=20):
+        """Productos cuyo nombre contiene todas las palabras buscadas (por prefijo), hasta `limite`"""
+        palabras = texto.split()
+        if not palabras:
+            return self.obtener_productos_pagina(empresa_id, 0, limite)
+        generacion = self._generacion(empresa_id)
+        with self._lectura() as cursor:
+            if self.busqueda_fts:
+                consulta = " ".join('"' + p.replace('"', '""') + '"*' for p in palabras)
+                cursor.execute("""
+                    SELECT p.* FROM productos_fts f
+                    JOIN productos p ON p.id = f.rowid
+                    WHERE productos_fts MATCH ? AND p.empresa_id = ?
+                    ORDER BY f.rank
+                    LIMIT ?
+                """, (consulta, empresa_id, limite))
+            else:
+                condiciones = " AND ".join("nombre LIKE ? ESCAPE '\\'" for _ in palabras)
+                patrones = ["%" + p.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for p in palabras]
+                cursor.execute(f"SELECT * FROM productos WHERE empresa_id = ? AND {condiciones} ORDER BY nombre LIMIT ?",
+                               [empresa_id] + patrones + [limite])
+            filas = cursor.fetchall()
+        self._cachear_productos(empresa_id, filas, generacion)
+        return filas
+
+    def agregar_producto(self, empresa_id, nombre, precio, costo):
+        with self._escritura() as cursor:
+            cursor.execute("INSERT INTO productos (empresa_id, nombre, precio_venta, costo_unitario, stock) VALUES (?, ?, ?, ?, 0)",
+                           (empresa_id, nombre, precio, costo))
+            self.conn.commit()
+            prod_id = cursor.lastrowid
+        with self._lock_cache:
+            self._hay_productos[empresa_id] = True
+        return prod_id
+
+    def upsert_productos_lote(self, empresa_id, productos):
+        """Inserta o actualiza (por nombre) productos de una empresa en una sola transacción.
+
+        productos: iterable de (nombre, precio_venta, costo_unitario). Devuelve (insertados, actualizados).
+        """
+        insertados = actualizados = 0
+        with self._escritura() as cursor:
+            try:
+                for nombre, precio, costo in productos:
+                    cursor.execute("UPDATE productos SET precio_venta = ?, costo_unitario = ? WHERE empresa_id = ? AND nombre = ?",
+                                   (precio, costo, empresa_id, nombre))
+                    if cursor.rowcount:
+                        actualizados += 1
+                    else:
+                        cursor.execute("INSERT INTO productos (empresa_id, nombre, precio_venta, costo_unitario, stock) VALUES (?, ?, ?, ?, 0)",
+                                       (empresa_id, nombre, precio, costo))
+                        insertados += 1
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        if actualizados:
+            self._invalidar_productos(empresa_id)
+        if insertados:
+            with self._lock_cache:
+                self._hay_productos[empresa_id] = True
+        return insertados, actualizados
+
+    def ids_productos_por_nombre(self, empresa_id, nombres):
+        """Devuelve {nombre: id} para los nombres que existen en la empresa"""
+        nombres = list(set(nombres))
+        encontrados = {}
+        with self._lectura() as cursor:
+            for i in range(0, len(nombres), 500):
+                bloque = nombres[i:i + 500]
+                cursor.execute(f"SELECT nombre, id FROM productos WHERE empresa_id = ? AND nombre IN ({', '.join('?' * len(bloque))})",
+                               [empresa_id] + bloque)
+                encontrados.update(cursor.fetchall())
+        return encontrados
+
+    # --- Motor de Transacciones (El Corazón del Sistema) ---
+    def registrar_transaccion(self, empresa_id, tipo, es_formal, prod_id, cantidad, precio_unitario, detalle):
+        fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        monto_total = int(cantidad * precio_unitario)
+
+        with self._escritura() as cursor:
+            try:
+                # 1. Registrar el movimiento financiero
+                cursor.execute("""
+                    INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total, detalle, fecha_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (empresa_id, tipo, 1 if es_formal else 0, fecha, prod_id, cantidad, monto_total, detalle,
+                      segundos_epoca(fecha)))
+
+                # 2. Actualizar inventario y saldos (misma transacción)
+                movimiento = (empresa_id, tipo, 1 if es_formal else 0, fecha, prod_id, cantidad, monto_total)
+                self._aplicar_efectos(cursor, [movimiento])
+                self._validar_stock(cursor, [movimiento])
+
+                self.conn.commit()
+                self._invalidar_productos(empresa_id, [prod_id])
+                return True
+            except StockInsuficiente:
+                self.conn.rollback()
+                raise
+            except Exception as e:
+                self.conn.rollback()
+                print(f"Error transaction: {e}")
+                return False
+
+    def registrar_transacciones_lote(self, items):
+        """Registra muchas líneas en una sola transacción (todo o nada).
+
+        Cada item es (empresa_id, tipo, es_formal, prod_id, cantidad, precio_unitario, detalle[, fecha]).
+        Devuelve (exito, resultados) con un (ok, monto_total o mensaje de error) por item.
+        """
+        fecha_lote = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        filas = []
+        resultados = []
+        for item in items:
+            try:
+                empresa_id, tipo, es_formal, prod_id, cantidad, precio_unitario, detalle = item[:7]
+                fecha = validar_fecha(item[7]) if len(item) > 7 and item[7] else fecha_lote
+                if tipo not in ('venta', 'compra'):
+                    raise ValueError(f"tipo inválido: {tipo!r}")
+                empresa_id, prod_id, cantidad = int(empresa_id), int(prod_id), int(cantidad)
+                if cantidad <= 0:
+                    raise ValueError(f"cantidad inválida: {cantidad}")
+                monto_total = int(cantidad * precio_unitario)
+                fila = (empresa_id, tipo, 1 if es_formal else 0, fecha, prod_id, cantidad, monto_total, detalle,
+                        segundos_epoca(fecha))
+            except (TypeError, ValueError) as e:
+                resultados.append((False, str(e)))
+                filas.append(None)
+                continue
+            filas.append(fila)
+            resultados.append((True, monto_total))
+
+        # Los productos deben existir y pertenecer a la empresa del item
+        with self._escritura() as cursor:
+            empresa_de = {}
+            ids = list({f[4] for f in filas if f})
+            for i in range(0, len(ids), 500):
+                bloque = ids[i:i + 500]
+                cursor.execute(f"SELECT id, empresa_id FROM productos WHERE id IN ({', '.join('?' * len(bloque))})", bloque)
+                empresa_de.update(cursor.fetchall())
+            for i, fila in enumerate(filas):
+                if fila and empresa_de.get(fila[4]) != fila[0]:
+                    resultados[i] = (False, f"producto {fila[4]} no existe en la empresa {fila[0]}")
+
+            if not all(ok for ok, _ in resultados):
+                return False, resultados
+            if not filas:
+                return True, resultados
+
+            try:
+                cursor.executemany("""
+                    INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total, detalle, fecha_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, filas)
+                self._aplicar_efectos(cursor, [f[:7] for f in filas])
+                self._validar_stock(cursor, [f[:7] for f in filas])
+                self.conn.commit()
+                afectados = {}
+                for f in filas:
+                    afectados.setdefault(f[0], set()).add(f[4])
+                for emp_id, ids in afectados.items():
+                    self._invalidar_productos(emp_id, ids)
+                return True, resultados
+            except StockInsuficiente as e:
+                # Se rechazan solo las ventas que, en el orden del lote, bajarían el stock de cero;
+                # el resto puede reintentarse
+                self.conn.rollback()
+                ids = list(e.productos)
+                stock = {}
+                for i in range(0, len(ids), 500):
+                    bloque = ids[i:i + 500]
+                    cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({', '.join('?' * len(bloque))})", bloque)
+                    stock.update(cursor.fetchall())
+                for i, fila in enumerate(filas):
+                    prod_id, cantidad = fila[4], fila[5]
+                    if prod_id not in stock:
+                        continue
+                    if fila[1] == 'compra':
+                        stock[prod_id] += cantidad
+                    elif stock[prod_id] - cantidad < 0:
+                        resultados[i] = (False, f"stock insuficiente: producto {prod_id} quedaría en "
+                                                f"{stock[prod_id] - cantidad}")
+                    else:
+                        stock[prod_id] -= cantidad
+                return False, resultados
+            except Exception as e:
+                self.conn.rollback()
+                print(f"Error transaction: {e}")
+                return False, [(False, f"Lote revertido: {e}") for _ in resultados]
+
+    def _aplicar_efectos(self, cursor, movimientos):
+        """Aplica stock, saldos y resumen diario de movimientos ya insertados, agrupados.
+
+        movimientos: (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total)
+        """
+        stock = {}
+        saldos = {}
+        diario = {}
+        dias = {}  # fecha 'AAAA-MM-DD' -> número de día (los lotes repiten pocas fechas)
+        for empresa_id, tipo, es_formal, fecha, prod_id, cantidad, monto_total in movimientos:
+            if tipo == 'compra':
+                stock[prod_id] = stock.get(prod_id, 0) + cantidad
+            elif tipo == 'venta':
+                stock[prod_id] = stock.get(prod_id, 0) - cantidad
+            iva = iva_incluido(monto_total) if es_formal else 0
+            clave = (empresa_id, tipo, es_formal)
+            monto, cuenta, iva_total = saldos.get(clave, (0, 0, 0))
+            saldos[clave] = (monto + monto_total, cuenta + 1, iva_total + iva)
+            dia = dias.get(fecha[:10])
+            if dia is None:
+                dia = dias[fecha[:10]] = numero_dia(fecha)
+            clave = (empresa_id, dia, tipo, es_formal)
+            monto, cuenta, iva_total = diario.get(clave, (0, 0, 0))
+            diario[clave] = (monto + monto_total, cuenta + 1, iva_total + iva)
+
+        cursor.executemany("UPDATE productos SET stock = stock + ? WHERE id = ?",
+                           [(delta, prod_id) for prod_id, delta in stock.items() if delta])
+        cursor.executemany("""
+            INSERT INTO saldos (empresa_id, tipo, es_formal, monto_total, movimientos, iva)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (empresa_id, tipo, es_formal) DO UPDATE SET
+                monto_total = monto_total + excluded.monto_total,
+                movimientos = movimientos + excluded.movimientos,
+                iva = iva + excluded.iva
+        """, [clave + valor for clave, valor in saldos.items()])
+        cursor.executemany("""
+            INSERT INTO resumen_diario (empresa_id, dia, tipo, es_formal, monto_total, movimientos, iva)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (empresa_id, dia, tipo, es_formal) DO UPDATE SET
+                monto_total = monto_total + excluded.monto_total,
+                movimientos = movimientos + excluded.movimientos,
+                iva = iva + excluded.iva
+        """, [clave + valor for clave, valor in diario.items()])
+        if self.costos_listos:
+            self._costear(cursor, movimientos)
+
+    def _validar_stock(self, cursor, movimientos):
+        """Con stock_negativo=False, falla si los productos que bajaron quedaron bajo cero"""
+        if self.stock_negativo:
+            return
+        neto = {}
+        for _, tipo, _, _, prod_id, cantidad, _ in movimientos:
+            neto[prod_id] = neto.get(prod_id, 0) + (cantidad if tipo == 'compra' else -cantidad if tipo == 'venta' else 0)
+        bajan = [prod_id for prod_id, delta in neto.items() if delta < 0]
+        negativos = {}
+        for i in range(0, len(bajan), 500):
+            bloque = bajan[i:i + 500]
+            cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({', '.join('?' * len(bloque))}) AND stock < 0",
+                           bloque)
+            negativos.update(cursor.fetchall())
+        if negativos:
+            raise StockInsuficiente(negativos)
+
+    def _costear(self, cursor, movimientos):
+        """Aplica los movimientos, en orden, al estado de costo de sus productos"""
+        ids = list({m[4] for m in movimientos})
+        vendido = {}
+        for m in movimientos:
+            if m[1] == 'venta' and m[5] > 0:
+                vendido[m[4]] = vendido.get(m[4], 0) + m[5]
+        estados = {}
+        empresa_de = {}
+        for i in range(0, len(ids), 500):
+            bloque = ids[i:i + 500]
+            marcas = ', '.join('?' * len(bloque))
+            cursor.execute(f"""
+                SELECT producto_id, empresa_id, cantidad, valor_fifo, valor_promedio, cmv_fifo, cmv_promedio, ultimo_costo
+                FROM costos WHERE producto_id IN ({marcas})
+            """, bloque)
+            for prod_id, empresa_id, *estado in cursor.fetchall():
+                estados[prod_id] = EstadoCosto(*estado)
+                empresa_de[prod_id] = empresa_id
+            # Productos sin estado aún: lo vendido sin compras previas se costea a su costo_unitario
+            nuevos = [prod_id for prod_id in bloque if prod_id not in estados]
+            if nuevos:
+                cursor.execute(f"SELECT id, costo_unitario FROM productos WHERE id IN ({', '.join('?' * len(nuevos))})",
+                               nuevos)
+                costo_de = dict(cursor.fetchall())
+                for prod_id in nuevos:
+                    estados[prod_id] = EstadoCosto(ultimo_costo=costo_de.get(prod_id) or 0)
+        # Las ventas necesitan las capas FIFO guardadas más antiguas: solo las que cubren lo
+        # vendido en este grupo (las compras del grupo van después de todas las guardadas)
+        necesidad = list(vendido.items())
+        for i in range(0, len(necesidad), 400):
+            bloque = necesidad[i:i + 400]
+            cursor.execute(f"""
+                WITH necesidad (producto_id, cantidad) AS (VALUES {', '.join(['(?, ?)'] * len(bloque))})
+                SELECT c.id, c.producto_id, c.cantidad, c.monto
+                FROM (
+                    SELECT id, producto_id, cantidad, monto,
+                           SUM(cantidad) OVER (PARTITION BY producto_id ORDER BY id) - cantidad AS previas
+                    FROM capas_costo WHERE producto_id IN (SELECT producto_id FROM necesidad)
+                ) c
+                JOIN necesidad n ON n.producto_id = c.producto_id
+                WHERE c.previas < n.cantidad
+                ORDER BY c.producto_id, c.id
+            """, [valor for par in bloque for valor in par])
+            for capa_id, prod_id, cantidad, monto in cursor.fetchall():
+                estados[prod_id].capas.append([capa_id, cantidad, monto])
+
+        for empresa_id, tipo, _, _, prod_id, cantidad, monto_total in movimientos:
+            empresa_de.setdefault(prod_id, empresa_id)
+            if cantidad <= 0:
+                continue
+            if tipo == 'compra':
+                estados[prod_id].comprar(cantidad, monto_total)
+            elif tipo == 'venta':
+                estados[prod_id].vender(cantidad)
+
+        borradas, modificadas, nuevas = [], [], []
+        for prod_id, estado in estados.items():
+            borradas.extend((capa_id,) for capa_id in estado.borradas)
+            if estado.modificada and estado.modificada[1]:
+                modificadas.append((estado.modificada[1], estado.modificada[2], estado.modificada[0]))
+            nuevas.extend((prod_id, capa[1], capa[2]) for capa in estado.capas if capa[0] is None)
+        cursor.executemany("DELETE FROM capas_costo WHERE id = ?", borradas)
+        cursor.executemany("UPDATE capas_costo SET cantidad = ?, monto = ? WHERE id = ?", modificadas)
+        cursor.executemany("INSERT INTO capas_costo (producto_id, cantidad, monto) VALUES (?, ?, ?)", nuevas)
+        cursor.executemany("""
+            INSERT INTO costos (producto_id, empresa_id, cantidad, valor_fifo, valor_promedio, cmv_fifo, cmv_promedio, ultimo_costo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (producto_id) DO UPDATE SET
+                cantidad = excluded.cantidad,
+                valor_fifo = excluded.valor_fifo,
+                valor_promedio = excluded.valor_promedio,
+                cmv_fifo = excluded.cmv_fifo,
+                cmv_promedio = excluded.cmv_promedio,
+                ultimo_costo = excluded.ultimo_costo
+        """, [(prod_id, empresa_de[prod_id]) + estado.fila() for prod_id, estado in estados.items()])
+
+    # --- Contabilidad y Reportes ---
+    def obtener_resumen(self, empresa_id):
+        with self._lectura() as cursor:
+            # Ventas y compras totales desde los saldos acumulados (máx. 4 filas)
+            cursor.execute("""
+                SELECT
+                    COALESCE(SUM(CASE WHEN tipo = 'venta' THEN monto_total END), 0),
+                    COALESCE(SUM(CASE WHEN tipo = 'compra' THEN monto_total END), 0)
+                FROM saldos WHERE empresa_id = ?
+            """, (empresa_id,))
+            ventas, compras = cursor.fetchone()
+            return ventas, compras
+
+    def reporte_consolidado(self, periodo=None):
+        """Ventas, compras, IVA y valor del inventario de todas las empresas activas, más el total.
+
+        Se lee de los totales acumulados (saldos, o resumen diario si hay periodo 'AAAA-MM' o
+        'AAAA') y de costos, con una consulta agrupada por empresa para cada uno y en la misma
+        foto de la base: el costo no depende de cuántos movimientos haya. Devuelve (filas, total)
+        con las columnas de COLUMNAS_CONSOLIDADO; valor_inventario es el actual y es None
+        mientras se valoriza la historia.
+        """
+        costos_listos = self.costos_listos
+        with self._lectura() as cursor:
+            try:
+                cursor.execute("BEGIN")
+                filas = _consolidar(cursor, periodo, costos_listos)
+            finally:
+                cursor.connection.rollback()
+        total = [None, "Total"] + [sum(fila[i] for fila in filas) for i in range(2, 8)]
+        total.append(sum(fila[8] for fila in filas) if costos_listos else None)
+        return filas, tuple(total)
+
+    # --- Costeo de Inventario ---
+    def metodo_costeo(self, empresa_id):
+        with self._lectura() as cursor:
+            cursor.execute("SELECT metodo_costeo FROM empresas WHERE id = ?", (empresa_id,))
+            fila = cursor.fetchone()
+            return fila[0] if fila else "fifo"
+
+    def cambiar_metodo_costeo(self, empresa_id, metodo):
+        validar_metodo(metodo)
+        with self._escritura() as cursor:
+            cursor.execute("UPDATE empresas SET metodo_costeo = ? WHERE id = ?", (metodo, empresa_id))
+            self.conn.commit()
+
+    def valuacion(self, empresa_id, metodo=None):
+        """(valor del inventario, costo de lo vendido) de la empresa; None mientras se valoriza la historia"""
+        if not self.costos_listos:
+            return None
+        valor, cmv = METODOS[validar_metodo(metodo or self.metodo_costeo(empresa_id))]
+        with self._lectura() as cursor:
+            cursor.execute(f"SELECT COALESCE(SUM({valor}), 0), COALESCE(SUM({cmv}), 0) FROM costos WHERE empresa_id = ?",
+                           (empresa_id,))
+            return cursor.fetchone()
+
+    def valor_productos(self, empresa_id, ids, metodo=None):
+        """{producto_id: valor del inventario} de los ids dados (p. ej. una página); None si aún no está"""
+        if not self.costos_listos:
+            return None
+        valor = METODOS[validar_metodo(metodo or self.metodo_costeo(empresa_id))][0]
+        ids = list(ids)
+        valores = {}
+        with self._lectura() as cursor:
+            for i in range(0, len(ids), 500):
+                bloque = ids[i:i + 500]
+                cursor.execute(f"SELECT producto_id, {valor} FROM costos WHERE producto_id IN ({', '.join('?' * len(bloque))})",
+                               bloque)
+                valores.update(cursor.fetchall())
+        return {prod_id: valores.get(prod_id, 0) for prod_id in ids}
+
+    def reconstruir_costos(self, progreso=None):
+        """Borra el costeo y vuelve a valorizar toda la historia en orden de registro"""
+        if self.anios_archivados():
+            raise ValueError("Hay años archivados: el costeo no se puede rehacer sin su historia")
+        with self._escritura() as cursor:
+            try:
+                cursor.execute("DELETE FROM costos")
+                cursor.execute("DELETE FROM capas_costo")
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos")
+                cursor.execute("INSERT OR REPLACE INTO tareas (nombre, avance, hasta) VALUES ('costos', 0, ?)",
+                               (cursor.fetchone()[0],))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.costos_listos = False
+        self.completar_costos(pausa=0, progreso=progreso)
+
+    def serie_movimientos(self, empresa_id, desde, hasta, agrupacion="mes", es_formal=None):
+        """Ventas y compras por 'dia', 'semana' o 'mes' en [desde, hasta), desde el resumen diario.
+
+        Devuelve [(periodo, ventas, compras)] solo con periodos que tienen movimientos.
+        """
+        if agrupacion not in AGRUPACIONES:
+            raise ValueError(f"Agrupación inválida: {agrupacion!r} (use {', '.join(AGRUPACIONES)})")
+        filtro = ""
+        params = [empresa_id, numero_dia(desde), numero_dia(hasta)]
+        if es_formal is not None:
+            filtro = " AND es_formal = ?"
+            params.append(1 if es_formal else 0)
+        with self._lectura() as cursor:
+            cursor.execute(f"""
+                SELECT {AGRUPACIONES[agrupacion]} AS periodo,
+                       SUM(CASE WHEN tipo = 'venta' THEN monto_total ELSE 0 END),
+                       SUM(CASE WHEN tipo = 'compra' THEN monto_total ELSE 0 END)
+                FROM resumen_diario
+                WHERE empresa_id = ? AND dia >= ? AND dia < ?{filtro}
+                GROUP BY periodo
+                ORDER BY periodo
+            """, params)
+            return cursor.fetchall()
+
+    def ultimos_meses(self, empresa_id, meses=12, hoy=None):
+        """[('AAAA-MM', ventas, compras)] de los últimos meses (incluido el actual), con ceros"""
+        hoy = hoy or datetime.date.today()
+        anio, mes = hoy.year, hoy.month
+        periodos = []
+        for _ in range(meses):
+            periodos.append(f"{anio:04d}-{mes:02d}")
+            anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+        periodos.reverse()
+        desde = rango_periodo(periodos[0])[0]
+        hasta = rango_periodo(periodos[-1])[1]
+        totales = {periodo: (ventas, compras) for periodo, ventas, compras
+                   in self.serie_movimientos(empresa_id, desde, hasta, "mes")}
+        return [(periodo,) + totales.get(periodo, (0, 0)) for periodo in periodos]
+
+    # --- Mantenimiento de Saldos ---
+    def verificar_saldos(self):
+        """Compara los saldos acumulados con movimientos (y lo archivado) y devuelve las diferencias"""
+        with self._lectura() as cursor:
+            # Una sola consulta: saldos guardados y reales salen de la misma foto de la base
+            cursor.execute(f"""
+                SELECT empresa_id, tipo, es_formal,
+                       SUM(monto_guardado), SUM(monto_real), SUM(movs_guardados), SUM(movs_reales),
+                       SUM(iva_guardado), SUM(iva_real)
+                FROM (
+                    SELECT empresa_id, tipo, es_formal, monto_total AS monto_guardado, 0 AS monto_real,
+                           movimientos AS movs_guardados, 0 AS movs_reales, iva AS iva_guardado, 0 AS iva_real
+                    FROM saldos
+                    UNION ALL
+                    SELECT empresa_id, tipo, es_formal, 0, COALESCE(SUM(monto_total), 0), 0, COUNT(*),
+                           0, COALESCE(SUM({SQL_IVA}), 0)
+                    FROM movimientos
+                    GROUP BY empresa_id, tipo, es_formal
+                    UNION ALL
+                    SELECT empresa_id, tipo, es_formal, 0, SUM(monto_total), 0, SUM(movimientos), 0, SUM(iva)
+                    FROM archivo_resumen
+                    GROUP BY empresa_id, tipo, es_formal
+                )
+                GROUP BY empresa_id, tipo, es_formal
+                HAVING SUM(monto_guardado) != SUM(monto_real) OR SUM(movs_guardados) != SUM(movs_reales)
+                    OR SUM(iva_guardado) != SUM(iva_real)
+                ORDER BY empresa_id, tipo, es_formal
+            """)
+            # (empresa_id, tipo, es_formal, monto_guardado, monto_real, movs_guardados, movs_reales,
+            #  iva_guardado, iva_real)
+            return cursor.fetchall()
+
+    def reconstruir_saldos(self):
+        """Recalcula saldos y resumen diario desde movimientos y devuelve las diferencias de saldos corregidas"""
+        with self._escritura() as cursor:
+            diferencias = self.verificar_saldos()
+            try:
+                _recalcular_saldos(cursor)
+                _recalcular_resumen_diario(cursor)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            return diferencias
+
+    def reporte_sii(self, empresa_id, periodo=None):
+        """Calcula IVA Débito y Crédito solo de movimientos FORMALES (periodo 'AAAA-MM' o 'AAAA').
+
+        Un periodo de un año archivado se lee de su archivo; sin periodo, lo archivado suma
+        sus totales guardados.
+        """
+        with self._lectura() as cursor:
+            # Con fecha_ts completa, la condición permite usar su índice (parcial) sin periodo
+            filtro = " AND fecha_ts IS NOT NULL" if self.fecha_ts_lista else ""
+            params = [empresa_id]
+            if periodo:
+                desde, hasta = rango_periodo(periodo)
+                # Tipos presentes según los saldos: permite buscar el rango de fechas en el índice
+                cursor.execute("SELECT tipo FROM saldos WHERE empresa_id = ? AND es_formal = 1", (empresa_id,))
+                tipos = [r[0] for r in cursor.fetchall()]
+                if not tipos:
+                    return 0, 0, 0, 0
+                desde_sql, desde_valor = self._condicion_fecha(">=", desde)
+                hasta_sql, hasta_valor = self._condicion_fecha("<", hasta)
+                filtro = f" AND tipo IN ({', '.join('?' * len(tipos))}) AND {desde_sql} AND {hasta_sql}"
+                params += tipos + [desde_valor, hasta_valor]
+
+            # En Chile: Monto Bruto / 1.19 = Neto. Bruto - Neto = IVA (neto truncado por movimiento).
+            sql = f"""
+                SELECT tipo, SUM(monto_total), SUM(monto_total - {SQL_NETO})
+                FROM {{}}movimientos
+                WHERE empresa_id = ? AND es_formal = 1{{}}
+                GROUP BY tipo
+            """
+            cursor.execute(sql.format("main.", filtro), params)
+            filas = cursor.fetchall()
+            if periodo:
+                # En el archivo el rango va por texto, que es lo que cubre su índice
+                filtro = f" AND tipo IN ({', '.join('?' * len(tipos))}) AND fecha >= ? AND fecha < ?"
+                for anio, ruta in self._archivos(cursor, desde, hasta):
+                    with _adjuntar(cursor, anio, ruta) as esquema:
+                        cursor.execute(sql.format(f"{esquema}.", filtro), [empresa_id] + tipos + [desde, hasta])
+                        filas += cursor.fetchall()
+            else:
+                cursor.execute("""
+                    SELECT tipo, SUM(monto_total), SUM(iva) FROM archivo_resumen
+                    WHERE empresa_id = ? AND es_formal = 1 GROUP BY tipo
+                """, (empresa_id,))
+                filas += cursor.fetchall()
+
+            iva_debito = 0  # Lo que debo pagar por ventas
+            iva_credito = 0 # Lo que tengo a favor por compras
+            total_ventas_bruto = 0
+            total_compras_bruto = 0
+
+            for tipo, bruto, iva in filas:
+                if tipo == 'venta':
+                    iva_debito += iva or 0
+                    total_ventas_bruto += bruto or 0
+                else:
+                    iva_credito += iva or 0
+                    total_compras_bruto += bruto or 0
+
+            return total_ventas_bruto, total_compras_bruto, iva_debito, iva_credito
+
+    def iterar_movimientos(self, empresa_id=None, desde=None, hasta=None, es_formal=None, tamano=5000):
+        """Recorre movimientos en orden de registro sin cargarlos todos en memoria.
+
+        desde/hasta son fechas 'AAAA-MM-DD' (hasta es inclusiva). Cada fila incluye el
+        nombre del producto y, para movimientos formales, el neto e IVA como en reporte_sii.
+        Primero van los años archivados del rango, del más antiguo al más nuevo, y después
+        los movimientos de la base.
+        """
+        condiciones = []
+        params = []
+        if empresa_id is not None:
+            condiciones.append("m.empresa_id = ?")
+            params.append(empresa_id)
+        if es_formal is not None:
+            condiciones.append("m.es_formal = ?")
+            params.append(1 if es_formal else 0)
+        if desde:
+            condicion, valor = self._condicion_fecha(">=", desde, "m.")
+            condiciones.append(condicion)
+            params.append(valor)
+        siguiente = None
+        if hasta:
+            siguiente = (datetime.date.fromisoformat(hasta) + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+            condicion, valor = self._condicion_fecha("<", siguiente, "m.")
+            condiciones.append(condicion)
+            params.append(valor)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        sql = f"""
+            SELECT {SQL_COLUMNAS_MOVIMIENTO}
+            FROM {{}}.movimientos m
+            LEFT JOIN main.productos p ON p.id = m.producto_id
+            {where}
+            ORDER BY m.id
+        """
+
+        if not self._max_lectores:
+            yield from self._iterar_por_paginas(condiciones, params, desde, siguiente, tamano)
+            return
+        with self._lectura() as cursor:
+            # Un año adjunto a la vez: SQLite limita cuántas bases puede tener adjuntas
+            for anio, ruta in self._archivos(cursor, desde, siguiente):
+                with _adjuntar(cursor, anio, ruta) as esquema:
+                    cursor.execute(sql.format(esquema), params)
+                    yield from _por_bloques(cursor, tamano)
+            cursor.execute(sql.format("main"), params)
+            yield from _por_bloques(cursor, tamano)
+
+    def _iterar_por_paginas(self, condiciones, params, desde, siguiente, tamano):
+        """iterar_movimientos sin lectoras: _lectura toma el lock de la escritora, así que se lee
+        de a `tamano` filas por clave m.id y se suelta el lock antes de entregar cada página
+        (una exportación lenta no frena las escrituras). NOT INDEXED recorre por rowid desde la
+        última clave: con un índice de empresa o fecha cada página ordenaría de nuevo todo lo que queda.
+        """
+        sql = f"""
+            SELECT {SQL_COLUMNAS_MOVIMIENTO}
+            FROM {{}}.movimientos m NOT INDEXED
+            LEFT JOIN main.productos p ON p.id = m.producto_id
+            WHERE m.id > ?{"".join(f" AND {condicion}" for condicion in condiciones)}
+            ORDER BY m.id
+            LIMIT ?
+        """
+        with self._lectura() as cursor:
+            archivos = self._archivos(cursor, desde, siguiente)
+        for anio, ruta in archivos + [(None, None)]:
+            ultimo = 0
+            while True:
+                with self._lectura() as cursor:
+                    with _adjuntar(cursor, anio, ruta) if anio is not None else nullcontext("main") as esquema:
+                        cursor.execute(sql.format(esquema), [ultimo] + params + [tamano])
+                        filas = cursor.fetchall()
+                yield from filas
+                if len(filas) < tamano:
+                    break
+                ultimo = filas[-1][0]
+
+    def pagina_movimientos(self, empresa_id, antes_de=None, limite=50, tipo=None, es_formal=None,
+                           producto_id=None, desde=None, hasta=None):
+        """Página del historial, del movimiento más nuevo al más antiguo (mismas columnas que iterar_movimientos).
+
+        Paginación por clave: antes_de es (fecha, id) de la última fila de la página anterior,
+        así que cada página cuesta lo mismo con cualquier tamaño de historial. desde/hasta son
+        fechas 'AAAA-MM-DD' (hasta es inclusiva). Cuando la página llega a un año archivado,
+        se completa con su archivo.
+        """
+        if tipo not in (None, "venta", "compra"):
+            raise ValueError(f"Tipo inválido: {tipo!r} (use 'venta' o 'compra')")
+        condiciones = ["m.empresa_id = ?"]
+        params = [empresa_id]
+        if producto_id is not None:
+            condiciones.append("m.producto_id = ?")
+            params.append(int(producto_id))
+        if tipo:
+            condiciones.append("m.tipo = ?")
+            params.append(tipo)
+        if es_formal is not None:
+            condiciones.append("m.es_formal = ?")
+            params.append(1 if es_formal else 0)
+        # Por texto: la clave del índice es fecha, no fecha_ts
+        if desde:
+            desde = datetime.date.fromisoformat(desde).strftime("%Y-%m-%d")
+            condiciones.append("m.fecha >= ?")
+            params.append(desde)
+        if hasta:
+            hasta = (datetime.date.fromisoformat(hasta) + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+            condiciones.append("m.fecha < ?")
+            params.append(hasta)
+        if antes_de:
+            condiciones.append("(m.fecha, m.id) < (?, ?)")
+            params += [antes_de[0], int(antes_de[1])]
+        sql = f"""
+            SELECT {SQL_COLUMNAS_MOVIMIENTO}
+            FROM {{}}.movimientos m
+            LEFT JOIN main.productos p ON p.id = m.producto_id
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY m.fecha DESC, m.id DESC
+            LIMIT ?
+        """
+
+        with self._lectura() as cursor:
+            cursor.execute(sql.format("main"), params + [limite])
+            filas = cursor.fetchall()
+            # Años archivados del más nuevo al más antiguo, solo mientras puedan entrar en la página
+            for anio, ruta in reversed(self._archivos(cursor, desde, hasta)):
+                if antes_de and f"{anio}-01-01" > antes_de[0]:
+                    continue
+                if len(filas) >= limite and filas[-1][2] >= f"{anio + 1}-01-01":
+                    break
+                with _adjuntar(cursor, anio, ruta) as esquema:
+                    cursor.execute(sql.format(esquema), params + [limite])
+                    # Por id: mientras se archiva, una fila puede estar en ambos lados
+                    unicas = {m[0]: m for m in filas + cursor.fetchall()}
+                filas = sorted(unicas.values(), key=lambda m: (m[2], m[0]), reverse=True)[:limite]
+            return filas
+
+    # --- Archivo de Años Cerrados ---
+    def _ruta_archivo(self, archivo):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), archivo)
+
+    def _archivos(self, cursor, desde=None, hasta=None):
+        """[(anio, ruta)] de los años archivados que se cruzan con [desde, hasta) ('AAAA-MM-DD'), del más antiguo al más nuevo"""
+        cursor.execute("SELECT anio, archivo FROM archivos ORDER BY anio")
+        return [(anio, self._ruta_archivo(archivo)) for anio, archivo in cursor.fetchall()
+                if (desde is None or f"{anio + 1}-01-01" > desde) and (hasta is None or f"{anio}-01-01" < hasta)]
+
+    def anios_archivados(self):
+        """[(anio, ruta del archivo, movimientos)] de los años archivados"""
+        with self._lectura() as cursor:
+            cursor.execute("SELECT anio, archivo, movimientos FROM archivos ORDER BY anio")
+            return [(anio, self._ruta_archivo(archivo), movimientos) for anio, archivo, movimientos in cursor.fetchall()]
+
+    def archivar_anio(self, anio, compactar=False):
+        """Mueve los movimientos de un año cerrado a su propio archivo y devuelve cuántos movió.
+
+        El archivo (<base>_<anio>.db, junto a la base) se escribe primero desde otra conexión,
+        sin tomar el escritor. Después, en una sola transacción, quedan en la base los totales
+        por día y por producto de lo archivado y se borra de movimientos solo lo que ya está
+        en el archivo: si se corta a mitad no se pierde nada y basta con repetirlo. Saldos,
+        resumen diario, stock y costeo no cambian. compactar=True hace VACUUM al final para
+        devolver el espacio al disco (bloquea la base mientras dura).
+        """
+        anio = int(anio)
+        if anio >= datetime.date.today().year:
+            raise ValueError(f"{anio} no es un año cerrado")
+        if self.db_path == ":memory:":
+            raise ValueError("Una base en memoria no se puede archivar")
+        if not (self.fecha_ts_lista and self.costos_listos):
+            raise ValueError("Hay migraciones por bloques pendientes: complételas antes de archivar (cli.py migrar)")
+        desde, hasta = rango_periodo(str(anio))
+        archivo = f"{os.path.splitext(os.path.basename(self.db_path))[0]}_{anio}.db"
+        ruta = self._ruta_archivo(archivo)
+
+        with self._lectura() as cursor:
+            # Lo que aún no llegó a algún par se enviaría desde movimientos: no se puede archivar
+            cursor.execute("SELECT MIN(enviado) FROM sync_estado WHERE enviado IS NOT NULL")
+            enviado = cursor.fetchone()[0]
+            if enviado is not None:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM cambios c JOIN movimientos m ON m.id = c.fila_id
+                    WHERE c.tabla = 'movimientos' AND c.seq > ? AND m.fecha >= ? AND m.fecha < ?
+                """, (enviado, desde, hasta))
+                pendientes = cursor.fetchone()[0]
+                if pendientes:
+                    raise ValueError(f"{pendientes} movimientos de {anio} aún no se sincronizan: sincronice antes de archivar")
+
+        # 1. Copia: el archivo lee su año de la base adjunta, como cualquier lector en WAL
+        conn = sqlite3.connect(ruta)
+        try:
+            conn.execute("ATTACH DATABASE ? AS principal", (self.db_path,))
+            columnas = conn.execute("PRAGMA principal.table_info(movimientos)").fetchall()
+            conn.execute("CREATE TABLE IF NOT EXISTS movimientos ({})".format(", ".join(
+                f"{nombre} {tipo}{' PRIMARY KEY' if pk else ''}" for _, nombre, tipo, _, _, pk in columnas)))
+            nombres = ", ".join(c[1] for c in columnas)
+            conn.execute(f"""
+                INSERT OR IGNORE INTO main.movimientos ({nombres})
+                SELECT {nombres} FROM principal.movimientos WHERE fecha >= ? AND fecha < ?
+            """, (desde, hasta))
+            # Los del historial y uno que cubre reporte_sii, como idx_movimientos_empresa antes de fecha_ts
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos (empresa_id, fecha)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_empresa ON movimientos "
+                         "(empresa_id, es_formal, tipo, fecha, monto_total)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos (producto_id, fecha)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_movimientos_uid ON movimientos (uid) WHERE uid IS NOT NULL")
+            conn.commit()
+        finally:
+            conn.close()
+
+        # 2. Totales y borrado, en una transacción del escritor (ATTACH tiene que ir fuera de ella)
+        with self._escritura() as cursor:
+            cursor.execute("ATTACH DATABASE ? AS archivo_nuevo", (ruta,))
+            try:
+                cursor.execute("BEGIN")
+                cursor.execute("CREATE TEMP TABLE archivar_ids (id INTEGER PRIMARY KEY)")
+                cursor.execute("""
+                    INSERT INTO archivar_ids
+                    SELECT m.id FROM main.movimientos m
+                    WHERE m.fecha >= ? AND m.fecha < ?
+                      AND EXISTS (SELECT 1 FROM archivo_nuevo.movimientos a WHERE a.id = m.id)
+                """, (desde, hasta))
+                cursor.execute(f"""
+                    INSERT INTO archivo_resumen (anio, empresa_id, dia, tipo, es_formal, monto_total, movimientos, iva)
+                    SELECT ?, empresa_id, fecha_ts / 86400, tipo, es_formal, SUM(monto_total), COUNT(*), SUM({SQL_IVA})
+                    FROM main.movimientos WHERE id IN (SELECT id FROM archivar_ids)
+                    GROUP BY 2, 3, 4, 5
+                    ON CONFLICT (anio, empresa_id, dia, tipo, es_formal) DO UPDATE SET
+                        monto_total = monto_total + excluded.monto_total,
+                        movimientos = movimientos + excluded.movimientos, iva = iva + excluded.iva
+                """, (anio,))
+                cursor.execute(f"""
+                    INSERT INTO archivo_stock (anio, producto_id, empresa_id, cantidad)
+                    SELECT ?, producto_id, empresa_id, SUM({SQL_DELTA_STOCK})
+                    FROM main.movimientos WHERE id IN (SELECT id FROM archivar_ids)
+                    GROUP BY producto_id
+                    ON CONFLICT (anio, producto_id) DO UPDATE SET cantidad = cantidad + excluded.cantidad
+                """, (anio,))
+                # Solo lo que ya recibieron todos los pares conocidos; sin pares no se poda nada (uno
+                # emparejado después recibe lo archivado desde el archivo del año)
+                if enviado is not None:
+                    cursor.execute("DELETE FROM cambios WHERE tabla = 'movimientos' AND seq <= ? "
+                                   "AND fila_id IN (SELECT id FROM archivar_ids)", (enviado,))
+                cursor.execute("DELETE FROM main.movimientos WHERE id IN (SELECT id FROM archivar_ids)")
+                movidos = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO archivos (anio, archivo, movimientos) VALUES (?, ?, ?)
+                    ON CONFLICT (anio) DO UPDATE SET movimientos = movimientos + excluded.movimientos
+                """, (anio, archivo, movidos))
+                cursor.execute("DROP TABLE archivar_ids")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.execute("DETACH DATABASE archivo_nuevo")
+            if compactar:
+                cursor.execute("VACUUM")
+        return movidos
+
+    # --- Sincronización entre Equipos ---
+    def _ids_por_uid(self, cursor, tabla, uids):
+        """Mapa uid -> id local; los uid de este nodo ("nodo:id") apuntan directo a su id"""
+        ids = {}
+        remotos = []
+        prefijo = self.nodo + ":"
+        for uid in set(uids):
+            if uid.startswith(prefijo):
+                ids[uid] = int(uid[len(prefijo):])
+            else:
+                remotos.append(uid)
+        for i in range(0, len(remotos), 500):
+            bloque = remotos[i:i + 500]
+            cursor.execute(f"SELECT uid, id FROM {tabla} WHERE uid IN ({', '.join('?' * len(bloque))})", bloque)
+            ids.update(cursor.fetchall())
+        return ids
+
+    def _uids_archivados(self, cursor, movimientos):
+        """uid de los movimientos recibidos (filas de paquete) que ya están en algún año archivado"""
+        uids = set()
+        for anio, ruta in self._archivos(cursor):
+            candidatos = [m[0] for m in movimientos if m[4][:4] == str(anio)]
+            if not candidatos:
+                continue
+            if not os.path.exists(ruta):
+                raise FileNotFoundError(f"Falta el archivo del año {anio}: {ruta}")
+            # Conexión aparte: dentro de la transacción del escritor no se puede adjuntar
+            conn = sqlite3.connect(ruta)
+            try:
+                for i in range(0, len(candidatos), 500):
+                    bloque = candidatos[i:i + 500]
+                    uids.update(u for u, in conn.execute(
+                        f"SELECT uid FROM movimientos WHERE uid IN ({', '.join('?' * len(bloque))})", bloque))
+            finally:
+                conn.close()
+        return uids
+
+    def marcas_sincronizacion(self, par):
+        """(enviado, recibido): últimos seq ya confirmados con el par"""
+        with self._lectura() as cursor:
+            cursor.execute("SELECT enviado, recibido FROM sync_estado WHERE par = ?", (par,))
+            fila = cursor.fetchone()
+        return (fila[0] or 0, fila[1] or 0) if fila else (0, 0)
+
+    def guardar_marca_envio(self, par, enviado):
+        with self._escritura() as cursor:
+            cursor.execute("""
+                INSERT INTO sync_estado (par, enviado) VALUES (?, ?)
+                ON CONFLICT (par) DO UPDATE SET enviado = excluded.enviado
+            """, (par, enviado))
+            self.conn.commit()
+
+    def cambios_desde(self, seq, limite=1000, excluir=None):
+        """Paquete con los cambios posteriores a seq, sin los que llegaron desde el par 'excluir'.
+
+        Devuelve {"nodo", "hasta", "hay_mas", "productos", "movimientos"}; las filas llevan
+        uid globales (también la referencia al producto) y el estado actual del producto.
+        """
+        with self._lectura() as cursor:
+            cursor.execute("SELECT seq, tabla, fila_id, origen FROM cambios WHERE seq > ? ORDER BY seq LIMIT ?",
+                           (seq, limite + 1))
+            filas = cursor.fetchall()
+            hay_mas = len(filas) > limite
+            filas = filas[:limite]
+            ids = {"productos": [], "movimientos": []}
+            for _, tabla, fila_id, origen in filas:
+                if origen is None or origen != excluir:
+                    ids[tabla].append(fila_id)
+
+            paquete = {"nodo": self.nodo, "hasta": filas[-1][0] if filas else seq, "hay_mas": hay_mas,
+                       "productos": [], "movimientos": []}
+            uid_local = "COALESCE({t}.uid, :nodo || ':' || {t}.id)"
+            # Un producto modificado varias veces viaja una sola vez con su estado actual
+            productos = list(dict.fromkeys(ids["productos"]))
+            for i in range(0, len(productos), 500):
+                bloque = productos[i:i + 500]
+                cursor.execute(f"""
+                    SELECT {uid_local.format(t='p')}, p.empresa_id, p.nombre, p.precio_venta, p.costo_unitario
+                    FROM productos p WHERE p.id IN ({', '.join(f':id{j}' for j in range(len(bloque)))})
+                    ORDER BY p.id
+                """, {"nodo": self.nodo, **{f"id{j}": v for j, v in enumerate(bloque)}})
+                paquete["productos"].extend(cursor.fetchall())
+            movimientos = ids["movimientos"]
+            sql = f"""
+                SELECT m.id, {uid_local.format(t='m')}, m.empresa_id, m.tipo, m.es_formal, m.fecha,
+                       {uid_local.format(t='p')}, m.cantidad, m.monto_total, m.detalle
+                FROM {{}}.movimientos m JOIN main.productos p ON p.id = m.producto_id
+                WHERE m.id IN ({{}})
+                ORDER BY m.id
+            """
+            for i in range(0, len(movimientos), 500):
+                bloque = movimientos[i:i + 500]
+                marcas = ', '.join(f':id{j}' for j in range(len(bloque)))
+                parametros = {"nodo": self.nodo, **{f"id{j}": v for j, v in enumerate(bloque)}}
+                cursor.execute(sql.format("main", marcas), parametros)
+                filas = cursor.fetchall()
+                # Los que ya no están se archivaron antes de que los recibiera algún par: salen de su año
+                if len(filas) < len(bloque):
+                    for anio, ruta in self._archivos(cursor):
+                        with _adjuntar(cursor, anio, ruta) as esquema:
+                            cursor.execute(sql.format(esquema, marcas), parametros)
+                            filas += cursor.fetchall()
+                    filas.sort()
+                paquete["movimientos"].extend(fila[1:] for fila in filas)
+        return paquete
+
+    def aplicar_cambios(self, paquete):
+        """Aplica un paquete de otro nodo en una transacción y guarda su marca de agua.
+
+        Los productos se insertan o actualizan por uid; los movimientos ya conocidos se
+        ignoran, así que reaplicar un paquete no duplica nada. Devuelve
+        (productos, movimientos nuevos, ids locales de productos con movimientos nuevos).
+        """
+        origen = paquete["nodo"]
+        with self._escritura() as cursor:
+            try:
+                cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM cambios")
+                seq_inicial = cursor.fetchone()[0]
+
+                productos = paquete["productos"]
+                ids_producto = self._ids_por_uid(cursor, "productos", [p[0] for p in productos])
+                for uid, empresa_id, nombre, precio, costo in productos:
+                    if uid in ids_producto:
+                        cursor.execute("UPDATE productos SET nombre = ?, precio_venta = ?, costo_unitario = ? WHERE id = ?",
+                                       (nombre, precio, costo, ids_producto[uid]))
+                    else:
+                        cursor.execute("""
+                            INSERT INTO productos (empresa_id, nombre, precio_venta, costo_unitario, stock, uid)
+                            VALUES (?, ?, ?, ?, 0, ?)
+                        """, (empresa_id, nombre, precio, costo, uid))
+                        ids_producto[uid] = cursor.lastrowid
+
+                movimientos = paquete["movimientos"]
+                existentes = self._ids_por_uid(cursor, "movimientos", [m[0] for m in movimientos])
+                nuevos = [m for m in movimientos if m[0] not in existentes]
+                archivados = self._uids_archivados(cursor, nuevos)
+                nuevos = [m for m in nuevos if m[0] not in archivados]
+                faltantes = {m[5] for m in nuevos} - ids_producto.keys()
+                ids_producto.update(self._ids_por_uid(cursor, "productos", faltantes))
+                filas = []
+                for uid, empresa_id, tipo, es_formal, fecha, uid_producto, cantidad, monto_total, detalle in nuevos:
+                    if uid_producto not in ids_producto:
+                        raise ValueError(f"Movimiento {uid} referencia un producto desconocido: {uid_producto}")
+                    filas.append((empresa_id, tipo, es_formal, fecha, ids_producto[uid_producto],
+                                  cantidad, monto_total, detalle, uid, segundos_epoca(fecha)))
+                cursor.executemany("""
+                    INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total, detalle, uid, fecha_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, filas)
+                self._aplicar_efectos(cursor, [f[:7] for f in filas])
+
+                # Lo aplicado queda en el registro (otros pares lo reciben), pero no vuelve al origen
+                cursor.execute("UPDATE cambios SET origen = ? WHERE seq > ?", (origen, seq_inicial))
+                cursor.execute("""
+                    INSERT INTO sync_estado (par, recibido) VALUES (?, ?)
+                    ON CONFLICT (par) DO UPDATE SET recibido = excluded.recibido
+                """, (origen, paquete["hasta"]))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+        for empresa_id in {p[1] for p in productos} | {f[0] for f in filas}:
+            self._invalidar_productos(empresa_id)
+            with self._lock_cache:
+                self._hay_productos.pop(empresa_id, None)
+        return len(productos), len(filas), {f[4] for f in filas}
+
+    def reconstruir_stock(self, ids=None):
+        """Recalcula el stock desde movimientos (solo los ids dados, o todos) y devuelve cuántos cambiaron"""
+        return len(self.conciliar_stock(reparar=True, ids=ids))
+
+    # --- Conciliación e Integridad ---
+    def conciliar_stock(self, empresa_id=None, reparar=False, ids=None, bloque=BLOQUE_CONCILIACION, progreso=None):
+        """Compara productos.stock con el stock que resulta de los movimientos.
+
+        Todo se lee en una transacción de lectura (una foto consistente que no frena a los
+        escritores), con una consulta agrupada por cada rango de `bloque` ids de movimientos,
+        más lo que dejaron en archivo_stock los años archivados. Con `ids` solo se leen los
+        movimientos de esos productos, por idx_movimientos_producto.
+        Devuelve [(empresa_id, producto_id, nombre, guardado, real)]. Con reparar=True suma la
+        diferencia al stock actual, así no pisa las ventas registradas mientras tanto.
+        """
+        filtro, params = (" AND empresa_id = ?", [empresa_id]) if empresa_id is not None else ("", [])
+        real = {}
+        with self._lectura() as cursor:
+            try:
+                cursor.execute("BEGIN")
+                if ids is not None:
+                    # Pocos productos: sus movimientos salen de idx_movimientos_producto, sin recorrer el libro
+                    ids = list(set(ids))
+                    bloques = [ids[i:i + 500] for i in range(0, len(ids), 500)]
+                    for i, bloque_ids in enumerate(bloques):
+                        marcas = ', '.join('?' * len(bloque_ids))
+                        cursor.execute(f"""
+                            SELECT producto_id, SUM({SQL_DELTA_STOCK})
+                            FROM movimientos WHERE producto_id IN ({marcas}){filtro}
+                            GROUP BY producto_id
+                        """, bloque_ids + params)
+                        real.update(cursor.fetchall())
+                        if progreso:
+                            progreso(i + 1, len(bloques))
+                else:
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos")
+                    hasta = cursor.fetchone()[0]
+                    for desde in range(0, hasta, bloque):
+                        cursor.execute(f"""
+                            SELECT producto_id, SUM({SQL_DELTA_STOCK})
+                            FROM movimientos WHERE id > ? AND id <= ?{filtro}
+                            GROUP BY producto_id
+                        """, [desde, desde + bloque] + params)
+                        for prod_id, delta in cursor.fetchall():
+                            real[prod_id] = real.get(prod_id, 0) + delta
+                        if progreso:
+                            progreso(min(desde + bloque, hasta), hasta)
+                # Lo que aportaron los años archivados
+                cursor.execute(f"SELECT producto_id, SUM(cantidad) FROM archivo_stock WHERE 1 = 1{filtro} GROUP BY producto_id",
+                               params)
+                for prod_id, delta in cursor.fetchall():
+                    real[prod_id] = real.get(prod_id, 0) + delta
+                if ids is None:
+                    cursor.execute(f"SELECT empresa_id, id, nombre, stock FROM productos WHERE 1 = 1{filtro}", params)
+                    productos = cursor.fetchall()
+                else:
+                    productos = []
+                    for bloque_ids in bloques:
+                        cursor.execute(f"SELECT empresa_id, id, nombre, stock FROM productos "
+                                       f"WHERE id IN ({', '.join('?' * len(bloque_ids))}){filtro}", bloque_ids + params)
+                        productos += cursor.fetchall()
+                diferencias = [(emp_id, prod_id, nombre, guardado, real.get(prod_id, 0))
+                               for emp_id, prod_id, nombre, guardado in productos
+                               if guardado != real.get(prod_id, 0)]
+            finally:
+                cursor.connection.rollback()
+
+        if reparar and diferencias:
+            with self._escritura() as cursor:
+                try:
+                    cursor.executemany("UPDATE productos SET stock = stock + ? WHERE id = ?",
+                                       [(real - guardado, prod_id) for _, prod_id, _, guardado, real in diferencias])
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            for emp_id in {d[0] for d in diferencias}:
+                self._invalidar_productos(emp_id)
+        return diferencias
+
+    def copiar_a(self, destino, paginas=BLOQUE_RESPALDO, pausa=0.001, progreso=None):
+        """Copia la base a la conexión `destino` con la API de respaldo de SQLite, de a `paginas` por paso.
+
+        Con lectoras (WAL) copia desde una de ellas dentro de una transacción de lectura: el
+        destino queda como la base al empezar y las escrituras no esperan a ningún paso (con
+        la foto fija SQLite tampoco reinicia la copia cuando la app escribe). Sin lectoras
+        copia desde la escritora sin tomar su lock: cada escritura espera a lo sumo un paso
+        y lo que escribe pasa al destino, que queda como la base al terminar.
+        `pausa` segundos entre pasos; progreso(copiadas, total) en páginas.
+        """
+        def paso(estado, restantes, total):
+            if progreso:
+                progreso(total - restantes, total)
+            if pausa and restantes:
+                time.sleep(pausa)  # Dejar pasar a los demás hilos
+
+        if not self._max_lectores:
+            self.conn.backup(destino, pages=paginas, progress=paso)
+            return
+        with self._lectura() as cursor:
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master")  # Abre la transacción de lectura
+            try:
+                cursor.connection.backup(destino, pages=paginas, progress=paso)
+            finally:
+                cursor.connection.rollback()
+            # Lo escrito durante la copia quedó en el -wal (la foto impedía pasarlo a la base):
+            # se pasa aquí, sin frenar a nadie, y no en el commit de la próxima venta
+            cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def verificar_integridad(self):
+        """PRAGMA quick_check: lista vacía si el archivo está sano, si no los problemas encontrados"""
+        with self._lectura() as cursor:
+            cursor.execute("PRAGMA quick_check")
+            problemas = [fila[0] for fila in cursor.fetchall()]
+        return [] if problemas == ["ok"] else problemas
+
+    def podar_cambios(self):
+        """Borra del registro lo ya enviado a todos los pares a los que este equipo envía"""
+        with self._escritura() as cursor:
+            cursor.execute("SELECT MIN(enviado) FROM sync_estado WHERE enviado IS NOT NULL")
+            hasta = cursor.fetchone()[0]
+            if not hasta:
+                return 0
+            cursor.execute("DELETE FROM cambios WHERE seq <= ?", (hasta,))
+            self.conn.commit()
+            return cursor.rowcount
@@ -0,0 +1,71 @@
+import csv
+import gzip
+import json
+import os
+import time
+
+# --- Exportación del Libro de Movimientos (CSV / JSONL) ---
+# Las filas llegan de Database.iterar_movimientos (cursor + fetchmany) y se
+# escriben una a una: el historial completo nunca está en memoria.
+
+COLUMNAS = ["id", "empresa_id", "fecha", "tipo", "es_formal", "producto_id", "producto",
+            "cantidad", "monto_total", "neto", "iva", "detalle"]
+FORMATOS = ("csv", "jsonl")
+
+
+class ResultadoExportacion:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.filas = 0
+        self.bytes = 0
+        self.segundos = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return self.filas / self.segundos if self.segundos else 0.0
+
+
+def formato_de(ruta):
+    nombre = ruta[:-3] if ruta.endswith(".gz") else ruta
+    extension = os.path.splitext(nombre)[1].lower().lstrip(".")
+    return "jsonl" if extension in ("jsonl", "ndjson") else "csv"
+
+
+def _abrir(ruta, comprimir):
+    if comprimir:
+        return gzip.open(ruta, "wt", encoding="utf-8", newline="", compresslevel=6)
+    return open(ruta, "w", encoding="utf-8", newline="")
+
+
+def exportar_movimientos(db, ruta, formato=None, comprimir=None, empresa_id=None, desde=None, hasta=None,
+                         es_formal=None, progreso=None, cada=50000):
+    """Escribe los movimientos filtrados en CSV o JSONL (gzip si la ruta termina en .gz)"""
+    formato = formato or formato_de(ruta)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato} (use {' o '.join(FORMATOS)})")
+    if comprimir is None:
+        comprimir = ruta.endswith(".gz")
+
+    resultado = ResultadoExportacion(ruta)
+    inicio = time.perf_counter()
+    filas = db.iterar_movimientos(empresa_id=empresa_id, desde=desde, hasta=hasta, es_formal=es_formal)
+    with _abrir(ruta, comprimir) as salida:
+        if formato == "csv":
+            escritor = csv.writer(salida)
+            escritor.writerow(COLUMNAS)
+            escribir = escritor.writerow
+        else:
+            def escribir(fila):
+                salida.write(json.dumps(dict(zip(COLUMNAS, fila)), ensure_ascii=False))
+                salida.write("\n")
+
+        for fila in filas:
+            escribir(fila)
+            resultado.filas += 1
+            if progreso and resultado.filas % cada == 0:
+                resultado.segundos = time.perf_counter() - inicio
+                progreso(resultado)
+
+    resultado.segundos = time.perf_counter() - inicio
+    resultado.bytes = os.path.getsize(ruta)
+    return resultado
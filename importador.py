@@ -0,0 +1,233 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import time
+
+# --- Importación de Productos y Movimientos (CSV / JSONL) ---
+# Los archivos se leen fila por fila con generadores y se escriben en bloques,
+# cada uno en su propia transacción: la memoria no depende del tamaño del archivo.
+
+BLOQUE = 5000
+MAX_ERRORES = 100  # Errores guardados para el reporte (el resto solo se cuenta)
+MAX_ENTERO = 2 ** 63 - 1  # INTEGER de SQLite
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.leidas = 0
+        self.importadas = 0
+        self.insertados = 0
+        self.actualizados = 0
+        self.rechazadas = 0
+        self.errores = []  # (linea, mensaje)
+        self.segundos = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return self.leidas / self.segundos if self.segundos else 0.0
+
+    def rechazar(self, linea, mensaje):
+        self.rechazadas += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((linea, mensaje))
+
+
+def _abrir(ruta):
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, "rt", encoding="utf-8-sig", newline="")
+    return open(ruta, "r", encoding="utf-8-sig", newline="")
+
+
+def leer_filas(ruta):
+    """Genera (numero_linea, dict) desde un archivo .csv o .jsonl (opcionalmente .gz)"""
+    nombre = ruta[:-3] if ruta.endswith(".gz") else ruta
+    extension = os.path.splitext(nombre)[1].lower()
+    with _abrir(ruta) as archivo:
+        if extension == ".csv":
+            muestra = archivo.read(4096)
+            archivo.seek(0)
+            try:
+                dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+            except csv.Error:
+                dialecto = csv.excel
+            lector = csv.DictReader(archivo, dialect=dialecto)
+            for fila in lector:
+                yield lector.line_num, fila
+        elif extension in (".jsonl", ".ndjson"):
+            for numero, linea in enumerate(archivo, start=1):
+                if linea.strip():
+                    try:
+                        fila = json.loads(linea)
+                    except json.JSONDecodeError as e:
+                        fila = {"__error__": f"JSON inválido: {e.msg}"}
+                    yield numero, fila
+        else:
+            raise ValueError(f"Formato no soportado: {ruta} (use .csv o .jsonl)")
+
+
+# --- Validación ---
+def _campo(fila, *nombres):
+    for nombre in nombres:
+        valor = fila.get(nombre)
+        if valor is not None and str(valor).strip() != "":
+            return valor.strip() if isinstance(valor, str) else valor
+    return None
+
+
+def _entero(valor, campo, minimo=None):
+    if valor is None:
+        raise ValueError(f"falta '{campo}'")
+    try:
+        numero = int(valor) if isinstance(valor, int) else int(str(valor).strip())
+    except ValueError:
+        # "3.0" o "1e3" valen; "2.7", "inf" o "1e400" no se truncan ni desbordan
+        try:
+            real = float(str(valor))
+        except (ValueError, OverflowError):
+            raise ValueError(f"'{campo}' no es numérico: {valor!r}") from None
+        if not real.is_integer():
+            raise ValueError(f"'{campo}' debe ser un entero: {valor!r}") from None
+        numero = int(real)
+    if abs(numero) > MAX_ENTERO:
+        raise ValueError(f"'{campo}' fuera de rango: {valor!r}")
+    if minimo is not None and numero < minimo:
+        raise ValueError(f"'{campo}' debe ser >= {minimo}: {numero}")
+    return numero
+
+
+def _fecha(valor):
+    if valor is None:
+        return None
+    for formato in ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(str(valor), formato).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    raise ValueError(f"fecha inválida: {valor!r} (use AAAA-MM-DD HH:MM)")
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in ("1", "si", "sí", "true", "s", "formal")
+
+
+def validar_producto(fila):
+    """Devuelve (nombre, precio_venta, costo_unitario) o lanza ValueError"""
+    if "__error__" in fila:
+        raise ValueError(fila["__error__"])
+    nombre = _campo(fila, "nombre", "producto")
+    if not nombre:
+        raise ValueError("falta 'nombre'")
+    precio = _entero(_campo(fila, "precio_venta", "precio"), "precio_venta", minimo=0)
+    costo = _entero(_campo(fila, "costo_unitario", "costo") or 0, "costo_unitario", minimo=0)
+    return str(nombre), precio, costo
+
+
+def validar_movimiento(fila):
+    """Devuelve (producto, tipo, es_formal, cantidad, precio_unitario, detalle, fecha) o lanza ValueError.
+
+    producto es el nombre del producto, o su id si la fila trae 'producto_id'.
+    """
+    if "__error__" in fila:
+        raise ValueError(fila["__error__"])
+    tipo = str(_campo(fila, "tipo") or "").lower()
+    if tipo not in ("venta", "compra"):
+        raise ValueError(f"tipo inválido: {tipo!r}")
+    producto_id = _campo(fila, "producto_id")
+    producto = _entero(producto_id, "producto_id") if producto_id is not None else _campo(fila, "producto", "nombre")
+    if producto is None:
+        raise ValueError("falta 'producto' o 'producto_id'")
+    cantidad = _entero(_campo(fila, "cantidad"), "cantidad", minimo=1)
+    precio = _entero(_campo(fila, "precio_unitario", "precio"), "precio_unitario", minimo=0)
+    formal = _campo(fila, "es_formal", "formal")
+    fecha = _fecha(_campo(fila, "fecha"))
+    detalle = _campo(fila, "detalle") or f"{tipo.capitalize()} importada"
+    return producto, tipo, _booleano(formal) if formal is not None else True, cantidad, precio, str(detalle), fecha
+
+
+# --- Importadores ---
+def _por_bloques(filas, tamano):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def importar_productos(db, empresa_id, ruta, bloque=BLOQUE, progreso=None):
+    """Importa productos (upsert por nombre dentro de la empresa)"""
+    resultado = ResultadoImportacion()
+    inicio = time.perf_counter()
+    for filas in _por_bloques(leer_filas(ruta), bloque):
+        validos = []
+        for linea, fila in filas:
+            resultado.leidas += 1
+            try:
+                validos.append(validar_producto(fila))
+            except ValueError as e:
+                resultado.rechazar(linea, str(e))
+        insertados, actualizados = db.upsert_productos_lote(empresa_id, validos)
+        resultado.insertados += insertados
+        resultado.actualizados += actualizados
+        resultado.importadas += len(validos)
+        resultado.segundos = time.perf_counter() - inicio
+        if progreso:
+            progreso(resultado)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def importar_movimientos(db, empresa_id, ruta, bloque=BLOQUE, progreso=None):
+    """Importa ventas/compras; cada bloque se registra con registrar_transacciones_lote"""
+    resultado = ResultadoImportacion()
+    inicio = time.perf_counter()
+    for filas in _por_bloques(leer_filas(ruta), bloque):
+        validos = []
+        for linea, fila in filas:
+            resultado.leidas += 1
+            try:
+                validos.append((linea, validar_movimiento(fila)))
+            except ValueError as e:
+                resultado.rechazar(linea, str(e))
+
+        # Resolver nombres de producto a ids con una consulta por bloque
+        ids = db.ids_productos_por_nombre(empresa_id, [m[0] for _, m in validos if isinstance(m[0], str)])
+        items = []
+        for linea, (producto, tipo, es_formal, cantidad, precio, detalle, fecha) in validos:
+            prod_id = ids.get(producto) if isinstance(producto, str) else producto
+            if prod_id is None:
+                resultado.rechazar(linea, f"producto no encontrado: {producto!r}")
+                continue
+            items.append((linea, (empresa_id, tipo, es_formal, prod_id, cantidad, precio, detalle, fecha)))
+
+        # Un lote rechazado se revierte completo: se reportan las filas con su motivo y se
+        # reintenta el resto
+        while items:
+            exito, resultados = db.registrar_transacciones_lote([item for _, item in items])
+            if exito:
+                resultado.importadas += len(items)
+                break
+            validos = []
+            for (linea, item), (ok, mensaje) in zip(items, resultados):
+                if ok:
+                    validos.append((linea, item))
+                else:
+                    resultado.rechazar(linea, mensaje)
+            items = validos
+        resultado.segundos = time.perf_counter() - inicio
+        if progreso:
+            progreso(resultado)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+IMPORTADORES = {
+    "productos": importar_productos,
+    "movimientos": importar_movimientos,
+}
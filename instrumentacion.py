@@ -0,0 +1,327 @@
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- Instrumentación opcional ---
+# Instrumentacion.instrumentar_db(db) reemplaza en esa instancia cada método público
+# por uno medido, y sus cursores por CursorMedido. Sin instrumentar no se toca nada:
+# la base corre exactamente el mismo código, sin costo. Se registran llamadas, errores,
+# un histograma de latencias y las filas que entregó SQLite (sumando las llamadas
+# anidadas); las sentencias que superan el umbral quedan en `lentas` con su plan
+# (EXPLAIN QUERY PLAN).
+
+# Límites superiores (segundos) de las cubetas del histograma, como en Prometheus
+CUBETAS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+UMBRAL_LENTA_MS = 50
+MAX_LENTAS = 100
+SENTENCIAS_CON_PLAN = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+# Además de los públicos, los pasos internos de cada escritura y de las tareas por bloques
+METODOS_INTERNOS = ("_aplicar_efectos", "_validar_stock", "_costear", "_completar_tarea")
+
+
+class Medicion:
+    """Acumulado de una operación; cubetas[i] cuenta las llamadas con duración <= CUBETAS[i]"""
+
+    __slots__ = ("llamadas", "errores", "segundos", "maximo", "filas", "cubetas")
+
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.segundos = 0.0
+        self.maximo = 0.0
+        self.filas = 0
+        self.cubetas = [0] * (len(CUBETAS) + 1)  # La última es +Inf
+
+    def registrar(self, segundos, filas, error):
+        self.llamadas += 1
+        self.errores += error
+        self.segundos += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.filas += filas
+        indice = 0
+        while indice < len(CUBETAS) and segundos > CUBETAS[indice]:
+            indice += 1
+        self.cubetas[indice] += 1
+
+    def percentil(self, p):
+        """Límite de la cubeta que contiene el percentil p (0-1); None si cae en +Inf"""
+        objetivo = p * self.llamadas
+        for limite, acumulado in zip(CUBETAS, itertools.accumulate(self.cubetas)):
+            if acumulado >= objetivo:
+                return limite
+        return None
+
+
+class CursorMedido:
+    """Envuelve un cursor sqlite3: mide cada sentencia desde execute hasta la siguiente o el cierre"""
+
+    __slots__ = ("_cursor", "_instrumentacion", "_sql", "_params", "_segundos", "_filas")
+
+    def __init__(self, cursor, instrumentacion):
+        self._cursor = cursor
+        self._instrumentacion = instrumentacion
+        self._sql, self._params, self._segundos, self._filas = None, None, 0.0, 0
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)  # lastrowid, rowcount, connection, ...
+
+    def _medir(self, metodo, *args):
+        t0 = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            self._segundos += time.perf_counter() - t0
+
+    def _iniciar(self, sql, params):
+        self.cerrar()
+        self._sql, self._params, self._segundos, self._filas = sql, params, 0.0, 0
+
+    def execute(self, sql, params=()):
+        self._iniciar(sql, params)
+        self._medir(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, filas):
+        filas = iter(filas)
+        primera = next(filas, None)  # Parámetros de muestra para el plan
+        self._iniciar(sql, primera)
+        self._medir(self._cursor.executemany, sql, [] if primera is None else itertools.chain([primera], filas))
+        return self
+
+    def fetchone(self):
+        fila = self._medir(self._cursor.fetchone)
+        self._filas += fila is not None
+        return fila
+
+    def fetchmany(self, tamano=None):
+        filas = self._medir(self._cursor.fetchmany, *(() if tamano is None else (tamano,)))
+        self._filas += len(filas)
+        return filas
+
+    def fetchall(self):
+        filas = self._medir(self._cursor.fetchall)
+        self._filas += len(filas)
+        return filas
+
+    def __iter__(self):
+        while True:
+            filas = self.fetchmany(500)
+            if not filas:
+                return
+            yield from filas
+
+    def cerrar(self):
+        """Registra la sentencia en curso, si la hay"""
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self._instrumentacion._sentencia(self._cursor.connection, sql, self._params, self._segundos, self._filas)
+
+
+class Instrumentacion:
+    def __init__(self, umbral_lenta_ms=UMBRAL_LENTA_MS, max_lentas=MAX_LENTAS):
+        self.umbral_lenta = umbral_lenta_ms / 1000
+        self.inicio = time.time()
+        self.lentas = deque(maxlen=max_lentas)  # Sentencias lentas más recientes, con su plan
+        self._operaciones = {}  # nombre -> Medicion
+        self._planes = {}  # sql -> plan, para no repetir EXPLAIN de la misma sentencia
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Pila de filas de las operaciones en curso del hilo
+
+    def _pila(self):
+        pila = getattr(self._local, "pila", None)
+        if pila is None:
+            pila = self._local.pila = []
+        return pila
+
+    def _registrar(self, nombre, segundos, filas, error):
+        with self._lock:
+            medicion = self._operaciones.get(nombre)
+            if medicion is None:
+                medicion = self._operaciones[nombre] = Medicion()
+            medicion.registrar(segundos, filas, error)
+
+    @contextmanager
+    def _marco(self, nombre):
+        """Mide un tramo de la operación `nombre` y suma sus filas a la operación que la llamó"""
+        pila = self._pila()
+        pila.append(0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self._registrar(nombre, time.perf_counter() - t0, pila.pop(), True)
+            raise
+        segundos = time.perf_counter() - t0
+        filas = pila.pop()
+        if pila:
+            pila[-1] += filas
+        self._registrar(nombre, segundos, filas, False)
+
+    def medir(self, nombre, funcion):
+        """Versión medida de `funcion`; en generadores se mide solo el tiempo dentro de cada paso"""
+        if inspect.isgeneratorfunction(funcion):
+            return self._medir_generador(nombre, funcion)
+
+        @functools.wraps(funcion)
+        def medida(*args, **kwargs):
+            with self._marco(nombre):
+                return funcion(*args, **kwargs)
+        return medida
+
+    def _medir_generador(self, nombre, funcion):
+        @functools.wraps(funcion)
+        def medida(*args, **kwargs):
+            segundos, filas, error = 0.0, 0, True
+            iterador = funcion(*args, **kwargs)
+            try:
+                while True:
+                    pila = self._pila()  # Puede reanudarse desde otro hilo
+                    pila.append(0)
+                    t0 = time.perf_counter()
+                    try:
+                        elemento = next(iterador)
+                    except StopIteration:
+                        break
+                    finally:
+                        segundos += time.perf_counter() - t0
+                        filas += pila.pop()
+                    yield elemento
+                error = False
+            except GeneratorExit:
+                error = False  # Quien iteraba lo abandonó: no es un error
+                raise
+            finally:
+                pila = self._pila()
+                pila.append(0)
+                t0 = time.perf_counter()
+                try:
+                    iterador.close()  # Cierra también el cursor si se abandonó a medias
+                finally:
+                    segundos += time.perf_counter() - t0
+                    filas += pila.pop()
+                    if pila:
+                        pila[-1] += filas
+                    self._registrar(nombre, segundos, filas, error)
+        return medida
+
+    def _contexto_medido(self, contexto):
+        @contextmanager
+        def medido():
+            with contexto() as cursor:
+                cursor = CursorMedido(cursor, self)
+                try:
+                    yield cursor
+                finally:
+                    cursor.cerrar()
+        return medido
+
+    def _sentencia(self, conn, sql, params, segundos, filas):
+        pila = self._pila()
+        if pila:
+            pila[-1] += filas
+        if segundos < self.umbral_lenta:
+            return
+        self.lentas.append({
+            "sql": " ".join(sql.split()),
+            "ms": round(segundos * 1000, 2),
+            "filas": filas,
+            "plan": self._plan(conn, sql, params),
+            "cuando": time.time(),
+        })
+
+    def _plan(self, conn, sql, params):
+        plan = self._planes.get(sql)
+        if plan is None:
+            if not sql.lstrip().upper().startswith(SENTENCIAS_CON_PLAN):
+                plan = []
+            else:
+                try:
+                    plan = [fila[3] for fila in conn.execute("EXPLAIN QUERY PLAN " + sql, params or ())]
+                except Exception as e:
+                    plan = [f"(sin plan: {e})"]
+            if len(self._planes) < 1000:
+                self._planes[sql] = plan
+        return plan
+
+    def instrumentar_db(self, db):
+        """Mide los métodos públicos (y METODOS_INTERNOS) y los cursores de esta instancia de Database"""
+        for nombre, atributo in vars(type(db)).items():
+            if (not nombre.startswith("_") or nombre in METODOS_INTERNOS) and inspect.isfunction(atributo):
+                setattr(db, nombre, self.medir(f"db.{nombre}", getattr(db, nombre)))
+        db._lectura = self._contexto_medido(db._lectura)
+        db._escritura = self._contexto_medido(db._escritura)
+        return db
+
+    # --- Exportación ---
+    def instantanea(self):
+        """Estado actual como dict serializable en JSON"""
+        with self._lock:
+            operaciones = {
+                nombre: {
+                    "llamadas": m.llamadas,
+                    "errores": m.errores,
+                    "filas": m.filas,
+                    "total_ms": round(m.segundos * 1000, 3),
+                    "promedio_ms": round(m.segundos * 1000 / m.llamadas, 3),
+                    "max_ms": round(m.maximo * 1000, 3),
+                    "p50_ms": None if m.percentil(0.5) is None else m.percentil(0.5) * 1000,
+                    "p99_ms": None if m.percentil(0.99) is None else m.percentil(0.99) * 1000,
+                    "cubetas": {str(limite): n for limite, n in zip(CUBETAS + ("+Inf",), m.cubetas)},
+                } for nombre, m in sorted(self._operaciones.items())
+            }
+        return {"desde": self.inicio, "umbral_lenta_ms": self.umbral_lenta * 1000,
+                "operaciones": operaciones, "lentas": list(self.lentas)}
+
+    def prometheus(self):
+        """Formato de texto de Prometheus (histogramas acumulados, en segundos)"""
+        lineas = [
+            "# HELP jempressa_operacion_segundos Duración de operaciones de Database y pestañas",
+            "# TYPE jempressa_operacion_segundos histogram",
+        ]
+        with self._lock:
+            operaciones = sorted(self._operaciones.items())
+            lentas = len(self.lentas)
+        for nombre, m in operaciones:
+            for limite, acumulado in zip(CUBETAS + ("+Inf",), itertools.accumulate(m.cubetas)):
+                lineas.append(f'jempressa_operacion_segundos_bucket{{operacion="{nombre}",le="{limite}"}} {acumulado}')
+            lineas.append(f'jempressa_operacion_segundos_sum{{operacion="{nombre}"}} {m.segundos:.6f}')
+            lineas.append(f'jempressa_operacion_segundos_count{{operacion="{nombre}"}} {m.llamadas}')
+        for metrica, ayuda, campo in (("errores", "Llamadas que terminaron en excepción", "errores"),
+                                      ("filas", "Filas entregadas por SQLite", "filas")):
+            lineas.append(f"# HELP jempressa_operacion_{metrica}_total {ayuda}")
+            lineas.append(f"# TYPE jempressa_operacion_{metrica}_total counter")
+            lineas.extend(f'jempressa_operacion_{metrica}_total{{operacion="{nombre}"}} {getattr(m, campo)}'
+                          for nombre, m in operaciones)
+        lineas.append("# HELP jempressa_sentencias_lentas Sentencias lentas retenidas")
+        lineas.append("# TYPE jempressa_sentencias_lentas gauge")
+        lineas.append(f"jempressa_sentencias_lentas {lentas}")
+        return "\n".join(lineas) + "\n"
+
+    def guardar(self, ruta):
+        """Escribe la instantánea: Prometheus si la ruta termina en .prom, si no JSON"""
+        if ruta.endswith(".prom"):
+            contenido = self.prometheus()
+        else:
+            contenido = json.dumps(self.instantanea(), ensure_ascii=False, indent=2)
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)  # Quien la lee nunca ve un archivo a medias
+
+    def guardar_cada(self, ruta, segundos=10):
+        """Guarda la instantánea periódicamente en un hilo aparte"""
+        def guardar():
+            while True:
+                time.sleep(segundos)
+                self.guardar(ruta)
+
+        hilo = threading.Thread(target=guardar, daemon=True)
+        hilo.start()
+        return hilo
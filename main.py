@@ -1,157 +1,148 @@
+import time
+
+INICIO_IMPORTACION = time.perf_counter()  # Sonda de arranque: ver informe_arranque
+
 import flet as ft
-import sqlite3
 import datetime
 import os
+import threading
 
-# --- Lógica de Base de Datos y Negocio ---
-class Database:
-    def __init__(self):
-        # Ruta compatible con Android y PC
-        base_dir = os.path.expanduser("~")
-        db_path = os.path.join(base_dir, "erp_empresas.db")
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.create_tables()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # Tabla Empresas
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS empresas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                activa INTEGER DEFAULT 1
-            )
-        """)
-        
-        # Inicializar empresas por defecto si no existen
-        cursor.execute("SELECT COUNT(*) FROM empresas")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("INSERT INTO empresas (nombre) VALUES ('Empresa A')")
-            cursor.execute("INSERT INTO empresas (nombre) VALUES ('Empresa B')")
-        
-        # Tabla Productos (Inventario)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS productos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                empresa_id INTEGER,
-                nombre TEXT,
-                stock INTEGER DEFAULT 0,
-                precio_venta INTEGER,
-                costo_unitario INTEGER
-            )
-        """)
-        
-        # Tabla Movimientos (Compras/Ventas Formales e Informales)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS movimientos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                empresa_id INTEGER,
-                tipo TEXT,          -- 'venta' o 'compra'
-                es_formal INTEGER,  -- 1 = Si (SII), 0 = No (Informal)
-                fecha TEXT,
-                producto_id INTEGER,
-                cantidad INTEGER,
-                monto_total INTEGER, -- Bruto
-                detalle TEXT
-            )
-        """)
-        self.conn.commit()
-
-    # --- Gestión de Empresas ---
-    def obtener_empresas(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM empresas WHERE activa = 1")
-        return cursor.fetchall()
-    
-    def agregar_empresa(self, nombre):
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO empresas (nombre) VALUES (?)", (nombre,))
-        self.conn.commit()
-        return cursor.lastrowid
-    
-    def actualizar_nombre_empresa(self, empresa_id, nuevo_nombre):
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE empresas SET nombre = ? WHERE id = ?", (nuevo_nombre, empresa_id))
-        self.conn.commit()
-    
-    def eliminar_empresa(self, empresa_id):
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE empresas SET activa = 0 WHERE id = ?", (empresa_id,))
-        self.conn.commit()
-
-    # --- Gestión de Inventario ---
-    def obtener_productos(self, empresa_id):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM productos WHERE empresa_id = ?", (empresa_id,))
-        return cursor.fetchall()
-
-    def agregar_producto(self, empresa_id, nombre, precio, costo):
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO productos (empresa_id, nombre, precio_venta, costo_unitario, stock) VALUES (?, ?, ?, ?, 0)",
-                       (empresa_id, nombre, precio, costo))
-        self.conn.commit()
-
-    # --- Motor de Transacciones (El Corazón del Sistema) ---
-    def registrar_transaccion(self, empresa_id, tipo, es_formal, prod_id, cantidad, precio_unitario, detalle):
-        cursor = self.conn.cursor()
-        fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-        monto_total = int(cantidad * precio_unitario)
-
-        try:
-            # 1. Registrar el movimiento financiero
-            cursor.execute("""
-                INSERT INTO movimientos (empresa_id, tipo, es_formal, fecha, producto_id, cantidad, monto_total, detalle)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (empresa_id, tipo, 1 if es_formal else 0, fecha, prod_id, cantidad, monto_total, detalle))
-
-            # 2. Actualizar Inventario Automáticamente
-            if tipo == 'compra':
-                cursor.execute("UPDATE productos SET stock = stock + ? WHERE id = ?", (cantidad, prod_id))
-            elif tipo == 'venta':
-                cursor.execute("UPDATE productos SET stock = stock - ? WHERE id = ?", (cantidad, prod_id))
-
-            self.conn.commit()
-            return True
-        except Exception as e:
-            print(f"Error transaction: {e}")
-            return False
-
-    # --- Contabilidad y Reportes ---
-    def obtener_resumen(self, empresa_id):
-        cursor = self.conn.cursor()
-        # Obtener ventas y compras totales
-        cursor.execute("SELECT tipo, monto_total FROM movimientos WHERE empresa_id = ?", (empresa_id,))
-        data = cursor.fetchall()
-        
-        ventas = sum(x[1] for x in data if x[0] == 'venta')
-        compras = sum(x[1] for x in data if x[0] == 'compra')
-        return ventas, compras
-
-    def reporte_sii(self, empresa_id):
-        """Calcula IVA Débito y Crédito solo de movimientos FORMALES"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT tipo, monto_total FROM movimientos WHERE empresa_id = ? AND es_formal = 1", (empresa_id,))
-        data = cursor.fetchall()
-
-        # En Chile: Monto Bruto / 1.19 = Neto. Bruto - Neto = IVA.
-        iva_debito = 0  # Lo que debo pagar por ventas
-        iva_credito = 0 # Lo que tengo a favor por compras
-        total_ventas_bruto = 0
-        total_compras_bruto = 0
-
-        for tipo, monto in data:
-            neto = int(monto / 1.19)
-            iva = monto - neto
-            
-            if tipo == 'venta':
-                iva_debito += iva
-                total_ventas_bruto += monto
-            else:
-                iva_credito += iva
-                total_compras_bruto += monto
-                
-        return total_ventas_bruto, total_compras_bruto, iva_debito, iva_credito
+from costeo import NOMBRES_METODO
+from database import ESQUEMA_VERSION, Database
+
+# Segundos por etapa del arranque; con JEMPRESSA_ARRANQUE=1 se imprimen al primer pintado
+ARRANQUE = {"importar": time.perf_counter() - INICIO_IMPORTACION}
+
+# Instrumentacion que usará main(): la crea JEMPRESSA_METRICAS o la asigna quien mide (bench.suite)
+INSTRUMENTACION = None
+
+TAMANO_PAGINA = 50     # Productos (o movimientos del historial) por página
+MARGEN_SCROLL = 600    # Píxeles antes del final en que se pide la siguiente página
+
+MAX_RESULTADOS = 8      # Coincidencias que se envían a la interfaz por búsqueda
+RETARDO_BUSQUEDA = 0.3  # Segundos sin teclear antes de buscar
+
+ESQUELETO = "esqueleto"  # data del contenido provisorio mientras una pestaña carga
+PESTANAS_MONTADAS = "pestanas"  # data del contenedor donde quedan montadas las pestañas ya construidas
+HILO_PESTANA = "pestana"  # Nombre de los hilos que cargan una pestaña
+NOMBRES_PESTANAS = ["resumen", "inventario", "contabilidad", "historial", "perfil"]  # Para la instrumentación
+
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+         "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+def opciones_periodo(hoy, meses=12):
+    """Últimos meses ('AAAA-MM') y años ('AAAA') seleccionables en Contabilidad"""
+    opciones = []
+    anio, mes = hoy.year, hoy.month
+    for _ in range(meses):
+        opciones.append(ft.dropdown.Option(key=f"{anio:04d}-{mes:02d}", text=f"{MESES[mes - 1]} {anio}"))
+        anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+    for a in (hoy.year, hoy.year - 1):
+        opciones.append(ft.dropdown.Option(key=f"{a:04d}", text=f"Año {a}"))
+    return opciones
+
+def informe_arranque(version_inicial):
+    """Desglose del arranque en ms y si la base necesitó DDL o migraciones"""
+    etapas = " · ".join(f"{etapa} {segundos * 1000:.1f} ms" for etapa, segundos in ARRANQUE.items())
+    if version_inicial >= ESQUEMA_VERSION:
+        return f"Arranque: {etapas} · esquema v{version_inicial} al día"
+    return f"Arranque: {etapas} · esquema migrado v{version_inicial} → v{ESQUEMA_VERSION}"
+
+def al_primer_uso(construir):
+    """Difiere construir() hasta la primera llamada; construir devuelve la función que se llama"""
+    funcion = []
+    lock = threading.Lock()
+
+    def llamar(*args):
+        with lock:
+            if not funcion:
+                funcion.append(construir())
+        return funcion[0](*args)
+    return llamar
+
+class Debounce:
+    """Llama a `funcion` solo cuando pasan `espera` segundos sin una nueva llamada"""
+    def __init__(self, espera, funcion):
+        self.espera = espera
+        self.funcion = funcion
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.espera, self.funcion, args)
+            self._timer.daemon = True
+            self._timer.start()
+
+def esqueleto_pestana():
+    """Contenido provisorio que se pinta al instante mientras la pestaña consulta sus datos"""
+    bloques = [ft.Container(height=alto, bgcolor="grey200", border_radius=10) for alto in (90, 70, 40, 40)]
+    return ft.Container(
+        content=ft.Column([
+            ft.Row([ft.ProgressRing(width=16, height=16, stroke_width=2), ft.Text("Cargando...", color="grey")])
+        ] + bloques, spacing=15),
+        padding=20, expand=True, data=ESQUELETO
+    )
+
+class VistaPestana(ft.Container):
+    """Pestaña montada: page.update() solo envía su visibilidad y no recorre su contenido,
+    que se envía con page.update(vista) al refrescarla"""
+
+    def is_isolated(self):
+        return True
+
+def grafico_meses(serie):
+    """Barras de ventas (verde) y compras (rojo) por mes desde Database.ultimos_meses"""
+    grafico = ft.BarChart(
+        bottom_axis=ft.ChartAxis(labels_size=24),
+        horizontal_grid_lines=ft.ChartGridLines(color="grey200", width=1),
+        interactive=True, height=180
+    )
+    actualizar_grafico(grafico, serie)
+    return grafico
+
+def actualizar_grafico(grafico, serie):
+    """Pone la serie en el gráfico reutilizando sus barras: solo se envían los valores que cambian"""
+    if len(grafico.bar_groups) != len(serie):
+        grafico.bar_groups = [
+            ft.BarChartGroup(x=i, bars_space=2, bar_rods=[
+                ft.BarChartRod(from_y=0, width=7, color="green", border_radius=2),
+                ft.BarChartRod(from_y=0, width=7, color="red", border_radius=2)
+            ]) for i in range(len(serie))
+        ]
+        grafico.bottom_axis.labels = [ft.ChartAxisLabel(value=i, label=ft.Text(size=10)) for i in range(len(serie))]
+    for grupo, etiqueta, (periodo, ventas, compras) in zip(grafico.bar_groups, grafico.bottom_axis.labels, serie):
+        barra_ventas, barra_compras = grupo.bar_rods
+        barra_ventas.to_y, barra_ventas.tooltip = ventas, f"Ventas {periodo}: ${ventas:,.0f}"
+        barra_compras.to_y, barra_compras.tooltip = compras, f"Compras {periodo}: ${compras:,.0f}"
+        etiqueta.label.value = MESES[int(periodo[5:7]) - 1][:3]
+    grafico.max_y = max([max(ventas, compras) for _, ventas, compras in serie] + [1]) * 1.1
+
+def tarjeta_consolidado(fila, total=False):
+    """Tarjeta de una empresa (o del total) de Database.reporte_consolidado"""
+    _, nombre, ventas, compras, _, _, debito, credito, valor_inventario = fila
+    impuesto = debito - credito
+    color = "white" if total else None
+    secundario = "white70" if total else "grey"
+    inventario = "Calculando..." if valor_inventario is None else f"${valor_inventario:,.0f}"
+    return ft.Container(
+        content=ft.Column([
+            ft.Text(nombre, weight="bold", size=18 if total else 14, color=color),
+            ft.Row([
+                ft.Text(f"📈 ${ventas:,.0f}", color=color, expand=True),
+                ft.Text(f"📉 ${compras:,.0f}", color=color, expand=True)
+            ]),
+            ft.Row([
+                ft.Text(f"{'A Pagar (F29)' if impuesto > 0 else 'Remanente'} ${abs(impuesto):,.0f}",
+                        size=12, color=secundario, expand=True),
+                ft.Text(f"Inventario {inventario}", size=12, color=secundario, expand=True)
+            ])
+        ], spacing=5),
+        bgcolor="blue700" if total else "white", padding=15, border_radius=10,
+        border=None if total else ft.border.all(1, "grey200")
+    )
 
 # --- Interfaz Gráfica (Flet) ---
 def main(page: ft.Page):
@@ -164,50 +155,85 @@ def main(page: ft.Page):
     if os.path.exists("assets/icon.png"):
         page.window_icon = "assets/icon.png"
     
-    db = Database()
+    # Por defecto ~/erp_empresas.db; JEMPRESSA_STOCK_NEGATIVO=0 rechaza ventas sin stock
+    t0 = time.perf_counter()
+    db = Database(os.environ.get("JEMPRESSA_DB"), stock_negativo=os.environ.get("JEMPRESSA_STOCK_NEGATIVO") != "0")
+    ARRANQUE["abrir_base"] = time.perf_counter() - t0
+
+    # JEMPRESSA_METRICAS=ruta.json (o .prom) mide la base y las pestañas y guarda cada 10 s
+    global INSTRUMENTACION
+    if INSTRUMENTACION is None and os.environ.get("JEMPRESSA_METRICAS"):
+        from instrumentacion import Instrumentacion
+        INSTRUMENTACION = Instrumentacion()
+        INSTRUMENTACION.guardar_cada(os.environ["JEMPRESSA_METRICAS"])
+    instrumentacion = INSTRUMENTACION
+    if instrumentacion:
+        instrumentacion.instrumentar_db(db)
     empresa_actual = None # ID de la empresa seleccionada
     nombre_empresa_actual = None
+
+    # La selección de empresa y la interfaz principal quedan montadas y se alternan con
+    # visible: cambiar de empresa no vuelve a enviar los controles que ya tiene el cliente
+    pantalla_seleccion = ft.Container(expand=True)
+    empresas_mostradas = [None]  # Lista con que se construyó la selección
+    interfaz = []  # [vista principal, abrir_empresa] una vez construida
     
     def seleccionar_empresa(id_emp, nombre):
         nonlocal empresa_actual, nombre_empresa_actual
+        otra_empresa = id_emp != empresa_actual
         empresa_actual = id_emp
         nombre_empresa_actual = nombre
         page.title = f"JEmpressa - {nombre}"
-        page.clean()
-        cargar_interfaz_principal(nombre)
+        t0 = time.perf_counter()
+        if not interfaz:
+            interfaz.extend(cargar_interfaz_principal())
+        vista_principal, abrir_empresa = interfaz
+        pantalla_seleccion.visible = False
+        vista_principal.visible = True
+        if vista_principal not in page.controls:
+            page.controls.append(vista_principal)
+        abrir_empresa(nombre, otra_empresa)
+        if "interfaz_principal" not in ARRANQUE:
+            ARRANQUE["interfaz_principal"] = time.perf_counter() - t0
+            if os.environ.get("JEMPRESSA_ARRANQUE") == "1":
+                print(f"Interfaz principal: {ARRANQUE['interfaz_principal'] * 1000:.1f} ms")
     
-    # Modal Nueva Empresa
-    txt_nueva_empresa = ft.TextField(label="Nombre de la Empresa", autofocus=True)
+    # Modal Nueva Empresa (se construye al primer uso)
+    def construir_modal_nueva_empresa():
+        txt_nueva_empresa = ft.TextField(label="Nombre de la Empresa", autofocus=True)
     
-    def guardar_nueva_empresa(e):
-        if txt_nueva_empresa.value:
-            db.agregar_empresa(txt_nueva_empresa.value)
-            txt_nueva_empresa.value = ""
-            modal_nueva_empresa.open = False
-            page.clean()
-            page.add(vista_seleccion_empresa())
-        page.update()
+        def guardar_nueva_empresa(e):
+            if txt_nueva_empresa.value:
+                db.agregar_empresa(txt_nueva_empresa.value)
+                txt_nueva_empresa.value = ""
+                modal_nueva_empresa.open = False
+                mostrar_seleccion()
+            page.update()
     
-    def cerrar_modal_nueva_empresa(e):
-        modal_nueva_empresa.open = False
-        page.update()
+        def cerrar_modal_nueva_empresa(e):
+            modal_nueva_empresa.open = False
+            page.update()
     
-    modal_nueva_empresa = ft.AlertDialog(
-        modal=True,
-        title=ft.Text("➕ Nueva Empresa"),
-        content=txt_nueva_empresa,
-        actions=[
-            ft.TextButton("Cancelar", on_click=cerrar_modal_nueva_empresa),
-            ft.ElevatedButton("Crear", on_click=guardar_nueva_empresa)
-        ]
-    )
+        modal_nueva_empresa = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("➕ Nueva Empresa"),
+            content=txt_nueva_empresa,
+            actions=[
+                ft.TextButton("Cancelar", on_click=cerrar_modal_nueva_empresa),
+                ft.ElevatedButton("Crear", on_click=guardar_nueva_empresa)
+            ]
+        )
     
-    def abrir_modal_nueva_empresa():
-        txt_nueva_empresa.value = ""
-        modal_nueva_empresa.open = True
-        if modal_nueva_empresa not in page.overlay:
-            page.overlay.append(modal_nueva_empresa)
-        page.update()
+        def abrir_modal_nueva_empresa():
+            txt_nueva_empresa.value = ""
+            modal_nueva_empresa.open = True
+            if modal_nueva_empresa not in page.overlay:
+                page.overlay.append(modal_nueva_empresa)
+            page.update()
+
+        return abrir_modal_nueva_empresa
+
+    abrir_modal_nueva_empresa = al_primer_uso(construir_modal_nueva_empresa)
     
     def cerrar_modal(modal):
         modal.open = False
@@ -249,8 +275,7 @@ def main(page: ft.Page):
             )
         
         def volver(e):
-            page.clean()
-            page.add(vista_seleccion_empresa())
+            mostrar_seleccion()
         
         page.clean()
         page.add(
@@ -269,14 +294,79 @@ def main(page: ft.Page):
         )
         page.update()
     
+    # Vista Consolidada: todas las empresas activas en un solo reporte
+    def abrir_consolidado(periodo=None):
+        contenido = ft.Container(content=esqueleto_pestana(), expand=True)
+
+        def cargar():
+            try:
+                filas, total = db.reporte_consolidado(periodo)
+                contenido.content = ft.Column([tarjeta_consolidado(total, total=True)] +
+                                              [tarjeta_consolidado(fila) for fila in filas],
+                                              spacing=10, scroll=ft.ScrollMode.AUTO, expand=True)
+            except Exception as ex:
+                contenido.content = ft.Text(f"Error al cargar: {str(ex)}", color="red")
+            page.update()
+
+        def cambiar_periodo(e):
+            abrir_consolidado(None if e.control.value == "todo" else e.control.value)
+
+        def volver(e):
+            mostrar_seleccion()
+
+        dd_periodo = ft.Dropdown(
+            label="Periodo",
+            options=[ft.dropdown.Option(key="todo", text="Todo el historial")] + opciones_periodo(datetime.date.today()),
+            value=periodo or "todo",
+            on_change=cambiar_periodo
+        )
+        page.clean()
+        page.add(
+            ft.Container(
+                content=ft.Column([
+                    ft.Row([
+                        ft.ElevatedButton("⬅️ Volver", on_click=volver),
+                        ft.Text("Consolidado", size=20, weight="bold")
+                    ], alignment=ft.MainAxisAlignment.START),
+                    ft.Text("IVA solo de movimientos 'Formales' · Inventario al día de hoy", size=12, color="grey",
+                            italic=True),
+                    dd_periodo,
+                    ft.Divider(),
+                    contenido
+                ], expand=True),
+                padding=20,
+                expand=True
+            )
+        )
+        threading.Thread(target=cargar, daemon=True).start()
+
+    snackbar = ft.SnackBar(ft.Text(""))  # Uno solo para toda la app: cada aviso cambia su texto
+
     def mostrar_snackbar(mensaje):
-        page.snack_bar = ft.SnackBar(ft.Text(mensaje))
-        page.snack_bar.open = True
+        snackbar.content.value = mensaje
+        snackbar.open = True
+        page.snack_bar = snackbar
         page.update()
 
     # --- Vista de Selección de Empresa ---
-    def vista_seleccion_empresa():
+    def mostrar_seleccion():
+        """Muestra la selección de empresa; se reconstruye solo si cambió la lista de empresas"""
         empresas = db.obtener_empresas()
+        if empresas != empresas_mostradas[0]:
+            empresas_mostradas[0] = empresas
+            pantalla_seleccion.content = vista_seleccion_empresa(empresas)
+        pantalla_seleccion.visible = True
+        if interfaz:
+            interfaz[0].visible = False
+            page.appbar = None
+        if pantalla_seleccion in page.controls:
+            page.update()
+        else:
+            # Se vuelve de otra vista (gestión, consolidado) que limpió la página
+            page.clean()
+            page.add(pantalla_seleccion)
+
+    def vista_seleccion_empresa(empresas):
         
         def crear_click_empresa(emp_id, emp_nombre):
             def click(e):
@@ -291,6 +381,9 @@ def main(page: ft.Page):
         def click_gestionar(e):
             print("Click en Gestionar Empresas")
             abrir_gestion_empresas()
+
+        def click_consolidado(e):
+            abrir_consolidado()
         
         botones_empresas = []
         iconos = ["🏪", "🏬", "🏢", "🏭", "🏛️"]
@@ -305,6 +398,15 @@ def main(page: ft.Page):
                 )
             )
         
+        if len(empresas) > 1:
+            botones_empresas.append(
+                ft.ElevatedButton(
+                    "📊 Consolidado",
+                    width=300,
+                    on_click=click_consolidado
+                )
+            )
+
         botones_empresas.append(
             ft.ElevatedButton(
                 "➕ Nueva Empresa",
@@ -335,7 +437,8 @@ def main(page: ft.Page):
 
     # --- Componentes de la App Principal ---
     
-    def cargar_interfaz_principal(nombre_empresa):
+    def cargar_interfaz_principal():
+        """Construye la interfaz principal una sola vez; devuelve (vista, abrir_empresa)"""
         
         # Variable para guardar la función de actualización
         actualizar_tab_ref = [None]
@@ -344,108 +447,167 @@ def main(page: ft.Page):
         abrir_modal_producto_ref = [None]
         abrir_modal_transaccion_ref = [None]
         
-        # --- Modales (Formularios) - Definir PRIMERO ---
+        # --- Modales (Formularios): cada uno se construye al abrirlo por primera vez ---
         
         # Modal Producto
-        txt_prod_nom = ft.TextField(label="Nombre Producto")
-        txt_prod_pre = ft.TextField(label="Precio Venta", keyboard_type="number")
-        txt_prod_cos = ft.TextField(label="Costo Unitario", keyboard_type="number")
+        def construir_modal_producto():
+            txt_prod_nom = ft.TextField(label="Nombre Producto")
+            txt_prod_pre = ft.TextField(label="Precio Venta", keyboard_type="number")
+            txt_prod_cos = ft.TextField(label="Costo Unitario", keyboard_type="number")
+        
+            def guardar_producto(e):
+                if txt_prod_nom.value and txt_prod_pre.value:
+                    db.agregar_producto(empresa_actual, txt_prod_nom.value, int(txt_prod_pre.value), int(txt_prod_cos.value) if txt_prod_cos.value else 0)
+                    txt_prod_nom.value = ""
+                    txt_prod_pre.value = ""
+                    txt_prod_cos.value = ""
+                    modal_producto.open = False
+                    if actualizar_tab_ref[0]:
+                        actualizar_tab_ref[0](1) # Recargar inventario
+                page.update()
+
+            def cerrar_modal_producto(e):
+                modal_producto.open = False
+                page.update()
         
-        def guardar_producto(e):
-            if txt_prod_nom.value and txt_prod_pre.value:
-                db.agregar_producto(empresa_actual, txt_prod_nom.value, int(txt_prod_pre.value), int(txt_prod_cos.value) if txt_prod_cos.value else 0)
+            modal_producto = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("Nuevo Producto"),
+                content=ft.Column([txt_prod_nom, txt_prod_pre, txt_prod_cos], tight=True),
+                actions=[
+                    ft.TextButton("Cancelar", on_click=cerrar_modal_producto),
+                    ft.TextButton("Guardar", on_click=guardar_producto)
+                ]
+            )
+
+            def abrir_modal_producto(e):
                 txt_prod_nom.value = ""
                 txt_prod_pre.value = ""
                 txt_prod_cos.value = ""
-                modal_producto.open = False
-                if actualizar_tab_ref[0]:
-                    actualizar_tab_ref[0](1) # Recargar inventario
-            page.update()
+                modal_producto.open = True
+                if modal_producto not in page.overlay:
+                    page.overlay.append(modal_producto)
+                page.update()
 
-        def cerrar_modal_producto(e):
-            modal_producto.open = False
-            page.update()
-        
-        modal_producto = ft.AlertDialog(
-            modal=True,
-            title=ft.Text("Nuevo Producto"),
-            content=ft.Column([txt_prod_nom, txt_prod_pre, txt_prod_cos], tight=True),
-            actions=[
-                ft.TextButton("Cancelar", on_click=cerrar_modal_producto),
-                ft.TextButton("Guardar", on_click=guardar_producto)
-            ]
-        )
+            return abrir_modal_producto
 
-        def abrir_modal_producto(e):
-            txt_prod_nom.value = ""
-            txt_prod_pre.value = ""
-            txt_prod_cos.value = ""
-            modal_producto.open = True
-            page.overlay.append(modal_producto)
-            page.update()
+        abrir_modal_producto = al_primer_uso(construir_modal_producto)
 
         # Modal Transacción
-        dd_prod = ft.Dropdown(label="Producto", options=[])
-        txt_cant = ft.TextField(label="Cantidad", keyboard_type="number", value="1")
-        sw_formal = ft.Switch(label="Es Formal (Boleta/Factura)", value=True)
-        btn_accion = ft.ElevatedButton("Registrar")
+        def construir_modal_transaccion():
+            txt_buscar_prod = ft.TextField(label="🔎 Buscar producto")
+            lista_resultados = ft.ListView(height=220, spacing=0)
+            txt_prod_sel = ft.Text("Ningún producto seleccionado", size=12, color="grey")
+            prod_seleccionado = [None]  # ID del producto elegido
+            busqueda_actual = [0]       # Solo se muestra la respuesta de la búsqueda más reciente
+            txt_cant = ft.TextField(label="Cantidad", keyboard_type="number", value="1")
+            sw_formal = ft.Switch(label="Es Formal (Boleta/Factura)", value=True)
+            btn_accion = ft.ElevatedButton("Registrar")
         
-        def preparar_dd_productos():
-            prods = db.obtener_productos(empresa_actual)
-            dd_prod.options = [ft.dropdown.Option(key=p[0], text=f"{p[2]} (Stock: {p[3]})") for p in prods]
-            if prods: 
-                dd_prod.value = prods[0][0]
-            else:
-                dd_prod.value = None
-            page.update()
+            def seleccionar_producto(p):
+                prod_seleccionado[0] = p[0]
+                txt_prod_sel.value = f"✅ {p[2]} (Stock: {p[3]})"
+                txt_prod_sel.color = None
 
-        def guardar_transaccion(tipo):
-            if dd_prod.value and txt_cant.value:
-                try:
-                    # Buscar precio del producto seleccionado
-                    prods = db.obtener_productos(empresa_actual)
-                    precio_u = 0
-                    for p in prods:
-                        if str(p[0]) == str(dd_prod.value):
-                            # Si es venta usa precio venta, si es compra usa costo
-                            precio_u = p[4] if tipo == 'venta' else p[5]
-                            break
-                    
-                    if precio_u > 0:
-                        db.registrar_transaccion(
-                            empresa_actual, tipo, sw_formal.value, 
-                            int(dd_prod.value), int(txt_cant.value), precio_u, 
-                            f"{tipo.capitalize()} de mercadería"
-                        )
-                        modal_transaccion.open = False
-                        if actualizar_tab_ref[0]:
-                            actualizar_tab_ref[0](0) # Recargar dashboard
-                        mostrar_snackbar(f"{tipo.capitalize()} registrada correctamente")
-                    else:
-                        mostrar_snackbar("Error: Producto no encontrado")
-                except Exception as ex:
-                    mostrar_snackbar(f"Error: {str(ex)}")
-            else:
-                mostrar_snackbar("Por favor completa todos los campos")
-            page.update()
+            def mostrar_resultados(texto, actualizar=True):
+                busqueda_actual[0] += 1
+                numero = busqueda_actual[0]
+                prods = db.buscar_productos(empresa_actual, texto, MAX_RESULTADOS)
+                if numero != busqueda_actual[0]:
+                    return  # Llegó una búsqueda más nueva mientras se consultaba
+            
+                def crear_click(p):
+                    def click(e):
+                        seleccionar_producto(p)
+                        page.update()
+                    return click
+            
+                lista_resultados.controls = [
+                    ft.ListTile(
+                        title=ft.Text(p[2]),
+                        subtitle=ft.Text(f"Stock: {p[3]} · Precio: ${p[4]:,.0f}", size=12),
+                        dense=True,
+                        on_click=crear_click(p)
+                    ) for p in prods
+                ] or [ft.Text("Sin coincidencias", color="grey")]
+                if actualizar:
+                    page.update()
+                return prods
 
-        def cerrar_modal_transaccion(e):
-            modal_transaccion.open = False
-            page.update()
+            buscar_productos_modal = Debounce(RETARDO_BUSQUEDA, mostrar_resultados)
+            txt_buscar_prod.on_change = lambda e: buscar_productos_modal(e.control.value)
+
+            def preparar_busqueda_productos():
+                txt_buscar_prod.value = ""
+                prod_seleccionado[0] = None
+                txt_prod_sel.value = "Ningún producto seleccionado"
+                txt_prod_sel.color = "grey"
+                prods = mostrar_resultados("", actualizar=False)
+                if prods:
+                    seleccionar_producto(prods[0])
+
+            def guardar_transaccion(tipo):
+                if prod_seleccionado[0] and txt_cant.value:
+                    try:
+                        # Si es venta usa precio venta, si es compra usa costo (desde el caché)
+                        precio_u = db.obtener_precio(empresa_actual, prod_seleccionado[0], tipo) or 0
+
+                        if precio_u > 0:
+                            registrada = db.registrar_transaccion(
+                                empresa_actual, tipo, sw_formal.value, 
+                                int(prod_seleccionado[0]), int(txt_cant.value), precio_u, 
+                                f"{tipo.capitalize()} de mercadería"
+                            )
+                            if not registrada:
+                                raise RuntimeError("no se pudo guardar el movimiento")
+                            modal_transaccion.open = False
+                            refrescar_producto(int(prod_seleccionado[0]))
+                            if actualizar_tab_ref[0]:
+                                actualizar_tab_ref[0](0) # Recargar dashboard
+                            mostrar_snackbar(f"{tipo.capitalize()} registrada correctamente")
+                        else:
+                            mostrar_snackbar("Error: Producto no encontrado")
+                    except Exception as ex:
+                        mostrar_snackbar(f"Error: {str(ex)}")
+                else:
+                    mostrar_snackbar("Por favor completa todos los campos")
+                page.update()
+
+            def cerrar_modal_transaccion(e):
+                modal_transaccion.open = False
+                page.update()
         
-        modal_transaccion = ft.AlertDialog(
-            modal=True,
-            title=ft.Text("Registrar Movimiento"),
-            content=ft.Column([dd_prod, txt_cant, sw_formal], tight=True),
-            actions=[
-                ft.TextButton("Cancelar", on_click=cerrar_modal_transaccion),
-                btn_accion
-            ]
-        )
+            modal_transaccion = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("Registrar Movimiento"),
+                content=ft.Column([txt_buscar_prod, lista_resultados, txt_prod_sel, txt_cant, sw_formal], tight=True),
+                actions=[
+                    ft.TextButton("Cancelar", on_click=cerrar_modal_transaccion),
+                    btn_accion
+                ]
+            )
+
+            def mostrar_modal_transaccion(tipo):
+                preparar_busqueda_productos()
+                modal_transaccion.title.value = f"Registrar {tipo.capitalize()}"
+                btn_accion.text = f"Confirmar {tipo.capitalize()}"
+                btn_accion.on_click = lambda e: guardar_transaccion(tipo)
+            
+                # Color distintivo
+                btn_accion.bgcolor = "green" if tipo == "venta" else "red"
+                btn_accion.color = "white"
+            
+                modal_transaccion.open = True
+                if modal_transaccion not in page.overlay:
+                    page.overlay.append(modal_transaccion)
+                page.update()
+
+            return mostrar_modal_transaccion
+
+        mostrar_modal_transaccion = al_primer_uso(construir_modal_transaccion)
 
         def abrir_modal_transaccion(tipo):
-            prods = db.obtener_productos(empresa_actual)
-            if not prods:
+            if not db.hay_productos(empresa_actual):
                 # Mostrar diálogo de alerta
                 def cerrar_dlg_info(e):
                     dlg_info.open = False
@@ -461,21 +623,90 @@ def main(page: ft.Page):
                 page.overlay.append(dlg_info)
                 page.update()
                 return
-                
-            preparar_dd_productos()
-            modal_transaccion.title.value = f"Registrar {tipo.capitalize()}"
-            btn_accion.text = f"Confirmar {tipo.capitalize()}"
-            btn_accion.on_click = lambda e: guardar_transaccion(tipo)
-            
-            # Color distintivo
-            btn_accion.bgcolor = "green" if tipo == "venta" else "red"
-            btn_accion.color = "white"
-            
-            modal_transaccion.open = True
-            if modal_transaccion not in page.overlay:
-                page.overlay.append(modal_transaccion)
-            page.update()
+
+            mostrar_modal_transaccion(tipo)
         
+        # Modal Importación (CSV / JSONL)
+        def construir_modal_importacion():
+            tipo_importacion = ["productos"]
+            txt_importacion = ft.Text("Archivos .csv o .jsonl (también .gz)", size=12, color="grey")
+            barra_importacion = ft.ProgressBar(visible=False)
+
+            def importar_en_segundo_plano(ruta, tipo, empresa_id):
+                def progreso(r):
+                    txt_importacion.value = f"{r.leidas:,} filas · {r.filas_por_segundo:,.0f} filas/s · {r.rechazadas:,} rechazadas"
+                    page.update()
+
+                import importador  # Solo se carga al importar
+
+                try:
+                    r = importador.IMPORTADORES[tipo](db, empresa_id, ruta, progreso=progreso)
+                    mensaje = f"{r.importadas:,} de {r.leidas:,} filas importadas ({r.filas_por_segundo:,.0f} filas/s)"
+                    if r.errores:
+                        linea, error = r.errores[0]
+                        mensaje += f" · {r.rechazadas:,} rechazadas (línea {linea}: {error})"
+                except Exception as ex:
+                    mensaje = f"Error: {str(ex)}"
+                barra_importacion.visible = False
+                txt_importacion.value = mensaje
+                modal_importacion.open = False
+                vigentes.clear()  # Cambiaron muchos productos: cada pestaña se vuelve a armar
+                if actualizar_tab_ref[0]:
+                    actualizar_tab_ref[0](tab_actual[0])
+                mostrar_snackbar(mensaje)
+
+            def archivo_seleccionado(e):
+                if not e.files or not e.files[0].path:
+                    return
+                barra_importacion.visible = True
+                txt_importacion.value = f"Importando {e.files[0].name}..."
+                page.update()
+                threading.Thread(
+                    target=importar_en_segundo_plano,
+                    args=(e.files[0].path, tipo_importacion[0], empresa_actual),
+                    daemon=True
+                ).start()
+
+            selector_archivo = ft.FilePicker(on_result=archivo_seleccionado)
+
+            def elegir_archivo(tipo):
+                tipo_importacion[0] = tipo
+                if selector_archivo not in page.overlay:
+                    page.overlay.append(selector_archivo)
+                    page.update()
+                selector_archivo.pick_files(
+                    dialog_title=f"Importar {tipo}",
+                    allowed_extensions=["csv", "jsonl", "ndjson", "gz"]
+                )
+
+            modal_importacion = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("📥 Importar Datos"),
+                content=ft.Column([
+                    ft.Text("Productos: nombre, precio_venta, costo_unitario (se actualizan por nombre)", size=12),
+                    ft.Text("Movimientos: producto, tipo, cantidad, precio_unitario, es_formal, fecha", size=12),
+                    txt_importacion,
+                    barra_importacion
+                ], tight=True),
+                actions=[
+                    ft.TextButton("Cerrar", on_click=lambda e: cerrar_modal(modal_importacion)),
+                    ft.ElevatedButton("Productos", on_click=lambda e: elegir_archivo("productos")),
+                    ft.ElevatedButton("Movimientos", on_click=lambda e: elegir_archivo("movimientos"))
+                ]
+            )
+
+            def abrir_modal_importacion(e):
+                if not barra_importacion.visible:
+                    txt_importacion.value = "Archivos .csv o .jsonl (también .gz)"
+                modal_importacion.open = True
+                if modal_importacion not in page.overlay:
+                    page.overlay.append(modal_importacion)
+                page.update()
+
+            return abrir_modal_importacion
+
+        abrir_modal_importacion = al_primer_uso(construir_modal_importacion)
+
         # Guardar referencias a las funciones de modales
         abrir_modal_producto_ref[0] = abrir_modal_producto
         abrir_modal_transaccion_ref[0] = abrir_modal_transaccion
@@ -498,39 +729,61 @@ def main(page: ft.Page):
             abrir_modal_producto(e)
         
         # 1. Tablero Resumen (Dashboard)
-        def build_dashboard():
+        def cargar_dashboard():
             ventas, compras = db.obtener_resumen(empresa_actual)
-            utilidad = ventas - compras
-            prods = db.obtener_productos(empresa_actual)
-            
+            metodo = db.metodo_costeo(empresa_actual)
+            return (ventas, compras, db.hay_productos(empresa_actual), db.ultimos_meses(empresa_actual, 12),
+                    metodo, db.valuacion(empresa_actual, metodo))
+
+        def build_dashboard(datos):
+            txt_titulo_utilidad = ft.Text(color="white70")
+            txt_utilidad = ft.Text(size=30, weight="bold", color="white")
+            txt_detalle_costo = ft.Text(size=12, color="white70")
+            txt_ventas = ft.Text(weight="bold")
+            txt_compras = ft.Text(weight="bold")
+            grafico = grafico_meses([])
             # Mensaje de bienvenida si no hay productos
-            alerta_productos = []
-            if not prods:
-                alerta_productos.append(
-                    ft.Container(
-                        content=ft.Column([
-                            ft.Text("👋 ¡Bienvenido!", size=18, weight="bold"),
-                            ft.Text("Para comenzar, agrega productos a tu inventario."),
-                            ft.ElevatedButton(
-                                "➕ Ir a Inventario",
-                                on_click=ir_inventario,
-                                bgcolor="green",
-                                color="white"
-                            )
-                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                        bgcolor="amber100",
-                        padding=20,
-                        border_radius=10,
-                        border=ft.border.all(2, "orange")
+            alerta_productos = ft.Container(
+                content=ft.Column([
+                    ft.Text("👋 ¡Bienvenido!", size=18, weight="bold"),
+                    ft.Text("Para comenzar, agrega productos a tu inventario."),
+                    ft.ElevatedButton(
+                        "➕ Ir a Inventario",
+                        on_click=ir_inventario,
+                        bgcolor="green",
+                        color="white"
                     )
-                )
-            
-            col = ft.Column(alerta_productos + [
+                ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                bgcolor="amber100",
+                padding=20,
+                border_radius=10,
+                border=ft.border.all(2, "orange"),
+                visible=False
+            )
+
+            def refrescar(datos):
+                ventas, compras, hay_productos, serie, metodo, valuacion = datos
+                if valuacion is None:
+                    # La historia aún se está valorizando: utilidad simple mientras tanto
+                    titulo_utilidad, utilidad = "Utilidad Estimada", ventas - compras
+                    detalle_costo = "Calculando costo de inventario..."
+                else:
+                    valor_inventario, costo_vendido = valuacion
+                    titulo_utilidad, utilidad = f"Margen Bruto ({NOMBRES_METODO[metodo]})", ventas - costo_vendido
+                    detalle_costo = f"Costo de lo vendido ${costo_vendido:,.0f} · Inventario ${valor_inventario:,.0f}"
+                alerta_productos.visible = not hay_productos
+                txt_titulo_utilidad.value = titulo_utilidad
+                txt_utilidad.value = f"${utilidad:,.0f}"
+                txt_detalle_costo.value = detalle_costo
+                txt_ventas.value = f"${ventas:,.0f}"
+                txt_compras.value = f"${compras:,.0f}"
+                actualizar_grafico(grafico, serie)
+
+            refrescar(datos)
+            col = ft.Column([
+                alerta_productos,
                 ft.Container(
-                    content=ft.Column([
-                        ft.Text("Utilidad Estimada", color="white70"),
-                        ft.Text(f"${utilidad:,.0f}", size=30, weight="bold", color="white")
-                    ]),
+                    content=ft.Column([txt_titulo_utilidad, txt_utilidad, txt_detalle_costo]),
                     bgcolor="blue700", padding=20, border_radius=15, width=float("inf")
                 ),
                 ft.Row([
@@ -538,84 +791,221 @@ def main(page: ft.Page):
                         content=ft.Column([
                             ft.Text("📈", size=30),
                             ft.Text("Ventas Totales"),
-                            ft.Text(f"${ventas:,.0f}", weight="bold")
+                            txt_ventas
                         ]), bgcolor="green50", padding=15, border_radius=10, expand=True
                     ),
                     ft.Container(
                         content=ft.Column([
                             ft.Text("📉", size=30),
                             ft.Text("Compras Totales"),
-                            ft.Text(f"${compras:,.0f}", weight="bold")
+                            txt_compras
                         ]), bgcolor="red50", padding=15, border_radius=10, expand=True
                     )
                 ]),
+                ft.Text("Últimos 12 meses", weight="bold"),
+                grafico,
                 ft.Divider(),
                 ft.Text("Accesos Rápidos", weight="bold"),
                 ft.Row([
                     ft.ElevatedButton("Nueva Venta", on_click=click_venta, expand=True),
                     ft.ElevatedButton("Nueva Compra", on_click=click_compra, expand=True)
                 ])
-            ], spacing=20)
+            ], spacing=20, scroll=ft.ScrollMode.AUTO)
             
-            return ft.Container(content=col, padding=20, expand=True)
+            return ft.Container(content=col, padding=20, expand=True), refrescar
+
+        def paginar_al_final(lista, paginacion, lock_pagina, cargar_pagina):
+            """Manejador de scroll que pide la siguiente página al acercarse al final de la lista"""
+            def al_hacer_scroll(e):
+                if paginacion["completo"] or e.pixels is None or e.max_scroll_extent is None:
+                    return
+                if e.pixels < e.max_scroll_extent - MARGEN_SCROLL:
+                    return
+                if not lock_pagina.acquire(blocking=False):
+                    return  # ya se está cargando la siguiente página
+                try:
+                    if cargar_pagina():
+                        lista.update()
+                finally:
+                    lock_pagina.release()
+            return al_hacer_scroll
 
         # 2. Inventario
-        def build_inventario():
-            prods = db.obtener_productos(empresa_actual)
-            lista = ft.ListView(expand=True, spacing=10)
-            
-            for p in prods:
-                # p = id, emp_id, nombre, stock, precio, costo
-                valor_inventario = p[3] * p[5] # Stock * Costo
-                lista.controls.append(
-                    ft.Container(
-                        content=ft.Row([
-                            ft.Column([
-                                ft.Text(p[2], weight="bold"), # Nombre
-                                ft.Text(f"Precio: ${p[4]:,.0f}", size=12, color="grey")
-                            ], expand=True),
-                            ft.Column([
-                                ft.Text(f"Stock: {p[3]}", weight="bold", color="blue" if p[3] > 5 else "red"),
-                                ft.Text(f"Val: ${valor_inventario:,.0f}", size=12, color="grey")
-                            ], alignment=ft.MainAxisAlignment.END)
-                        ]),
-                        bgcolor="white", padding=10, border_radius=10, border=ft.border.all(1, "grey200")
-                    )
-                )
+        def valores_de(prods):
+            return db.valor_productos(empresa_actual, [p[0] for p in prods])
+
+        filas_inventario = {}  # id de producto -> fila mostrada en el inventario
+
+        def fila_producto(p, valores=None):
+            # La fila guarda sus textos en data para actualizarlos sin reconstruirla
+            txt_nombre = ft.Text(weight="bold")
+            txt_precio = ft.Text(size=12, color="grey")
+            txt_stock = ft.Text(weight="bold")
+            txt_valor = ft.Text(size=12, color="grey")
+            fila = ft.Container(
+                content=ft.Row([
+                    ft.Column([txt_nombre, txt_precio], expand=True),
+                    ft.Column([txt_stock, txt_valor], alignment=ft.MainAxisAlignment.END)
+                ]),
+                bgcolor="white", padding=10, border_radius=10, border=ft.border.all(1, "grey200"),
+                data=(txt_nombre, txt_precio, txt_stock, txt_valor)
+            )
+            actualizar_fila(fila, p, valores)
+            return fila
+
+        def actualizar_fila(fila, p, valores=None):
+            # p = id, emp_id, nombre, stock, precio, costo; valores = {id: valor} según el costeo
+            txt_nombre, txt_precio, txt_stock, txt_valor = fila.data
+            valor_inventario = valores[p[0]] if valores else p[3] * p[5]  # Sin costeo aún: Stock * Costo
+            txt_nombre.value = p[2]
+            txt_precio.value = f"Precio: ${p[4]:,.0f}"
+            txt_stock.value = f"Stock: {p[3]}"
+            txt_stock.color = "blue" if p[3] > 5 else "red"
+            txt_valor.value = f"Val: ${valor_inventario:,.0f}"
+
+        def refrescar_producto(prod_id):
+            """Actualiza la fila de un producto si está en el inventario (p. ej. tras una venta)"""
+            fila = filas_inventario.get(prod_id)
+            p = db.obtener_producto(empresa_actual, prod_id)
+            if fila is not None and p is not None:
+                actualizar_fila(fila, p, valores_de([p]))
+
+        def cargar_inventario():
+            prods = db.obtener_productos_pagina(empresa_actual, 0, TAMANO_PAGINA)
+            return empresa_actual, prods, valores_de(prods)
+
+        def build_inventario(datos):
+            # Solo se construye la primera página; el resto se pide al acercarse al final
+            lista = ft.ListView(expand=True, spacing=10, on_scroll_interval=100)
+            paginacion = {"empresa": None, "ultimo_id": 0, "completo": False, "buscando": False}
+            lock_pagina = threading.Lock()
+            sin_productos = ft.Text("Aún no hay productos. Usa '➕ Nuevo' o '📥 Importar'.", color="grey")
+
+            def agregar_pagina(prods, valores):
+                if prods:
+                    paginacion["ultimo_id"] = prods[-1][0]
+                    if sin_productos in lista.controls:
+                        lista.controls.remove(sin_productos)
+                    for p in prods:
+                        filas_inventario[p[0]] = fila_producto(p, valores)
+                        lista.controls.append(filas_inventario[p[0]])
+                paginacion["completo"] = len(prods) < TAMANO_PAGINA
+                return bool(prods)
+
+            def cargar_pagina():
+                prods = db.obtener_productos_pagina(empresa_actual, paginacion["ultimo_id"], TAMANO_PAGINA)
+                return agregar_pagina(prods, valores_de(prods))
+
+            def buscar(texto):
+                with lock_pagina:
+                    lista.controls.clear()
+                    filas_inventario.clear()
+                    paginacion["buscando"] = bool(texto.strip())
+                    if paginacion["buscando"]:
+                        # Solo las mejores coincidencias; sin paginación mientras se busca
+                        prods = db.buscar_productos(empresa_actual, texto, TAMANO_PAGINA)
+                        valores = valores_de(prods)
+                        for p in prods:
+                            filas_inventario[p[0]] = fila_producto(p, valores)
+                            lista.controls.append(filas_inventario[p[0]])
+                        paginacion["completo"] = True
+                        if not prods:
+                            lista.controls.append(ft.Text("Sin coincidencias", color="grey"))
+                    else:
+                        paginacion["ultimo_id"] = 0
+                        cargar_pagina()
+                        if not lista.controls:
+                            lista.controls.append(sin_productos)
+                lista.update()
+
+            def refrescar(datos):
+                empresa, prods, valores = datos
+                with lock_pagina:
+                    if empresa != paginacion["empresa"] or paginacion["buscando"] or not filas_inventario:
+                        # Otra empresa (o la vista venía de una búsqueda): se arma la primera página
+                        paginacion["empresa"], paginacion["buscando"] = empresa, False
+                        txt_buscar.value = ""
+                        lista.controls.clear()
+                        filas_inventario.clear()
+                        paginacion["ultimo_id"] = 0
+                        agregar_pagina(prods, valores)
+                        if not lista.controls:
+                            lista.controls.append(sin_productos)
+                        return
+                    # Misma empresa: solo cambian los valores de las filas ya mostradas
+                    for p in prods:
+                        if p[0] in filas_inventario:
+                            actualizar_fila(filas_inventario[p[0]], p, valores)
+                    if paginacion["completo"]:
+                        cargar_pagina()  # Productos agregados después del último mostrado
+
+            buscar_inventario = Debounce(RETARDO_BUSQUEDA, buscar)
+            txt_buscar = ft.TextField(label="🔎 Buscar producto", on_change=lambda e: buscar_inventario(e.control.value))
+
+            lista.on_scroll = paginar_al_final(lista, paginacion, lock_pagina, cargar_pagina)
+            refrescar(datos)
             
             col = ft.Column([
                 ft.Row([
                     ft.Text("Productos", size=20, weight="bold"),
-                    ft.ElevatedButton("➕ Nuevo", on_click=click_nuevo_producto)
+                    ft.Row([
+                        ft.ElevatedButton("📥 Importar", on_click=abrir_modal_importacion),
+                        ft.ElevatedButton("➕ Nuevo", on_click=click_nuevo_producto)
+                    ])
                 ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                txt_buscar,
                 lista
             ], expand=True)
             
-            return ft.Container(content=col, padding=20, expand=True)
+            return ft.Container(content=col, padding=20, expand=True), refrescar
 
         # 3. Contabilidad SII
-        def build_contabilidad():
-            v_bruto, c_bruto, debito, credito = db.reporte_sii(empresa_actual)
-            impuesto_pagar = debito - credito
-            color_res = "red" if impuesto_pagar > 0 else "green"
-            texto_res = "A Pagar (F29)" if impuesto_pagar > 0 else "Remanente"
-            
+        periodo_sii = [datetime.date.today().strftime("%Y-%m")]  # Periodo tributario mostrado
+
+        def cambiar_periodo(e):
+            periodo_sii[0] = e.control.value
+            actualizar_tab(2)
+
+        def cargar_contabilidad():
+            periodo = periodo_sii[0]
+            return periodo, db.reporte_sii(empresa_actual, periodo)
+
+        def build_contabilidad(datos):
+            dd_periodo = ft.Dropdown(
+                label="Periodo",
+                options=opciones_periodo(datetime.date.today()),
+                on_change=cambiar_periodo
+            )
+            txt_debito = ft.Text(color="red")
+            txt_credito = ft.Text(color="green")
+            txt_resultado = ft.Text(weight="bold")
+            txt_impuesto = ft.Text(weight="bold", size=18)
+
+            def refrescar(datos):
+                periodo, (v_bruto, c_bruto, debito, credito) = datos
+                impuesto_pagar = debito - credito
+                dd_periodo.value = periodo
+                txt_debito.value = f"+ ${debito:,.0f}"
+                txt_credito.value = f"- ${credito:,.0f}"
+                txt_resultado.value = "A Pagar (F29)" if impuesto_pagar > 0 else "Remanente"
+                txt_impuesto.value = f"${abs(impuesto_pagar):,.0f}"
+                txt_impuesto.color = "red" if impuesto_pagar > 0 else "green"
+
+            refrescar(datos)
             col = ft.Column([
                 ft.Text("Contabilidad (Norma Chilena)", size=20, weight="bold"),
                 ft.Text("Solo considera movimientos 'Formales'", size=12, color="grey", italic=True),
+                dd_periodo,
                 ft.Divider(),
                 ft.Container(
                     content=ft.Column([
                         ft.Text("IVA Débito (Ventas)", weight="bold"),
-                        ft.Text(f"+ ${debito:,.0f}", color="red"),
+                        txt_debito,
                         ft.Divider(),
                         ft.Text("IVA Crédito (Compras)", weight="bold"),
-                        ft.Text(f"- ${credito:,.0f}", color="green"),
+                        txt_credito,
                         ft.Divider(thickness=2),
-                        ft.Row([
-                            ft.Text(texto_res, weight="bold"),
-                            ft.Text(f"${abs(impuesto_pagar):,.0f}", weight="bold", size=18, color=color_res)
-                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+                        ft.Row([txt_resultado, txt_impuesto], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
                     ]),
                     padding=20, bgcolor="white", border_radius=10, border=ft.border.all(1, "grey300")
                 ),
@@ -625,12 +1015,137 @@ def main(page: ft.Page):
                 )
             ])
             
-            return ft.Container(content=col, padding=20, expand=True)
+            return ft.Container(content=col, padding=20, expand=True), refrescar
+
+        # 4. Historial de movimientos
+        filtros_historial = {"tipo": None, "es_formal": None, "producto_id": None, "desde": None, "hasta": None}
+
+        def cargar_historial():
+            filtros = dict(filtros_historial)
+            return empresa_actual, filtros, db.pagina_movimientos(empresa_actual, limite=TAMANO_PAGINA, **filtros)
+
+        def fila_movimiento(m):
+            # m = id, emp_id, fecha, tipo, es_formal, prod_id, producto, cantidad, monto, neto, iva, detalle
+            es_venta = m[3] == "venta"
+            return ft.Container(
+                content=ft.Row([
+                    ft.Column([
+                        ft.Text(m[6] or f"Producto {m[5]}", weight="bold"),
+                        ft.Text(f"{m[2]} · {'Formal' if m[4] else 'Informal'} · #{m[0]}", size=12, color="grey")
+                    ], expand=True),
+                    ft.Column([
+                        ft.Text(f"{'+' if es_venta else '-'} ${m[8]:,.0f}", weight="bold", color="green" if es_venta else "red"),
+                        ft.Text(f"{m[7]} u. · IVA ${m[10]:,.0f}" if m[4] else f"{m[7]} u.", size=12, color="grey")
+                    ], horizontal_alignment=ft.CrossAxisAlignment.END)
+                ]),
+                bgcolor="white", padding=10, border_radius=10, border=ft.border.all(1, "grey200"),
+                data=(m[2], m[0])  # Clave (fecha, id) de la paginación
+            )
+
+        def fecha_filtro(texto):
+            texto = (texto or "").strip()
+            return datetime.date.fromisoformat(texto).strftime("%Y-%m-%d") if texto else None
 
-        # 4. Perfil/Configuración
-        def build_perfil():
+        def build_historial(datos):
+            # Se muestra la primera página; el resto se pide por clave (fecha, id) al acercarse al final
+            lista = ft.ListView(expand=True, spacing=10, on_scroll_interval=100)
+            paginacion = {"empresa": None, "filtros": None, "ultima": None, "completo": False}
+            lock_pagina = threading.Lock()
+            sin_movimientos = ft.Text("No hay movimientos con estos filtros.", color="grey")
+            txt_aviso = ft.Text(size=12, color="grey")
+
+            def agregar_pagina(filas):
+                if filas:
+                    paginacion["ultima"] = (filas[-1][2], filas[-1][0])
+                    lista.controls.extend(fila_movimiento(m) for m in filas)
+                paginacion["completo"] = len(filas) < TAMANO_PAGINA
+                return bool(filas)
+
+            def cargar_pagina():
+                return agregar_pagina(db.pagina_movimientos(empresa_actual, paginacion["ultima"], TAMANO_PAGINA,
+                                                            **paginacion["filtros"]))
+
+            def aplicar_filtros(e=None):
+                try:
+                    desde, hasta = fecha_filtro(txt_desde.value), fecha_filtro(txt_hasta.value)
+                except ValueError:
+                    txt_aviso.value = "Fecha inválida: use AAAA-MM-DD"
+                    txt_aviso.color = "red"
+                    page.update()
+                    return
+                if txt_aviso.color == "red":
+                    txt_aviso.value = ""
+                filtros_historial.update(
+                    tipo=dd_tipo.value if dd_tipo.value in ("venta", "compra") else None,
+                    es_formal={"1": True, "0": False}.get(dd_formal.value),
+                    desde=desde, hasta=hasta
+                )
+                actualizar_tab(3)
+
+            def filtrar_producto(texto):
+                prods = db.buscar_productos(empresa_actual, texto, 1) if texto.strip() else []
+                filtros_historial["producto_id"] = prods[0][0] if prods else None
+                txt_aviso.value = f"Producto: {prods[0][2]}" if prods else ("Sin coincidencias: todos los productos"
+                                                                            if texto.strip() else "")
+                txt_aviso.color = "grey"
+                actualizar_tab(3)
+
+            filtrar_producto_historial = Debounce(RETARDO_BUSQUEDA, filtrar_producto)
+            dd_tipo = ft.Dropdown(label="Tipo", value="todos", expand=True, on_change=aplicar_filtros, options=[
+                ft.dropdown.Option("todos", "Todos"), ft.dropdown.Option("venta", "Ventas"),
+                ft.dropdown.Option("compra", "Compras")])
+            dd_formal = ft.Dropdown(label="Formalidad", value="todos", expand=True, on_change=aplicar_filtros, options=[
+                ft.dropdown.Option("todos", "Todos"), ft.dropdown.Option("1", "Formales"),
+                ft.dropdown.Option("0", "Informales")])
+            txt_producto = ft.TextField(label="🔎 Producto",
+                                        on_change=lambda e: filtrar_producto_historial(e.control.value))
+            txt_desde = ft.TextField(label="Desde (AAAA-MM-DD)", expand=True, on_submit=aplicar_filtros,
+                                     on_blur=aplicar_filtros)
+            txt_hasta = ft.TextField(label="Hasta (AAAA-MM-DD)", expand=True, on_submit=aplicar_filtros,
+                                     on_blur=aplicar_filtros)
+
+            def refrescar(datos):
+                empresa, filtros, filas = datos
+                with lock_pagina:
+                    claves = [(m[2], m[0]) for m in filas]
+                    if (empresa, filtros) == (paginacion["empresa"], paginacion["filtros"]) and claves:
+                        # Mismos filtros: si la página nueva termina en las filas ya mostradas, solo
+                        # se agregan arriba los movimientos nuevos
+                        mostradas = [c.data for c in lista.controls[:len(claves)]]
+                        nuevos = next((i for i in range(len(claves)) if claves[i:] == mostradas[:len(claves) - i]), None)
+                        if nuevos is not None:
+                            lista.controls[0:0] = [fila_movimiento(m) for m in filas[:nuevos]]
+                            return
+                    if empresa != paginacion["empresa"]:
+                        txt_producto.value = ""  # El filtro por producto era de la otra empresa
+                        txt_aviso.value = ""
+                    paginacion.update(empresa=empresa, filtros=filtros, ultima=None)
+                    lista.controls.clear()
+                    agregar_pagina(filas)
+                    if not lista.controls:
+                        lista.controls.append(sin_movimientos)
+
+            lista.on_scroll = paginar_al_final(lista, paginacion, lock_pagina, cargar_pagina)
+            refrescar(datos)
+
+            col = ft.Column([
+                ft.Text("Historial de Movimientos", size=20, weight="bold"),
+                ft.Row([dd_tipo, dd_formal]),
+                txt_producto,
+                ft.Row([txt_desde, txt_hasta]),
+                txt_aviso,
+                lista
+            ], expand=True)
+
+            return ft.Container(content=col, padding=20, expand=True), refrescar
+
+        # 5. Perfil/Configuración
+        def cargar_perfil():
+            return db.obtener_empresas(), db.metodo_costeo(empresa_actual)
+
+        def build_perfil(datos):
             nonlocal nombre_empresa_actual
-            empresas = db.obtener_empresas()
+            empresas, metodo = datos
             
             txt_nombre_actual = ft.TextField(
                 label="Nombre de esta Empresa",
@@ -642,8 +1157,22 @@ def main(page: ft.Page):
                 if txt_nombre_actual.value:
                     db.actualizar_nombre_empresa(empresa_actual, txt_nombre_actual.value)
                     nombre_empresa_actual = txt_nombre_actual.value
-                    page.appbar.title.value = nombre_empresa_actual
+                    txt_titulo.value = nombre_empresa_actual
                     mostrar_snackbar("Nombre actualizado correctamente")
+
+            # Ambos métodos se llevan al día: cambiar de método no recalcula nada
+            dd_metodo = ft.Dropdown(
+                label="Método de costeo del inventario",
+                value=metodo,
+                options=[ft.dropdown.Option(clave, nombre) for clave, nombre in NOMBRES_METODO.items()],
+                width=300
+            )
+
+            def cambiar_metodo(e):
+                db.cambiar_metodo_costeo(empresa_actual, dd_metodo.value)
+                mostrar_snackbar(f"Costeo por {NOMBRES_METODO[dd_metodo.value]}")
+
+            dd_metodo.on_change = cambiar_metodo
             
             # Lista de todas las empresas
             lista_empresas_items = []
@@ -676,7 +1205,8 @@ def main(page: ft.Page):
                             "💾 Guardar Cambios",
                             on_click=guardar_nombre_empresa,
                             width=300
-                        )
+                        ),
+                        dd_metodo
                     ]),
                     padding=15,
                     bgcolor="white",
@@ -708,7 +1238,8 @@ def main(page: ft.Page):
                 )
             ], scroll=ft.ScrollMode.AUTO)
             
-            return ft.Container(content=col, padding=20, expand=True)
+            # Sin refrescar: la lista de empresas cambia poco y se reconstruye en cada visita
+            return ft.Container(content=col, padding=20, expand=True), None
         
         def abrir_modal_nueva_empresa_desde_perfil():
             txt_nueva_emp = ft.TextField(label="Nombre de la Nueva Empresa", autofocus=True)
@@ -722,7 +1253,7 @@ def main(page: ft.Page):
                     db.agregar_empresa(txt_nueva_emp.value)
                     modal_temp.open = False
                     if actualizar_tab_ref[0]:
-                        actualizar_tab_ref[0](3)  # Recargar perfil
+                        actualizar_tab_ref[0](4)  # Recargar perfil
                 page.update()
             
             modal_temp = ft.AlertDialog(
@@ -740,54 +1271,135 @@ def main(page: ft.Page):
             page.update()
 
         # --- Navegación ---
-        tabs_content = ft.Container(expand=True)
+        # Cada pestaña se construye una vez y queda montada (oculta) en tabs_content; al
+        # volver a ella solo se reenvían los valores que cambiaron
+        esqueleto = esqueleto_pestana()
+        tabs_content = ft.Column([esqueleto], expand=True, spacing=0, data=PESTANAS_MONTADAS)
+        vistas = {}  # índice -> (vista, refrescar) ya construidas
+        vigentes = set()  # Pestañas cuya vista es de la empresa actual y se puede mostrar mientras carga
         tab_actual = [0]  # Lista para permitir modificación en lambda
-        
+        carga_tab = [0]  # Número de la última carga pedida: los resultados de cargas anteriores se descartan
+        lock_tab = threading.Lock()
+        pestanas = [
+            (cargar_dashboard, build_dashboard),
+            (cargar_inventario, build_inventario),
+            (cargar_contabilidad, build_contabilidad),
+            (cargar_historial, build_historial),
+            (cargar_perfil, build_perfil),
+        ]
+        if instrumentacion:
+            pestanas = [(instrumentacion.medir(f"pestana.{nombre}.cargar", cargar),
+                         instrumentacion.medir(f"pestana.{nombre}.construir", construir))
+                        for nombre, (cargar, construir) in zip(NOMBRES_PESTANAS, pestanas)]
+
+        def mostrar(vista):
+            for control in tabs_content.controls:
+                control.visible = control is vista
+
         def actualizar_tab(index):
-            tab_actual[0] = index
-            tabs_content.content = None
-            if index == 0: tabs_content.content = build_dashboard()
-            elif index == 1: tabs_content.content = build_inventario()
-            elif index == 2: tabs_content.content = build_contabilidad()
-            elif index == 3: tabs_content.content = build_perfil()
-            actualizar_botones_nav()
+            # Se muestra la vista anterior (o el esqueleto) de inmediato; las consultas corren en un hilo aparte
+            with lock_tab:
+                tab_actual[0] = index
+                carga_tab[0] += 1
+                carga = carga_tab[0]
+                mostrar(vistas[index][0] if index in vigentes else esqueleto)
+                actualizar_botones_nav()
             page.update()
+            threading.Thread(target=completar_tab, args=(index, carga), name=HILO_PESTANA, daemon=True).start()
+
+        def completar_tab(index, carga):
+            cargar, construir = pestanas[index]
+            anterior, refrescar = vistas.get(index, (None, None))
+            try:
+                datos = cargar()
+                if carga != carga_tab[0]:
+                    return  # El usuario ya cambió de pestaña: no construir nada
+                if refrescar:
+                    if instrumentacion:
+                        refrescar = instrumentacion.medir(f"pestana.{NOMBRES_PESTANAS[index]}.refrescar", refrescar)
+                    refrescar(datos)
+                    vista = anterior
+                else:
+                    contenido, refrescar = construir(datos)
+                    vista = VistaPestana(content=contenido, expand=True)
+                error = False
+            except Exception as ex:
+                vista = VistaPestana(content=ft.Text(f"Error al cargar: {str(ex)}", color="red"), padding=20)
+                refrescar, error = None, True
+            with lock_tab:
+                if carga != carga_tab[0]:
+                    return
+                if vista is not anterior:
+                    if anterior in tabs_content.controls:
+                        tabs_content.controls[tabs_content.controls.index(anterior)] = vista
+                    else:
+                        tabs_content.controls.append(vista)
+                vistas[index] = (vista, refrescar)
+                if error:
+                    vigentes.discard(index)
+                else:
+                    vigentes.add(index)
+                mostrar(vista)
+            # En un solo envío: la visibilidad (page) y lo que cambió dentro de la vista refrescada
+            if vista is anterior:
+                page.update(page, vista)
+            else:
+                page.update()
         
         # Guardar la referencia
         actualizar_tab_ref[0] = actualizar_tab
 
         def actualizar_botones_nav():
-            for i, btn in enumerate([btn_resumen, btn_inventario, btn_contabilidad, btn_perfil]):
+            for i, btn in enumerate([btn_resumen, btn_inventario, btn_contabilidad, btn_historial, btn_perfil]):
                 btn.bgcolor = "blue" if i == tab_actual[0] else None
                 btn.color = "white" if i == tab_actual[0] else None
 
         btn_resumen = ft.ElevatedButton("📊 Resumen", on_click=lambda e: actualizar_tab(0), expand=True)
         btn_inventario = ft.ElevatedButton("📦 Inventario", on_click=lambda e: actualizar_tab(1), expand=True)
         btn_contabilidad = ft.ElevatedButton("🧮 Contabilidad", on_click=lambda e: actualizar_tab(2), expand=True)
-        btn_perfil = ft.ElevatedButton("⚙️ Perfil", on_click=lambda e: actualizar_tab(3), expand=True)
+        btn_historial = ft.ElevatedButton("🧾 Historial", on_click=lambda e: actualizar_tab(3), expand=True)
+        btn_perfil = ft.ElevatedButton("⚙️ Perfil", on_click=lambda e: actualizar_tab(4), expand=True)
         
         nav_bar = ft.Row([
             btn_resumen,
             btn_inventario,
             btn_contabilidad,
+            btn_historial,
             btn_perfil
         ], spacing=5)
 
         # Botón para salir/cambiar empresa
-        btn_salir = ft.ElevatedButton("🔙 Cambiar", on_click=lambda e: (page.clean(), page.add(vista_seleccion_empresa())))
+        btn_salir = ft.ElevatedButton("🔙 Cambiar", on_click=lambda e: mostrar_seleccion())
 
-        page.appbar = ft.AppBar(
-            title=ft.Text(nombre_empresa),
+        txt_titulo = ft.Text()
+        barra = ft.AppBar(
+            title=txt_titulo,
             bgcolor="blue", color="white",
             actions=[btn_salir]
         )
-        
-        page.add(tabs_content, nav_bar)
-        actualizar_botones_nav()
-        actualizar_tab(0)
 
-    # Iniciar App
-    page.add(vista_seleccion_empresa())
+        def abrir_empresa(nombre, otra_empresa):
+            txt_titulo.value = nombre
+            page.appbar = barra
+            if otra_empresa:
+                vigentes.clear()  # Las vistas armadas muestran datos de la empresa anterior
+                filtros_historial["producto_id"] = None
+            actualizar_tab(0)
+
+        return ft.Column([tabs_content, nav_bar], expand=True), abrir_empresa
+
+    # Iniciar App: la selección de empresa se pinta antes de lanzar las tareas pendientes
+    t0 = time.perf_counter()
+    mostrar_seleccion()
+    ARRANQUE["primer_pintado"] = time.perf_counter() - t0
+    db.completar_en_segundo_plano()  # Migraciones por bloques pendientes (fecha_ts, costos)
+    # JEMPRESSA_RESPALDOS=carpeta respalda la base una vez al día sin cerrar la app
+    if os.environ.get("JEMPRESSA_RESPALDOS"):
+        import respaldo
+        respaldo.respaldar_cada(db, os.environ["JEMPRESSA_RESPALDOS"],
+                                al_fallar=lambda e: mostrar_snackbar(f"⚠️ Respaldo fallido: {e}"))
+    if os.environ.get("JEMPRESSA_ARRANQUE") == "1":
+        print(informe_arranque(db.version_inicial))
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from database import COLUMNAS_CONSOLIDADO, Database
+from instrumentacion import Instrumentacion
+import respaldo
+
+# --- Servidor HTTP sin interfaz (API REST sobre Database) ---
+# Cajas y teléfonos comparten un mismo libro a través de este servicio. Las
+# escrituras pasan por una sola tarea escritora (cola asyncio) y las lecturas
+# corren en paralelo en un pool de hilos sobre las conexiones lectoras en WAL.
+# Las ventas que esperan en la cola se confirman juntas con registrar_transacciones_lote.
+
+MAX_CUERPO = 1024 * 1024
+MAX_AGRUPADAS = 500  # Ventas/compras confirmadas en una misma transacción
+MAX_MOVIMIENTOS = 1000
+
+COLUMNAS_EMPRESA = ("id", "nombre", "activa")
+COLUMNAS_PRODUCTO = ("id", "empresa_id", "nombre", "stock", "precio_venta", "costo_unitario")
+COLUMNAS_MOVIMIENTO = ("id", "empresa_id", "fecha", "tipo", "es_formal", "producto_id", "producto",
+                       "cantidad", "monto_total", "neto", "iva", "detalle")
+ESTADOS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def _fila(columnas, fila):
+    return dict(zip(columnas, fila)) if fila is not None else None
+
+
+def _resolver(futuro, resultado=None, error=None):
+    # El cliente pudo desconectarse mientras esperaba: su futuro ya está cancelado
+    if futuro.done():
+        return
+    if error is not None:
+        futuro.set_exception(error)
+    else:
+        futuro.set_result(resultado)
+
+
+def _entero(valor, campo, minimo=None):
+    # int(1999.99) truncaría a 1999: un número de JSON con decimales se rechaza
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ErrorHTTP(400, f"'{campo}' debe ser un entero")
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError, OverflowError):
+        raise ErrorHTTP(400, f"'{campo}' debe ser un entero") from None
+    if minimo is not None and numero < minimo:
+        raise ErrorHTTP(400, f"'{campo}' debe ser >= {minimo}")
+    return numero
+
+
+def _booleano(valor, campo):
+    # Solo true/false o 0/1 de JSON: bool("false") sería True
+    if isinstance(valor, int) and valor in (0, 1):
+        return bool(valor)
+    raise ErrorHTTP(400, f"'{campo}' debe ser true o false")
+
+
+def _texto(datos, campo):
+    valor = datos.get(campo)
+    if not isinstance(valor, str) or not valor.strip():
+        raise ErrorHTTP(400, f"falta '{campo}'")
+    return valor.strip()
+
+
+class Servidor:
+    def __init__(self, db, lectores=4, agrupar=True, instrumentacion=None):
+        self.db = db
+        self.agrupar = agrupar
+        self.instrumentacion = instrumentacion
+        self._pool_lectura = ThreadPoolExecutor(max_workers=lectores, thread_name_prefix="lectura")
+        self._hilo_escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="escritura")
+        self._cola = None
+        self._tarea_escritora = None
+        self._servidor = None
+        self.rutas = [
+            ("GET", r"/salud", self.salud),
+            ("GET", r"/metricas", self.metricas),
+            ("GET", r"/empresas", self.listar_empresas),
+            ("POST", r"/empresas", self.crear_empresa),
+            ("PUT", r"/empresas/(\d+)", self.renombrar_empresa),
+            ("DELETE", r"/empresas/(\d+)", self.eliminar_empresa),
+            ("GET", r"/empresas/(\d+)/productos", self.listar_productos),
+            ("POST", r"/empresas/(\d+)/productos", self.crear_producto),
+            ("GET", r"/empresas/(\d+)/productos/(\d+)", self.ver_producto),
+            ("GET", r"/empresas/(\d+)/movimientos", self.listar_movimientos),
+            ("POST", r"/empresas/(\d+)/transacciones", self.registrar_transaccion),
+            ("GET", r"/empresas/(\d+)/resumen", self.resumen),
+            ("GET", r"/empresas/(\d+)/sii", self.reporte_sii),
+            ("GET", r"/consolidado", self.consolidado),
+        ]
+        self.rutas = [(metodo, re.compile(patron + "$"), funcion) for metodo, patron, funcion in self.rutas]
+
+    # --- Ciclo de vida ---
+    async def iniciar(self, host="127.0.0.1", puerto=8080):
+        self._cola = asyncio.Queue()
+        self._tarea_escritora = asyncio.create_task(self._escritor())
+        self._servidor = await asyncio.start_server(self._atender, host, puerto)
+        return self._servidor.sockets[0].getsockname()[:2]
+
+    async def detener(self):
+        self._servidor.close()
+        await self._servidor.wait_closed()
+        self._tarea_escritora.cancel()
+        self._pool_lectura.shutdown()
+        self._hilo_escritor.shutdown()
+
+    # --- Lecturas y escrituras ---
+    async def _leer(self, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool_lectura, funcion, *args)
+
+    async def _escribir(self, funcion, *args):
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((funcion, args, futuro))
+        return await futuro
+
+    async def _escritor(self):
+        """Única tarea que escribe: atiende la cola en orden y agrupa las transacciones seguidas"""
+        loop = asyncio.get_running_loop()
+        while True:
+            trabajos = [await self._cola.get()]
+            while not self._cola.empty() and len(trabajos) < MAX_AGRUPADAS:
+                trabajos.append(self._cola.get_nowait())
+
+            # Transacciones consecutivas van en un solo lote; el resto se ejecuta tal cual
+            for es_transaccion, grupo in itertools.groupby(trabajos, key=lambda t: t[0] is None):
+                grupo = list(grupo)
+                if es_transaccion:
+                    tamano = len(grupo) if self.agrupar else 1
+                    for i in range(0, len(grupo), tamano):
+                        await self._confirmar_transacciones(loop, grupo[i:i + tamano])
+                    continue
+                for funcion, args, futuro in grupo:
+                    try:
+                        resultado = await loop.run_in_executor(self._hilo_escritor, funcion, *args)
+                    except Exception as e:
+                        _resolver(futuro, error=e)
+                    else:
+                        _resolver(futuro, resultado)
+
+    async def _confirmar_transacciones(self, loop, grupo):
+        # Un item inválido revierte el lote completo: se responde su error y se reintenta el resto.
+        # Las ventas sin stock se reintentan de a una al final, con el resto ya confirmado
+        sin_stock = []
+        while grupo:
+            try:
+                exito, resultados = await loop.run_in_executor(
+                    self._hilo_escritor, self.db.registrar_transacciones_lote, [args for _, args, _ in grupo])
+            except Exception as e:
+                for _, _, futuro in grupo:
+                    _resolver(futuro, error=e)
+                break
+            if exito:
+                for (_, _, futuro), (_, monto) in zip(grupo, resultados):
+                    _resolver(futuro, monto)
+                break
+            validos = []
+            for trabajo, (ok, mensaje) in zip(grupo, resultados):
+                if ok:
+                    validos.append(trabajo)
+                elif mensaje.startswith("stock insuficiente") and len(grupo) > 1:
+                    sin_stock.append(trabajo)
+                else:
+                    # "Lote revertido" = falló la escritura misma, no la validación del item
+                    if mensaje.startswith("Lote revertido"):
+                        estado = 500
+                    elif mensaje.startswith("stock insuficiente"):
+                        estado = 409
+                    else:
+                        estado = 400
+                    _resolver(trabajo[2], error=ErrorHTTP(estado, mensaje))
+            grupo = validos
+        for trabajo in sin_stock:
+            await self._confirmar_transacciones(loop, [trabajo])
+
+    # --- Protocolo HTTP/1.1 (keep-alive, cuerpos JSON) ---
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                metodo, destino, version = linea.decode("latin-1").split()
+                cabeceras = {}
+                while True:
+                    cabecera = await lector.readline()
+                    if cabecera in (b"\r\n", b"\n", b""):
+                        break
+                    nombre, _, valor = cabecera.decode("latin-1").partition(":")
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+
+                largo = int(cabeceras.get("content-length", 0))
+                if largo > MAX_CUERPO:
+                    self._responder(escritor, 413, {"error": "Cuerpo demasiado grande"}, mantener=False)
+                    await escritor.drain()
+                    break
+                cuerpo = await lector.readexactly(largo) if largo else b""
+                estado, datos = await self._despachar(metodo, destino, cuerpo)
+                mantener = version == "HTTP/1.1" and cabeceras.get("connection", "").lower() != "close"
+                self._responder(escritor, estado, datos, mantener)
+                await escritor.drain()
+                if not mantener:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            escritor.close()
+
+    def _responder(self, escritor, estado, datos, mantener):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        escritor.write(
+            f"HTTP/1.1 {estado} {ESTADOS.get(estado, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode("latin-1") + cuerpo
+        )
+
+    async def _despachar(self, metodo, destino, cuerpo):
+        partes = urlsplit(destino)
+        consulta = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        ruta = partes.path.rstrip("/") or "/"
+        metodo_valido = False
+        for metodo_ruta, patron, funcion in self.rutas:
+            coincidencia = patron.match(ruta)
+            if not coincidencia:
+                continue
+            if metodo_ruta != metodo:
+                metodo_valido = True
+                continue
+            try:
+                datos = json.loads(cuerpo) if cuerpo else {}
+                if not isinstance(datos, dict):
+                    raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON")
+                return await funcion(*map(int, coincidencia.groups()), consulta=consulta, datos=datos)
+            except ErrorHTTP as e:
+                return e.estado, {"error": e.mensaje}
+            except json.JSONDecodeError as e:
+                return 400, {"error": f"JSON inválido: {e.msg}"}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                print(f"Error en {metodo} {ruta}: {e!r}", file=sys.stderr)
+                return 500, {"error": "Error interno"}
+        if metodo_valido:
+            return 405, {"error": f"Método {metodo} no permitido en {ruta}"}
+        return 404, {"error": f"No existe {ruta}"}
+
+    # --- Empresas ---
+    async def salud(self, consulta, datos):
+        return 200, {"ok": True, "escrituras_en_cola": self._cola.qsize()}
+
+    async def metricas(self, consulta, datos):
+        """Instantánea de la instrumentación (servidor iniciado con --metricas)"""
+        if self.instrumentacion is None:
+            raise ErrorHTTP(404, "Instrumentación desactivada (use --metricas)")
+        return 200, self.instrumentacion.instantanea()
+
+    async def listar_empresas(self, consulta, datos):
+        empresas = await self._leer(self.db.obtener_empresas)
+        return 200, [_fila(COLUMNAS_EMPRESA, e) for e in empresas]
+
+    async def crear_empresa(self, consulta, datos):
+        nombre = _texto(datos, "nombre")
+        empresa_id = await self._escribir(self.db.agregar_empresa, nombre)
+        return 201, {"id": empresa_id, "nombre": nombre}
+
+    async def renombrar_empresa(self, empresa_id, consulta, datos):
+        nombre = _texto(datos, "nombre")
+        await self._escribir(self.db.actualizar_nombre_empresa, empresa_id, nombre)
+        return 200, {"id": empresa_id, "nombre": nombre}
+
+    async def eliminar_empresa(self, empresa_id, consulta, datos):
+        await self._escribir(self.db.eliminar_empresa, empresa_id)
+        return 200, {"id": empresa_id, "activa": 0}
+
+    # --- Productos ---
+    async def listar_productos(self, empresa_id, consulta, datos):
+        """?q= busca por nombre; sin q pagina por id con ?despues_de= y ?limite="""
+        limite = min(_entero(consulta.get("limite", 50), "limite", minimo=1), 500)
+        if "q" in consulta:
+            productos = await self._leer(self.db.buscar_productos, empresa_id, consulta["q"], limite)
+        else:
+            despues_de = _entero(consulta.get("despues_de", 0), "despues_de")
+            productos = await self._leer(self.db.obtener_productos_pagina, empresa_id, despues_de, limite)
+        return 200, [_fila(COLUMNAS_PRODUCTO, p) for p in productos]
+
+    async def ver_producto(self, empresa_id, prod_id, consulta, datos):
+        producto = await self._leer(self.db.obtener_producto, empresa_id, prod_id)
+        if producto is None:
+            raise ErrorHTTP(404, f"Producto {prod_id} no existe en la empresa {empresa_id}")
+        return 200, _fila(COLUMNAS_PRODUCTO, producto)
+
+    async def crear_producto(self, empresa_id, consulta, datos):
+        nombre = _texto(datos, "nombre")
+        precio = _entero(datos.get("precio_venta"), "precio_venta", minimo=0)
+        costo = _entero(datos.get("costo_unitario", 0), "costo_unitario", minimo=0)
+        prod_id = await self._escribir(self.db.agregar_producto, empresa_id, nombre, precio, costo)
+        return 201, {"id": prod_id, "empresa_id": empresa_id, "nombre": nombre, "stock": 0,
+                     "precio_venta": precio, "costo_unitario": costo}
+
+    # --- Movimientos ---
+    async def registrar_transaccion(self, empresa_id, consulta, datos):
+        """Venta o compra; sin precio_unitario usa el precio (venta) o costo (compra) del producto"""
+        tipo = datos.get("tipo")
+        if tipo not in ("venta", "compra"):
+            raise ErrorHTTP(400, "'tipo' debe ser 'venta' o 'compra'")
+        prod_id = _entero(datos.get("producto_id"), "producto_id")
+        cantidad = _entero(datos.get("cantidad"), "cantidad", minimo=1)
+        precio = datos.get("precio_unitario")
+        if precio is None:
+            precio = await self._leer(self.db.obtener_precio, empresa_id, prod_id, tipo)
+            if precio is None:
+                raise ErrorHTTP(404, f"Producto {prod_id} no existe en la empresa {empresa_id}")
+        precio = _entero(precio, "precio_unitario", minimo=0)
+        es_formal = _booleano(datos.get("es_formal", True), "es_formal")
+        detalle = datos.get("detalle") or f"{tipo.capitalize()} de mercadería"
+
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((None, (empresa_id, tipo, es_formal, prod_id, cantidad, precio, str(detalle)), futuro))
+        monto = await futuro
+        return 201, {"tipo": tipo, "producto_id": prod_id, "cantidad": cantidad, "monto_total": monto}
+
+    async def listar_movimientos(self, empresa_id, consulta, datos):
+        """Del más nuevo al más antiguo; la página siguiente se pide con ?antes_de=<siguiente>"""
+        limite = min(_entero(consulta.get("limite", 100), "limite", minimo=1), MAX_MOVIMIENTOS)
+        antes_de = None
+        if consulta.get("antes_de"):
+            fecha, _, mov_id = consulta["antes_de"].rpartition(",")
+            if not fecha:
+                raise ErrorHTTP(400, "'antes_de' debe ser 'fecha,id'")
+            antes_de = (fecha, _entero(mov_id, "antes_de"))
+
+        def leer():
+            return self.db.pagina_movimientos(empresa_id, antes_de, limite,
+                                              desde=consulta.get("desde"), hasta=consulta.get("hasta"))
+
+        filas = await self._leer(leer)
+        siguiente = f"{filas[-1][2]},{filas[-1][0]}" if len(filas) == limite else None
+        return 200, {"movimientos": [_fila(COLUMNAS_MOVIMIENTO, m) for m in filas], "siguiente": siguiente}
+
+    # --- Reportes ---
+    async def resumen(self, empresa_id, consulta, datos):
+        ventas, compras = await self._leer(self.db.obtener_resumen, empresa_id)
+        return 200, {"ventas": ventas, "compras": compras, "utilidad": ventas - compras}
+
+    async def reporte_sii(self, empresa_id, consulta, datos):
+        periodo = consulta.get("periodo")
+        ventas, compras, debito, credito = await self._leer(self.db.reporte_sii, empresa_id, periodo)
+        return 200, {"periodo": periodo, "ventas_bruto": ventas, "compras_bruto": compras,
+                     "iva_debito": debito, "iva_credito": credito, "iva_a_pagar": debito - credito}
+
+    async def consolidado(self, consulta, datos):
+        periodo = consulta.get("periodo")
+        filas, total = await self._leer(self.db.reporte_consolidado, periodo)
+        total = _fila(COLUMNAS_CONSOLIDADO[2:], total[2:])
+        return 200, {"periodo": periodo, "empresas": [_fila(COLUMNAS_CONSOLIDADO, f) for f in filas], "total": total}
+
+
+async def servir(db, host, puerto, lectores, agrupar, instrumentacion=None):
+    servidor = Servidor(db, lectores=lectores, agrupar=agrupar, instrumentacion=instrumentacion)
+    host, puerto = await servidor.iniciar(host, puerto)
+    print(f"🌐 JEmpressa escuchando en http://{host}:{puerto} (base: {db.db_path})", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await servidor.detener()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API REST de JEmpressa para varias cajas/terminales")
+    parser.add_argument("--db", help="Ruta de la base de datos (por defecto ~/erp_empresas.db)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--lectores", type=int, default=4, help="Conexiones e hilos de lectura")
+    parser.add_argument("--sin-agrupar", action="store_true", help="Confirmar cada venta en su propia transacción")
+    parser.add_argument("--sin-stock-negativo", action="store_true", help="Rechazar (409) ventas sin stock suficiente")
+    parser.add_argument("--metricas", help="Instrumentar y guardar métricas cada 10 s en esta ruta (.json o .prom); "
+                                           "también quedan en GET /metricas")
+    parser.add_argument("--umbral-lenta", type=float, default=50, help="ms desde los que una sentencia se registra con su plan")
+    parser.add_argument("--respaldos", help="Carpeta donde respaldar la base una vez al día, sin detener el servidor")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db, lectores=args.lectores, stock_negativo=not args.sin_stock_negativo)
+    instrumentacion = None
+    if args.metricas:
+        instrumentacion = Instrumentacion(umbral_lenta_ms=args.umbral_lenta)
+        instrumentacion.instrumentar_db(db)
+        instrumentacion.guardar_cada(args.metricas)
+    db.completar_en_segundo_plano()
+    if args.respaldos:
+        respaldo.respaldar_cada(db, args.respaldos)
+    try:
+        asyncio.run(servir(db, args.host, args.puerto, args.lectores, not args.sin_agrupar, instrumentacion))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+        if instrumentacion:
+            instrumentacion.guardar(args.metricas)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import json
+import time
+import zlib
+
+from database import Database
+
+# --- Sincronización entre Equipos (offline primero) ---
+# Cada equipo anota sus cambios en la tabla 'cambios' (triggers sobre productos y
+# movimientos). Al reconectarse envía solo lo posterior a su marca de agua, en
+# paquetes JSON comprimidos, y recibe lo que el central juntó de los demás equipos.
+# El stock de los productos tocados se reconstruye desde los movimientos unidos.
+
+TAMANO_LOTE = 2000
+
+
+def empaquetar(paquete):
+    return zlib.compress(json.dumps(paquete, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def desempaquetar(datos):
+    return json.loads(zlib.decompress(datos).decode("utf-8"))
+
+
+class Central:
+    """Sustituto del servidor central: otra base (archivo o en proceso) que recibe y entrega paquetes"""
+
+    def __init__(self, db):
+        self.db = Database(db) if isinstance(db, str) else db
+
+    @property
+    def nodo(self):
+        return self.db.nodo
+
+    def recibir(self, datos):
+        paquete = desempaquetar(datos)
+        self.db.aplicar_cambios(paquete)
+        return paquete["hasta"]
+
+    def entregar(self, nodo_destino, desde, tamano=TAMANO_LOTE):
+        return empaquetar(self.db.cambios_desde(desde, tamano, excluir=nodo_destino))
+
+
+class ResultadoSincronizacion:
+    def __init__(self):
+        self.enviados = 0  # Filas (productos + movimientos)
+        self.recibidos = 0
+        self.paquetes = 0
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.bytes_sin_comprimir = 0
+        self.stock_corregido = 0
+        self.segundos = 0.0
+
+    @property
+    def compresion(self):
+        total = self.bytes_enviados + self.bytes_recibidos
+        return self.bytes_sin_comprimir / total if total else 0.0
+
+
+def _filas(paquete):
+    return len(paquete["productos"]) + len(paquete["movimientos"])
+
+
+def sincronizar(db, central, tamano=TAMANO_LOTE, progreso=None):
+    """Envía los cambios locales pendientes al central y aplica los que faltan de los otros equipos"""
+    resultado = ResultadoSincronizacion()
+    inicio = time.perf_counter()
+    enviado, recibido = db.marcas_sincronizacion(central.nodo)
+
+    # 1. Subir: la marca solo avanza cuando el central confirmó el paquete
+    while True:
+        paquete = db.cambios_desde(enviado, tamano, excluir=central.nodo)
+        if paquete["hasta"] == enviado:
+            break
+        datos = empaquetar(paquete)
+        enviado = central.recibir(datos)
+        db.guardar_marca_envio(central.nodo, enviado)
+        resultado.enviados += _filas(paquete)
+        resultado.paquetes += 1
+        resultado.bytes_enviados += len(datos)
+        resultado.bytes_sin_comprimir += len(json.dumps(paquete, ensure_ascii=False).encode("utf-8"))
+        if progreso:
+            progreso(resultado)
+
+    # 2. Bajar: aplicar_cambios guarda la marca recibida en la misma transacción
+    afectados = set()
+    while True:
+        datos = central.entregar(db.nodo, recibido, tamano)
+        paquete = desempaquetar(datos)
+        if paquete["hasta"] == recibido:
+            break
+        productos, movimientos, ids = db.aplicar_cambios(paquete)
+        afectados |= ids
+        recibido = paquete["hasta"]
+        resultado.recibidos += productos + movimientos
+        resultado.paquetes += 1
+        resultado.bytes_recibidos += len(datos)
+        resultado.bytes_sin_comprimir += len(json.dumps(paquete, ensure_ascii=False).encode("utf-8"))
+        if progreso:
+            progreso(resultado)
+        if not paquete["hay_mas"]:
+            break
+
+    # 3. Stock derivado de los movimientos unidos, y registro ya enviado fuera
+    if afectados:
+        resultado.stock_corregido = db.reconstruir_stock(afectados)
+    db.podar_cambios()
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado